@@ -0,0 +1,441 @@
+"""Benchmark suite of the build and load paths over synthetic epigenomes.
+
+The suite writes synthetic bigWig files, region beds, labels and the
+epigenomes metadata listing them, then builds the dataset from them and
+loads it back, measuring the time, the throughput and the peak memory of
+each step, together with the time spent importing the package. The
+measurements are written as a JSON baseline, and compared to a previous
+baseline to detect regressions, without any network access.
+
+Usage
+-------------------------
+    python benchmarks/benchmark.py --regions 20000 --output baseline.json
+    python benchmarks/benchmark.py --regions 20000 --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from multiprocessing import Process, Queue
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+import pandas as pd
+from epigenomic_dataset import load_all_tasks, load_epigenomes
+from epigenomic_dataset.bigwig import write_bigwig
+from epigenomic_dataset.concatenate import concatenate
+from epigenomic_dataset.extract import extract
+from epigenomic_dataset.mine import mine
+from epigenomic_dataset.telemetry import measure_stage
+from epigenomic_dataset.utils import normalize_epigenomic_data
+
+DATASET = "synthetic"
+ASSEMBLY = "hg38"
+REGIONS = ("promoters", "enhancers")
+CHROMOSOMES = ("chr1", "chr2", "chrX")
+
+
+def create_regions(regions_number: int, window_size: int, seed: int) -> pd.DataFrame:
+    """Return non overlapping regions sorted by position."""
+    random_state = np.random.RandomState(seed)
+    # Every region gets its own slot, twice the window size wide.
+    slots = random_state.choice(regions_number*4, regions_number, replace=False)
+    regions = pd.DataFrame({
+        "chrom": np.array(CHROMOSOMES)[slots % len(CHROMOSOMES)],
+        "chromStart": (slots // len(CHROMOSOMES))*window_size*2,
+        "strand": random_state.choice(["+", "-"], regions_number)
+    })
+    regions["chromEnd"] = regions.chromStart + window_size
+    return regions.sort_values(["chrom", "chromStart"])[
+        ["chrom", "chromStart", "chromEnd", "strand"]
+    ].reset_index(drop=True)
+
+
+def create_bigwig(path: str, regions: pd.DataFrame, seed: int, step: int = 8):
+    """Write a bigWig with values in steps of given size over the given regions."""
+    random_state = np.random.RandomState(seed)
+    intervals = {}
+    for chrom, group in regions.groupby("chrom"):
+        starts = (
+            group.chromStart.values[:, None] +
+            np.arange(0, group.chromEnd.values[0] - group.chromStart.values[0], step)
+        ).ravel()
+        # Some bases have no value, as in the real tracks.
+        starts = starts[random_state.uniform(size=starts.size) > 0.05]
+        intervals[chrom] = (
+            starts,
+            starts + step,
+            random_state.exponential(2, starts.size)
+        )
+    write_bigwig(
+        path,
+        {
+            chrom: int(regions.chromEnd.max()) + 10**4
+            for chrom in CHROMOSOMES
+        },
+        intervals
+    )
+
+
+def create_benchmark_data(
+    root: str,
+    regions_number: int,
+    window_size: int,
+    replicates: int,
+    targets: int,
+    cell_lines: List[str]
+) -> Dict:
+    """Write the synthetic epigenomes, beds, labels and metadata in given root.
+
+    Parameters
+    -------------------------
+    root: str,
+        Directory where to write the benchmark data.
+    regions_number: int,
+        Number of regions of each region set.
+    window_size: int,
+        Size of the regions.
+    replicates: int,
+        Number of replicates of each target.
+    targets: int,
+        Number of targets of each cell line.
+    cell_lines: List[str],
+        Cell lines of the epigenomes.
+
+    Returns
+    -------------------------
+    Dictionary with the arguments of the build steps.
+    """
+    epigenomes_path = os.path.join(root, "epigenomes")
+    os.makedirs(epigenomes_path, exist_ok=True)
+    directory = os.path.join(root, DATASET, ASSEMBLY, str(window_size))
+    beds, all_regions = [], []
+    for seed, region in enumerate(REGIONS):
+        regions = create_regions(regions_number, window_size, seed)
+        all_regions.append(regions)
+        os.makedirs(os.path.join(directory, region), exist_ok=True)
+        bed_path = os.path.join(root, "{}.bed".format(region))
+        regions.assign(name=".", score=0)[
+            ["chrom", "chromStart", "chromEnd", "name", "score", "strand"]
+        ].to_csv(bed_path, sep="\t", header=False, index=False)
+        beds.append((bed_path, os.path.join(directory, region)))
+        labels = regions.copy()
+        random_state = np.random.RandomState(seed)
+        for cell_line in cell_lines:
+            tpm = random_state.exponential(2, len(regions))
+            tpm[random_state.uniform(size=len(regions)) < 0.3] = 0
+            labels[cell_line.replace("-", "").upper()] = tpm
+        labels.to_csv(
+            os.path.join(directory, "{}.bed.xz".format(region)),
+            sep="\t",
+            index=False
+        )
+    regions = pd.concat(all_regions)
+    metadata = []
+    for cell_line in cell_lines:
+        for target in range(targets):
+            for replicate in range(replicates):
+                accession = "SYN{}T{}R{}".format(cell_line, target, replicate)
+                path = os.path.join(epigenomes_path, "{}.bigWig".format(accession))
+                create_bigwig(path, regions, len(metadata))
+                metadata.append({
+                    "target": "TARGET{}".format(target),
+                    "cell_line": cell_line,
+                    "accession": accession,
+                    "assay_term_name": "ChIP-seq",
+                    "file_format": "bigWig",
+                    "file_size": os.path.getsize(path),
+                    # The bigWigs are already complete, so they are never downloaded.
+                    "url": "file://{}".format(path)
+                })
+    metadata_path = os.path.join(root, "metadata.csv")
+    pd.DataFrame(metadata).to_csv(metadata_path, index=False)
+    return {
+        "bed_path": beds,
+        "cell_lines": list(cell_lines),
+        "epigenomes_path": epigenomes_path,
+        "metadata_path": metadata_path,
+        "window_size": window_size
+    }
+
+
+def benchmark_extract(telemetry: List[Dict], data: Dict, workers: int):
+    extract(
+        data["bed_path"], data["cell_lines"], ASSEMBLY,
+        epigenomes_path=data["epigenomes_path"],
+        workers=workers,
+        telemetry=telemetry,
+        metadata_path=data["metadata_path"]
+    )
+
+
+def benchmark_mine(telemetry: List[Dict], data: Dict, statistics: Dict[str, bool], workers: int):
+    for _, targets_path in data["bed_path"]:
+        mine(
+            targets_path, statistics, data["cell_lines"], ASSEMBLY,
+            workers=workers,
+            telemetry=telemetry,
+            metadata_path=data["metadata_path"]
+        )
+
+
+def benchmark_concatenate(telemetry: List[Dict], data: Dict, workers: int):
+    for _, targets_path in data["bed_path"]:
+        concatenate(targets_path, data["cell_lines"], workers, telemetry=telemetry)
+
+
+def benchmark_load_epigenomes(telemetry: List[Dict], cell_line: str, window_size: int, root: str):
+    return load_epigenomes(
+        cell_line=cell_line, dataset=DATASET, window_size=window_size,
+        root=root, verbose=0
+    )
+
+
+def benchmark_load_all_tasks(telemetry: List[Dict], cell_line: str, window_size: int, root: str):
+    return [
+        task for task in load_all_tasks(
+            cell_line=cell_line, dataset=DATASET, window_size=window_size,
+            root=root, verbose=0
+        )
+    ]
+
+
+def benchmark_normalize_epigenomic_data(telemetry: List[Dict], X: np.ndarray):
+    return normalize_epigenomic_data(X)
+
+
+def load_epigenomic_values(cell_line: str, window_size: int, root: str) -> np.ndarray:
+    return benchmark_load_epigenomes([], cell_line, window_size, root)[0].values
+
+
+def benchmark_import(telemetry: List[Dict], statement: str):
+    # The imports are timed in a new interpreter, so that no module is cached.
+    subprocess.run([sys.executable, "-c", statement], check=True)
+
+
+def run_benchmark(
+    queue: Queue,
+    name: str,
+    function: Callable,
+    arguments: Dict,
+    regions: int = None,
+    setup: Tuple[Callable, Dict] = None
+):
+    inputs = [] if setup is None else [setup[0](**setup[1])]
+    with measure_stage([], name) as record:
+        function(record["tasks"], *inputs, **arguments)
+        if regions is not None:
+            record["tasks"].append({"regions": regions})
+    del record["tasks"]
+    queue.put(record)
+
+
+def measure(
+    name: str,
+    function: Callable,
+    arguments: Dict = None,
+    regions: int = None,
+    setup: Tuple[Callable, Dict] = None
+) -> Dict:
+    """Return the measurements of the given benchmark, run in a new process.
+
+    Each benchmark runs in its own process, so that its peak
+    memory is not affected by the benchmarks run before it.
+    The functions are sent to the process by reference, so they
+    must be defined at module level, as the spawned processes of
+    macOS and Windows cannot receive lambdas or closures.
+
+    Parameters
+    -------------------------
+    name: str,
+        Name of the benchmark.
+    function: Callable,
+        Function running the benchmark, called with the list
+        where to append the measurements of its tasks and
+        the given arguments.
+    arguments: Dict = None,
+        Keyword arguments of the function.
+    regions: int = None,
+        Number of regions processed by the benchmark, when
+        its tasks do not report the regions they processed.
+    setup: Tuple[Callable, Dict] = None,
+        Function preparing the input of the benchmark, with its keyword
+        arguments, whose time is not measured. Its result is passed to
+        the benchmark as second argument. Its memory is still included
+        in the peak memory.
+
+    Returns
+    -------------------------
+    Dictionary with the measurements of the benchmark.
+    """
+    queue = Queue()
+    process = Process(
+        target=run_benchmark,
+        args=(queue, name, function, arguments or {}, regions, setup)
+    )
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError("The benchmark {} failed.".format(name))
+    return queue.get()
+
+
+def run_benchmarks(
+    root: str,
+    regions_number: int = 10000,
+    window_size: int = 256,
+    replicates: int = 2,
+    targets: int = 4,
+    cell_lines: List[str] = ("K562", "HepG2"),
+    workers: int = 2
+) -> Dict:
+    """Return the measurements of the build and load paths on synthetic data.
+
+    Parameters
+    -------------------------
+    root: str,
+        Directory where to write the benchmark data.
+    regions_number: int = 10000,
+        Number of regions of each region set.
+    window_size: int = 256,
+        Size of the regions.
+    replicates: int = 2,
+        Number of replicates of each target.
+    targets: int = 4,
+        Number of targets of each cell line.
+    cell_lines: List[str] = ("K562", "HepG2"),
+        Cell lines of the epigenomes.
+    workers: int = 2,
+        Number of workers of the build steps.
+
+    Returns
+    -------------------------
+    Dictionary with the configuration and the measurements of each benchmark.
+    """
+    data = create_benchmark_data(
+        root, regions_number, window_size, replicates, targets, cell_lines
+    )
+    statistics = {"max": True, "min": False, "mean": True, "median": True, "var": False}
+    loading = {"cell_line": cell_lines[0], "window_size": window_size, "root": root}
+    benchmarks = [
+        ("extract", benchmark_extract, {"data": data, "workers": workers}, None, None),
+        ("mine", benchmark_mine, {
+            "data": data, "statistics": statistics, "workers": workers
+        }, None, None),
+        ("concatenate", benchmark_concatenate, {"data": data, "workers": workers}, None, None),
+        ("load_epigenomes", benchmark_load_epigenomes, loading, regions_number, None),
+        ("load_all_tasks", benchmark_load_all_tasks, loading, regions_number*len(REGIONS), None),
+        ("normalize_epigenomic_data", benchmark_normalize_epigenomic_data, {},
+         regions_number, (load_epigenomic_values, loading)),
+        ("import_package", benchmark_import, {"statement": "import epigenomic_dataset"}, None, None),
+        ("import_loaders", benchmark_import, {
+            "statement": "from epigenomic_dataset import load_epigenomes, load_all_tasks"
+        }, None, None),
+    ]
+    return {
+        "configuration": {
+            "regions": regions_number,
+            "window_size": window_size,
+            "replicates": replicates,
+            "targets": targets,
+            "cell_lines": list(cell_lines),
+            "workers": workers,
+            "python": platform.python_version(),
+            "machine": platform.machine()
+        },
+        "benchmarks": {
+            name: measure(name, function, arguments, regions, setup)
+            for name, function, arguments, regions, setup in benchmarks
+        }
+    }
+
+
+def compare_to_baseline(results: Dict, baseline: Dict, tolerance: float = 0.2) -> List[str]:
+    """Return the regressions of the given results with respect to the baseline.
+
+    Parameters
+    -------------------------
+    results: Dict,
+        The measurements of the benchmarks.
+    baseline: Dict,
+        The measurements of the benchmarks to compare with.
+    tolerance: float = 0.2,
+        Fraction by which the throughput may decrease, or
+        the peak memory may increase, before being a regression.
+
+    Returns
+    -------------------------
+    List with a description of each regression.
+    """
+    if results["configuration"] != baseline["configuration"]:
+        return ["The configuration differs from the one of the baseline."]
+    regressions = []
+    for name, expected in baseline["benchmarks"].items():
+        measured = results["benchmarks"].get(name)
+        if measured is None:
+            regressions.append("The benchmark {} is missing.".format(name))
+            continue
+        if expected["regions_per_second"] == 0:
+            # The benchmarks not processing regions, such as the imports, are timed.
+            if measured["wall_time"] > expected["wall_time"]*(1 + tolerance):
+                regressions.append("{}: time rose from {:.2f} to {:.2f} seconds.".format(
+                    name, expected["wall_time"], measured["wall_time"]
+                ))
+        elif measured["regions_per_second"] < expected["regions_per_second"]*(1 - tolerance):
+            regressions.append("{}: throughput fell from {:.0f} to {:.0f} regions/s.".format(
+                name, expected["regions_per_second"], measured["regions_per_second"]
+            ))
+        if measured["peak_rss"] > expected["peak_rss"]*(1 + tolerance):
+            regressions.append("{}: peak RSS rose from {:.1f} to {:.1f} MB.".format(
+                name, expected["peak_rss"]/2**20, measured["peak_rss"]/2**20
+            ))
+    return regressions
+
+
+def main(arguments: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--regions", type=int, default=10000)
+    parser.add_argument("--window-size", type=int, default=256)
+    parser.add_argument("--replicates", type=int, default=2)
+    parser.add_argument("--targets", type=int, default=4)
+    parser.add_argument("--cell-lines", nargs="+", default=["K562", "HepG2"])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--root", default=None,
+                        help="Where to write the data, by default a temporary directory.")
+    parser.add_argument("--output", default=None,
+                        help="Where to write the measurements as a JSON baseline.")
+    parser.add_argument("--baseline", default=None,
+                        help="JSON baseline to compare the measurements with.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    arguments = parser.parse_args(arguments)
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = run_benchmarks(
+            arguments.root or directory,
+            regions_number=arguments.regions,
+            window_size=arguments.window_size,
+            replicates=arguments.replicates,
+            targets=arguments.targets,
+            cell_lines=arguments.cell_lines,
+            workers=arguments.workers
+        )
+    for name, record in results["benchmarks"].items():
+        print("{:<28}{:>10.2f}s{:>14.0f} regions/s{:>10.1f} MB".format(
+            name, record["wall_time"], record["regions_per_second"], record["peak_rss"]/2**20
+        ))
+    if arguments.output is not None:
+        with open(arguments.output, "w") as f:
+            json.dump(results, f, indent=4)
+    if arguments.baseline is not None:
+        with open(arguments.baseline, "r") as f:
+            regressions = compare_to_baseline(results, json.load(f), arguments.tolerance)
+        for regression in regressions:
+            print(regression)
+        return int(bool(regressions))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
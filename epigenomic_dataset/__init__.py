@@ -1,20 +1,29 @@
 """Module offering methods to retrieve data and tasks for CRR predictions."""
-from .build import build
-from .load_epigenomes import load_epigenomes
-from .load_tasks import (
-    active_enhancers_vs_active_promoters,
-    active_enhancers_vs_inactive_enhancers,
-    inactive_enhancers_vs_inactive_promoters,
-    active_promoters_vs_inactive_promoters,
-    load_all_tasks
-)
-from .logging import logger
+from .lazy import attach
+
+# The attributes are imported from their submodules on first access,
+# so that the loaders do not import the dependencies of the build.
+__getattr__, __dir__ = attach(__name__, {
+    "build": ".build",
+    "load_epigenomes": ".load_epigenomes",
+    "iter_epigenomes": ".iter_epigenomes",
+    "logger": ".logging",
+    "active_enhancers_vs_active_promoters": ".load_tasks",
+    "active_enhancers_vs_inactive_enhancers": ".load_tasks",
+    "inactive_enhancers_vs_inactive_promoters": ".load_tasks",
+    "active_promoters_vs_inactive_promoters": ".load_tasks",
+    "load_all_tasks": ".load_tasks",
+    "share_epigenomes": ".shared",
+    "SharedEpigenomes": ".shared",
+    "ThresholdSweep": ".sweep",
+})
 
 __all__ = [
-    "build", "load_epigenomes", "logger",
+    "build", "load_epigenomes", "iter_epigenomes", "logger",
     "active_enhancers_vs_active_promoters",
     "active_enhancers_vs_inactive_enhancers",
     "inactive_enhancers_vs_inactive_promoters",
     "active_promoters_vs_inactive_promoters",
-    "load_all_tasks"
+    "load_all_tasks", "share_epigenomes", "SharedEpigenomes",
+    "ThresholdSweep"
 ]
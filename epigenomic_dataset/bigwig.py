@@ -0,0 +1,437 @@
+"""Submodule providing an in-process NumPy reader for bigWig files.
+
+The reader walks the chromosome B+ tree and the R-tree index of the file
+and decodes only the data blocks overlapping the requested regions, so
+that the per-base values of the regions can be summarized in memory.
+A minimal writer is also provided to create synthetic bigWig files.
+"""
+import struct
+import zlib
+from typing import Dict, List, Tuple
+import numpy as np
+
+BIGWIG_MAGIC = 0x888FFC26
+CHROM_TREE_MAGIC = 0x78CA8C91
+R_TREE_MAGIC = 0x2468ACE0
+
+BED_GRAPH_SECTION = 1
+VARIABLE_STEP_SECTION = 2
+FIXED_STEP_SECTION = 3
+
+
+class BigWig:
+    """Reader of the full resolution data of a bigWig file."""
+
+    def __init__(self, path: str):
+        """Create new bigWig reader.
+
+        Parameters
+        --------------------------
+        path: str,
+            Path of the bigWig file to read.
+
+        Raises
+        --------------------------
+        ValueError,
+            If the given file is not a bigWig file.
+        """
+        self._path = path
+        self._file = open(path, "rb")
+        magic = self._file.read(4)
+        if struct.unpack("<I", magic)[0] == BIGWIG_MAGIC:
+            self._endian = "<"
+        elif struct.unpack(">I", magic)[0] == BIGWIG_MAGIC:
+            self._endian = ">"
+        else:
+            self._file.close()
+            raise ValueError(
+                "The file at {} is not a bigWig file.".format(path)
+            )
+        (
+            _, _, self._chrom_tree_offset, self._data_offset,
+            self._index_offset, _, _, _, _, self._uncompress_buffer_size, _
+        ) = self._unpack("HHQQQHHQQIQ", self._read(4, 60))
+        self._chromosomes = self._read_chromosomes()
+        self._leaves = None
+
+    def _read(self, offset: int, size: int) -> bytes:
+        self._file.seek(offset)
+        return self._file.read(size)
+
+    def _unpack(self, fmt: str, buffer: bytes, offset: int = 0) -> Tuple:
+        return struct.unpack_from(self._endian + fmt, buffer, offset)
+
+    def _read_chromosomes(self) -> Dict[str, Tuple[int, int]]:
+        """Return mapping from chromosome name to its id and size."""
+        (
+            magic, _, key_size, _, _, _
+        ) = self._unpack("IIIIQQ", self._read(self._chrom_tree_offset, 32))
+        if magic != CHROM_TREE_MAGIC:
+            raise ValueError(
+                "The chromosome tree of {} is corrupted.".format(self._path)
+            )
+        chromosomes = {}
+        nodes = [self._chrom_tree_offset + 32]
+        while nodes:
+            offset = nodes.pop()
+            is_leaf, _, count = self._unpack("BBH", self._read(offset, 4))
+            item_size = key_size + 8
+            buffer = self._read(offset + 4, count*item_size)
+            for i in range(count):
+                key = buffer[i*item_size:i*item_size+key_size]
+                name = key.rstrip(b"\x00").decode("ascii")
+                if is_leaf:
+                    chromosomes[name] = self._unpack(
+                        "II", buffer, i*item_size + key_size
+                    )
+                else:
+                    nodes.append(self._unpack(
+                        "Q", buffer, i*item_size + key_size
+                    )[0])
+        return chromosomes
+
+    @property
+    def chromosomes(self) -> Dict[str, int]:
+        """Return mapping from chromosome names to their sizes."""
+        return {
+            name: size
+            for name, (_, size) in self._chromosomes.items()
+        }
+
+    def _read_leaves(self) -> np.ndarray:
+        """Return the leaves of the R-tree index sorted by position."""
+        magic = self._unpack("I", self._read(self._index_offset, 4))[0]
+        if magic != R_TREE_MAGIC:
+            raise ValueError(
+                "The R-tree index of {} is corrupted.".format(self._path)
+            )
+        leaf_dtype = np.dtype([
+            ("start_chrom", self._endian + "u4"),
+            ("start_base", self._endian + "u4"),
+            ("end_chrom", self._endian + "u4"),
+            ("end_base", self._endian + "u4"),
+            ("offset", self._endian + "u8"),
+            ("size", self._endian + "u8"),
+        ])
+        node_dtype = np.dtype([
+            ("start_chrom", self._endian + "u4"),
+            ("start_base", self._endian + "u4"),
+            ("end_chrom", self._endian + "u4"),
+            ("end_base", self._endian + "u4"),
+            ("offset", self._endian + "u8"),
+        ])
+        leaves = []
+        nodes = [self._index_offset + 48]
+        while nodes:
+            offset = nodes.pop()
+            is_leaf, _, count = self._unpack("BBH", self._read(offset, 4))
+            dtype = leaf_dtype if is_leaf else node_dtype
+            items = np.frombuffer(
+                self._read(offset + 4, count*dtype.itemsize),
+                dtype=dtype
+            )
+            if is_leaf:
+                leaves.append(items)
+            else:
+                nodes.extend(items["offset"].tolist())
+        if not leaves:
+            return np.zeros(0, dtype=leaf_dtype)
+        leaves = np.concatenate(leaves)
+        return leaves[np.lexsort((leaves["start_base"], leaves["start_chrom"]))]
+
+    def _chromosome_leaves(self, chrom_id: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Return offsets, sizes, starts and ends of blocks of given chromosome."""
+        if self._leaves is None:
+            self._leaves = self._read_leaves()
+        leaves = self._leaves[
+            (self._leaves["start_chrom"] <= chrom_id) &
+            (self._leaves["end_chrom"] >= chrom_id)
+        ]
+        starts = np.where(
+            leaves["start_chrom"] < chrom_id, 0, leaves["start_base"]
+        ).astype(np.int64)
+        ends = np.where(
+            leaves["end_chrom"] > chrom_id,
+            np.iinfo(np.int64).max,
+            leaves["end_base"]
+        ).astype(np.int64)
+        return leaves["offset"], leaves["size"], starts, ends
+
+    def _decode_block(self, offset: int, size: int, chrom_id: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return starts, ends and values of the intervals in given block."""
+        block = self._read(offset, size)
+        if self._uncompress_buffer_size > 0:
+            block = zlib.decompress(block)
+        starts, ends, values = [], [], []
+        position = 0
+        while position + 24 <= len(block):
+            (
+                section_chrom, section_start, _, step, span, section_type, _, count
+            ) = self._unpack("IIIIIBBH", block, position)
+            position += 24
+            if section_type == BED_GRAPH_SECTION:
+                items = np.frombuffer(block, dtype=np.dtype([
+                    ("start", self._endian + "u4"),
+                    ("end", self._endian + "u4"),
+                    ("value", self._endian + "f4"),
+                ]), count=count, offset=position)
+                section_starts = items["start"]
+                section_ends = items["end"]
+            elif section_type == VARIABLE_STEP_SECTION:
+                items = np.frombuffer(block, dtype=np.dtype([
+                    ("start", self._endian + "u4"),
+                    ("value", self._endian + "f4"),
+                ]), count=count, offset=position)
+                section_starts = items["start"]
+                section_ends = section_starts.astype(np.int64) + span
+            elif section_type == FIXED_STEP_SECTION:
+                items = np.frombuffer(block, dtype=np.dtype([
+                    ("value", self._endian + "f4"),
+                ]), count=count, offset=position)
+                section_starts = section_start + \
+                    step*np.arange(count, dtype=np.int64)
+                section_ends = section_starts + span
+            else:
+                raise ValueError(
+                    "Unknown section type {} in {}.".format(
+                        section_type, self._path)
+                )
+            position += items.nbytes
+            if section_chrom != chrom_id:
+                continue
+            starts.append(section_starts.astype(np.int64))
+            ends.append(section_ends.astype(np.int64))
+            values.append(items["value"].astype(np.float32))
+        if not starts:
+            return (
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.float32)
+            )
+        return np.concatenate(starts), np.concatenate(ends), np.concatenate(values)
+
+    def intervals(self, chrom: str, starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the intervals of given chromosome overlapping given regions.
+
+        Only the data blocks overlapping at least one of the regions
+        are read and decompressed.
+
+        Parameters
+        --------------------------
+        chrom: str,
+            Name of the chromosome.
+        starts: np.ndarray,
+            Start positions of the regions.
+        ends: np.ndarray,
+            End positions of the regions.
+
+        Returns
+        --------------------------
+        Tuple with sorted starts, ends and values of the intervals.
+        """
+        empty = (
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.float32)
+        )
+        if chrom not in self._chromosomes or len(starts) == 0:
+            return empty
+        chrom_id = self._chromosomes[chrom][0]
+        offsets, sizes, block_starts, block_ends = self._chromosome_leaves(
+            chrom_id)
+        # A block is needed when any region starting before the block end
+        # also ends after the block start.
+        order = np.argsort(starts, kind="stable")
+        sorted_starts = np.asarray(starts)[order]
+        running_ends = np.maximum.accumulate(np.asarray(ends)[order])
+        candidates = np.searchsorted(sorted_starts, block_ends, side="left")
+        needed = (candidates > 0) & (
+            running_ends[np.maximum(candidates - 1, 0)] > block_starts
+        )
+        decoded = [
+            self._decode_block(int(offset), int(size), chrom_id)
+            for offset, size in zip(offsets[needed], sizes[needed])
+        ]
+        if not decoded:
+            return empty
+        interval_starts, interval_ends, values = [
+            np.concatenate(arrays)
+            for arrays in zip(*decoded)
+        ]
+        order = np.argsort(interval_starts, kind="stable")
+        return interval_starts[order], interval_ends[order], values[order]
+
+    def values(self, chrom: str, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """Return the per-base values of given regions of a chromosome.
+
+        Parameters
+        --------------------------
+        chrom: str,
+            Name of the chromosome.
+        starts: np.ndarray,
+            Start positions of the regions.
+        ends: np.ndarray,
+            End positions of the regions.
+
+        Returns
+        --------------------------
+        Float32 matrix with a row per region and a column per base
+        of the widest region. Bases not covered by the file and the
+        padding of the narrower regions are NaN.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        width = int((ends - starts).max()) if len(starts) else 0
+        interval_starts, interval_ends, interval_values = self.intervals(
+            chrom, starts, ends
+        )
+        positions = starts[:, None] + np.arange(width, dtype=np.int64)
+        values = np.full(positions.shape, np.nan, dtype=np.float32)
+        if len(interval_starts) == 0:
+            return values
+        indices = np.searchsorted(interval_ends, positions, side="right")
+        covered = indices < len(interval_ends)
+        indices[~covered] = 0
+        covered &= interval_starts[indices] <= positions
+        covered &= positions < ends[:, None]
+        values[covered] = interval_values[indices[covered]]
+        return values
+
+    def close(self):
+        """Close the underlying file."""
+        self._file.close()
+
+    def __enter__(self) -> "BigWig":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _build_r_tree(leaves: List[Tuple[int, int]], bounds: List[Tuple[int, int, int, int]], block_size: int) -> List[List]:
+    """Return the levels of the R-tree index, starting from the root."""
+    levels = [[
+        (leaf, bound)
+        for leaf, bound in zip(leaves, bounds)
+    ]]
+    while len(levels) == 1 or len(levels[0]) > 1:
+        children = levels[0]
+        nodes = [
+            (group, (
+                group[0][1][0], group[0][1][1],
+                group[-1][1][2], group[-1][1][3]
+            ) if group else (0, 0, 0, 0))
+            for group in [
+                children[i:i+block_size]
+                for i in range(0, max(len(children), 1), block_size)
+            ]
+        ]
+        levels.insert(0, nodes)
+    return levels
+
+
+def write_bigwig(
+    path: str,
+    chromosomes: Dict[str, int],
+    intervals: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]],
+    items_per_block: int = 512,
+    block_size: int = 256
+):
+    """Write a bigWig file with bedGraph sections and no zoom levels.
+
+    Parameters
+    --------------------------
+    path: str,
+        Path where to write the bigWig file.
+    chromosomes: Dict[str, int],
+        Mapping from chromosome names to their sizes.
+    intervals: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]],
+        Mapping from chromosome names to the sorted and non-overlapping
+        starts, ends and values of their intervals.
+    items_per_block: int = 512,
+        Number of intervals to store in each data block.
+    block_size: int = 256,
+        Number of children of each node of the R-tree index.
+    """
+    names = sorted(chromosomes)
+    chrom_ids = {name: i for i, name in enumerate(names)}
+    key_size = max(len(name) for name in names)
+
+    chrom_tree = struct.pack(
+        "<IIIIQQ", CHROM_TREE_MAGIC, len(names), key_size, 8, len(names), 0
+    ) + struct.pack("<BBH", 1, 0, len(names)) + b"".join(
+        name.encode("ascii").ljust(key_size, b"\x00") +
+        struct.pack("<II", chrom_ids[name], chromosomes[name])
+        for name in names
+    )
+    chrom_tree_offset = 64
+    data_offset = chrom_tree_offset + len(chrom_tree)
+
+    blocks, bounds = [], []
+    max_block_size = 0
+    item_dtype = np.dtype([("start", "<u4"), ("end", "<u4"), ("value", "<f4")])
+    for name in sorted(intervals, key=chrom_ids.get):
+        starts, ends, values = intervals[name]
+        for i in range(0, len(starts), items_per_block):
+            items = np.zeros(len(starts[i:i+items_per_block]), dtype=item_dtype)
+            items["start"] = starts[i:i+items_per_block]
+            items["end"] = ends[i:i+items_per_block]
+            items["value"] = values[i:i+items_per_block]
+            block = struct.pack(
+                "<IIIIIBBH", chrom_ids[name], int(items["start"][0]),
+                int(items["end"][-1]), 0, 0, BED_GRAPH_SECTION, 0, len(items)
+            ) + items.tobytes()
+            max_block_size = max(max_block_size, len(block))
+            blocks.append(zlib.compress(block))
+            bounds.append((
+                chrom_ids[name], int(items["start"][0]),
+                chrom_ids[name], int(items["end"][-1])
+            ))
+
+    data = struct.pack("<Q", len(blocks))
+    leaves = []
+    for block in blocks:
+        leaves.append((data_offset + len(data), len(block)))
+        data += block
+    index_offset = data_offset + len(data)
+
+    levels = _build_r_tree(leaves, bounds, block_size)
+    # Compute the offsets of the nodes, writing the root first.
+    node_offsets = []
+    offset = index_offset + 48
+    for depth, level in enumerate(levels[:-1]):
+        is_leaf = depth == len(levels) - 2
+        level_offsets = []
+        for children, _ in level:
+            level_offsets.append(offset)
+            offset += 4 + len(children)*(32 if is_leaf else 24)
+        node_offsets.append(level_offsets)
+    index = struct.pack(
+        "<IIQIIIIQII", R_TREE_MAGIC, block_size, len(blocks),
+        bounds[0][0] if bounds else 0, bounds[0][1] if bounds else 0,
+        bounds[-1][2] if bounds else 0, bounds[-1][3] if bounds else 0,
+        index_offset, items_per_block, 0
+    )
+    for depth, level in enumerate(levels[:-1]):
+        is_leaf = depth == len(levels) - 2
+        child_index = 0
+        for children, _ in level:
+            index += struct.pack("<BBH", int(is_leaf), 0, len(children))
+            for child, bound in children:
+                if is_leaf:
+                    index += struct.pack("<IIIIQQ", *bound, *child)
+                else:
+                    index += struct.pack(
+                        "<IIIIQ", *bound, node_offsets[depth+1][child_index]
+                    )
+                    child_index += 1
+
+    header = struct.pack(
+        "<IHHQQQHHQQIQ", BIGWIG_MAGIC, 4, 0, chrom_tree_offset, data_offset,
+        index_offset, 0, 0, 0, 0, max_block_size, 0
+    )
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(chrom_tree)
+        f.write(data)
+        f.write(index)
@@ -1,11 +1,12 @@
-from .extract import extract
+from .extract import extract, get_targets_paths, get_extraction_jobs
 from .mine import mine
 from .concatenate import concatenate
-from typing import List
+from .telemetry import measure_stage, write_report
+from typing import List, Tuple, Union
 
 
 def build(
-    bed_path: str,
+    bed_path: Union[str, List[Tuple]],
     cell_lines: List[str],
     assembly: str,
     epigenomes_path: str = "epigenomes",
@@ -17,14 +18,27 @@ def build(
     mine_min: bool = False,
     mine_mean: bool = False,
     mine_median: bool = False,
-    mine_variance: bool = False
+    mine_variance: bool = False,
+    extraction_engine: str = "native",
+    window_sizes: List[int] = None,
+    columnar: bool = False,
+    download_workers: int = 4,
+    max_staged_bytes: int = None,
+    mining_workers: int = -1,
+    telemetry: bool = True,
+    metadata_path: str = None,
+    columnar_dtype: str = "float64",
+    window_anchor: str = "center"
 ):
     """Build the dataset.
 
     Parameters
     --------------------------
-    bed_path:str,
-        Either path to the bed file containing the regions of interest.
+    bed_path: Union[str, List[Tuple]],
+        Either path to the bed file containing the regions of interest
+        or list of pairs of bed file paths and their targets paths,
+        optionally followed by the anchor of their windows.
+        Every bigWig is downloaded once for all the region sets.
     cell_lines:List[str],
         List of cell lines whose epigenomes are to retrieve.
     assembly: str,
@@ -32,7 +46,8 @@ def build(
     epigenomes_path:str,
         Path where to store the epigenomic bigWig.
     targets_path:str,
-        Path where to store the epigenomic bed.
+        Path where to store the epigenomic bed,
+        when a single bed file is given.
     clear_download: bool = False,
         Whetever to delete the downloaded files or not.
         By default False.
@@ -51,30 +66,97 @@ def build(
         Wether to mine median value in windows.
     mine_variance: bool = False
         Wether to mine variance value in windows.
+    extraction_engine: str = "native",
+        Engine to use to extract the regions, either "native",
+        which reads the bigWig files in process and only writes
+        the mean of the bases of each region, or "pybwtool", which
+        dumps the per-base values of each region.
+    window_sizes: List[int] = None,
+        Window sizes to build from the centers of the bed regions,
+        which must be as wide as the largest window size.
+        Every bigWig is extracted once and a targets directory is
+        built for each window size, so the targets path must contain
+        the "{window_size}" placeholder.
+    columnar: bool = False,
+        Whether to also write the concatenated cell lines
+        in the columnar binary format.
+    download_workers: int = 4,
+        Number of bigWig files to download concurrently,
+        independently from the extraction workers.
+    max_staged_bytes: int = None,
+        Maximum total size of the bigWig files that are being
+        downloaded or extracted at once.
+        By default, the size is not bounded.
+    mining_workers: int = -1,
+        Number of workers to use to mine the targets.
+        The largest targets are split in shards mined in parallel.
+        The default, -1, set the workers to the maximum available.
+    telemetry: bool = True,
+        Whether to write, in each targets directory, a JSON and a CSV
+        report with the time, the resources, the bytes and the regions
+        of each stage of the build and of each of their tasks.
+    metadata_path: str = None,
+        Path of the epigenomes metadata to use instead of the ones
+        shipped with the package for the given assembly.
+    columnar_dtype: str = "float64",
+        The dtype of the values of the columnar matrices, either
+        float64, float32, float16 or int16 for the fixed-point format.
+    window_anchor: str = "center",
+        Where the windows are anchored in the regions of the region sets
+        not specifying it, either "center", as for the enhancers, or "tss",
+        as for the promoters, whose windows end at the transcription start
+        site on the strand of the regions.
     """
-    extract(
-        bed_path,
-        cell_lines,
-        assembly,
-        epigenomes_path=epigenomes_path,
-        targets_path=targets_path,
-        clear_download=clear_download,
-        workers=extraction_workers
-    )
-    mine(
-        targets_path,
-        {
-            "max": mine_max,
-            "min": mine_min,
-            "mean": mine_mean,
-            "median": mine_median,
-            "var": mine_variance,
-        },
-        cell_lines,
-        assembly
-    )
-    concatenate(
-        targets_path,
-        cell_lines,
-        concatenation_workers,
-    )
+    statistics = {
+        "max": mine_max,
+        "min": mine_min,
+        "mean": mine_mean,
+        "median": mine_median,
+        "var": mine_variance,
+    }
+    report = []
+    with measure_stage(report, "extraction") as stage:
+        extract(
+            bed_path,
+            cell_lines,
+            assembly,
+            epigenomes_path=epigenomes_path,
+            targets_path=targets_path,
+            clear_download=clear_download,
+            workers=extraction_workers,
+            engine=extraction_engine,
+            window_sizes=window_sizes,
+            download_workers=download_workers,
+            max_staged_bytes=max_staged_bytes,
+            telemetry=stage["tasks"],
+            metadata_path=metadata_path,
+            window_anchor=window_anchor
+        )
+    paths = [
+        path
+        for _, targets, _ in get_extraction_jobs(bed_path, targets_path, window_anchor)
+        for path in get_targets_paths(targets, window_sizes).values()
+    ]
+    for path in paths:
+        with measure_stage(report, "mining", targets=path) as stage:
+            mine(
+                path,
+                statistics,
+                cell_lines,
+                assembly,
+                workers=mining_workers,
+                telemetry=stage["tasks"],
+                metadata_path=metadata_path
+            )
+        with measure_stage(report, "concatenation", targets=path) as stage:
+            concatenate(
+                path,
+                cell_lines,
+                concatenation_workers,
+                columnar=columnar,
+                telemetry=stage["tasks"],
+                dtype=columnar_dtype
+            )
+    if telemetry:
+        for path in paths:
+            write_report(report, path)
@@ -0,0 +1,195 @@
+"""Submodule providing an on-disk cache of the parsed epigenomic matrices.
+
+Each entry is a directory under the cache root, named after the hash of
+the parameters used to parse it, containing the values of the matrices as
+memory-mappable NumPy arrays, the regions index as NumPy arrays and a JSON
+file with the column names and the signatures of the parsed source files.
+Entries are invalidated when any of the source files changes and the least
+recently used entries are evicted once the cache exceeds its size cap.
+"""
+import hashlib
+import json
+import os
+import shutil
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+from .columnar import read_matrices, write_matrices
+
+CACHE_DIRECTORY = ".cache"
+
+
+def get_cache_key(**parameters) -> str:
+    """Return the key of the cache entry for given parameters.
+
+    Parameters
+    ----------------------------
+    **parameters,
+        Parameters that determine the content of the entry.
+
+    Returns
+    ----------------------------
+    Hexadecimal hash of the parameters.
+    """
+    return hashlib.sha256(
+        json.dumps(parameters, sort_keys=True).encode("utf8")
+    ).hexdigest()
+
+
+def get_file_hash(path: str) -> str:
+    """Return the SHA256 hash of the file at given path."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def get_file_signature(path: str) -> Dict:
+    """Return the size, modification time and hash of the file at given path."""
+    stat = os.stat(path)
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "sha256": get_file_hash(path)
+    }
+
+
+def is_valid_signature(path: str, signature: Dict) -> bool:
+    """Return whether the file at given path matches given signature.
+
+    The hash is only recomputed when the size matches
+    but the modification time does not, as it happens
+    when the same file is downloaded again.
+
+    Parameters
+    ----------------------------
+    path: str,
+        Path of the source file.
+    signature: Dict,
+        Signature of the file when the entry was written.
+
+    Returns
+    ----------------------------
+    Boolean representing whether the file is unchanged.
+    """
+    if not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    if stat.st_size != signature["size"]:
+        return False
+    if stat.st_mtime_ns == signature["mtime"]:
+        return True
+    return get_file_hash(path) == signature["sha256"]
+
+
+def get_entry_size(path: str) -> int:
+    """Return the size in bytes of the cache entry at given path."""
+    return sum(
+        os.path.getsize(os.path.join(path, file_name))
+        for file_name in os.listdir(path)
+    )
+
+
+def load_cached(root: str, key: str, sources: List[str]) -> Optional[Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Return the cached matrices for given key, if available and valid.
+
+    Parameters
+    ----------------------------
+    root: str,
+        Root of the cache.
+    key: str,
+        Key of the entry.
+    sources: List[str],
+        Paths of the files the matrices were parsed from.
+
+    Returns
+    ----------------------------
+    Tuple with input and output DataFrames, or None
+    when the entry is missing or outdated.
+    """
+    path = os.path.join(root, CACHE_DIRECTORY, key)
+    metadata_path = os.path.join(path, "metadata.json")
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path, "r") as f:
+        metadata = json.load(f)
+    if metadata["sources"].keys() != set(sources) or not all(
+        is_valid_signature(source, metadata["sources"][source])
+        for source in sources
+    ):
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+    # Copy-on-write mapping, so that the returned
+    # DataFrames can be edited without touching the cache.
+    matrices = read_matrices(path, metadata, mmap_mode="c")
+    # The modification time of the metadata is used as last access time.
+    os.utime(metadata_path)
+    return matrices
+
+
+def store_cached(
+    root: str,
+    key: str,
+    sources: List[str],
+    X: pd.DataFrame,
+    y: pd.DataFrame,
+    cache_size: int
+):
+    """Store given matrices in the cache and evict the least recently used entries.
+
+    Parameters
+    ----------------------------
+    root: str,
+        Root of the cache.
+    key: str,
+        Key of the entry.
+    sources: List[str],
+        Paths of the files the matrices were parsed from.
+    X: pd.DataFrame,
+        Input DataFrame.
+    y: pd.DataFrame,
+        Output DataFrame, aligned with the input one.
+    cache_size: int,
+        Maximum size in bytes of the cache.
+    """
+    write_matrices(
+        os.path.join(root, CACHE_DIRECTORY, key),
+        X,
+        y,
+        metadata={
+            "sources": {
+                source: get_file_signature(source)
+                for source in sources
+            }
+        }
+    )
+    evict(root, cache_size)
+
+
+def evict(root: str, cache_size: int):
+    """Remove the least recently used entries until the cache fits given size.
+
+    Parameters
+    ----------------------------
+    root: str,
+        Root of the cache.
+    cache_size: int,
+        Maximum size in bytes of the cache.
+    """
+    cache_path = os.path.join(root, CACHE_DIRECTORY)
+    entries = []
+    for key in os.listdir(cache_path):
+        metadata_path = os.path.join(cache_path, key, "metadata.json")
+        if key.endswith(".tmp") or not os.path.exists(metadata_path):
+            continue
+        entries.append((
+            os.path.getmtime(metadata_path),
+            get_entry_size(os.path.join(cache_path, key)),
+            key
+        ))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, key in sorted(entries):
+        if total_size <= cache_size:
+            break
+        shutil.rmtree(os.path.join(cache_path, key), ignore_errors=True)
+        total_size -= size
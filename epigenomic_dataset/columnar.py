@@ -0,0 +1,397 @@
+"""Submodule providing a columnar binary format for the epigenomic matrices.
+
+A matrix is stored as a directory containing the values as a column-major
+NumPy array, so that single columns can be memory-mapped and read without
+parsing the whole file, the region index as NumPy arrays and a JSON file
+with the column names and the categories of the index. The aligned data
+and labels, as cached or shared between processes, are stored as row-major
+NumPy arrays next to the same regions index.
+"""
+import json
+import os
+import shutil
+from typing import Callable, Dict, Iterable, Tuple
+import numpy as np
+import pandas as pd
+from .regions import compact_index
+
+COLUMNAR_SUFFIX = ".columnar"
+INDEX_NAMES = ["chrom", "chromStart", "chromEnd", "strand"]
+VALUE_DTYPES = ("float64", "float32", "float16", "int16")
+# The values are rounded to two decimals, so in the fixed-point
+# format they are stored as hundredths, with a sentinel for NaN.
+FIXED_POINT_SCALE = 100
+FIXED_POINT_NAN = np.iinfo(np.int16).min
+
+
+def get_columnar_path(path: str) -> str:
+    """Return the columnar path corresponding to given CSV path.
+
+    Parameters
+    ----------------------------
+    path: str,
+        Path of the compressed CSV, such as "root/K562.csv.xz".
+
+    Returns
+    ----------------------------
+    Path of the columnar directory, such as "root/K562.columnar".
+    """
+    return "{}{}".format(path.split(".csv")[0], COLUMNAR_SUFFIX)
+
+
+def validate_dtype(dtype: str, dtypes: Tuple[str] = VALUE_DTYPES):
+    """Raise a ValueError if the given dtype is not among the given ones."""
+    if dtype not in dtypes:
+        raise ValueError(
+            "The given dtype {} is not supported. The supported dtypes are {}.".format(
+                dtype, ", ".join(dtypes)
+            )
+        )
+
+
+def encode_values(values: np.ndarray, dtype: str) -> np.ndarray:
+    """Return given values converted to the given storage dtype.
+
+    Parameters
+    ----------------------------
+    values: np.ndarray,
+        The values to convert.
+    dtype: str,
+        The storage dtype, where "int16" is the fixed-point format.
+
+    Raises
+    ----------------------------
+    ValueError,
+        If some of the values do not fit in the given dtype.
+
+    Returns
+    ----------------------------
+    The converted values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if dtype == "int16":
+        values = values*FIXED_POINT_SCALE
+        limit = np.iinfo(np.int16).max
+    else:
+        limit = np.finfo(dtype).max
+    finite = values[np.isfinite(values)]
+    if finite.size and np.abs(finite).max() > limit:
+        raise ValueError(
+            "The values up to {} do not fit in the {} dtype.".format(
+                np.abs(finite).max()/(FIXED_POINT_SCALE if dtype == "int16" else 1),
+                dtype
+            )
+        )
+    if dtype != "int16":
+        return values.astype(dtype)
+    nan = np.isnan(values)
+    values = np.round(values)
+    values[nan] = FIXED_POINT_NAN
+    return values.astype(np.int16)
+
+
+def decode_values(values: np.ndarray, dtype: str, target_dtype: str = None) -> np.ndarray:
+    """Return the floating point values stored with the given dtype.
+
+    Parameters
+    ----------------------------
+    values: np.ndarray,
+        The stored values.
+    dtype: str,
+        The storage dtype, where "int16" is the fixed-point format.
+    target_dtype: str = None,
+        The dtype of the returned values. By default, the storage
+        dtype, or float32 for the values in the fixed-point format.
+
+    Returns
+    ----------------------------
+    The decoded values.
+    """
+    if dtype != "int16":
+        return values if target_dtype is None else values.astype(target_dtype, copy=False)
+    nan = values == FIXED_POINT_NAN
+    # The hundredths are divided in double precision, so that the
+    # decoded values are the closest ones to the two decimals.
+    values = values.astype(np.float64)/FIXED_POINT_SCALE
+    values[nan] = np.nan
+    return values.astype(target_dtype or np.float32, copy=False)
+
+
+def write_index(index: pd.MultiIndex, path: str) -> Dict:
+    """Write given regions index as NumPy arrays in given directory.
+
+    Parameters
+    ----------------------------
+    index: pd.MultiIndex,
+        Regions index, with chrom, chromStart, chromEnd and strand levels.
+    path: str,
+        Directory where to store the index.
+
+    Returns
+    ----------------------------
+    Dictionary with the categories of the index, to be stored in the metadata.
+    """
+    chrom_codes, chroms = pd.factorize(index.get_level_values(0))
+    strand_codes, strands = pd.factorize(index.get_level_values(3))
+    np.save(os.path.join(path, "chrom.npy"), chrom_codes.astype(np.int16))
+    np.save(os.path.join(path, "chromStart.npy"),
+            index.get_level_values(1).values.astype(np.int64))
+    np.save(os.path.join(path, "chromEnd.npy"),
+            index.get_level_values(2).values.astype(np.int64))
+    np.save(os.path.join(path, "strand.npy"), strand_codes.astype(np.int8))
+    return {
+        "chroms": list(chroms),
+        "strands": list(strands)
+    }
+
+
+def read_index(path: str, metadata: Dict) -> pd.MultiIndex:
+    """Return the regions index stored in given directory.
+
+    Parameters
+    ----------------------------
+    path: str,
+        Directory where the index is stored.
+    metadata: Dict,
+        Metadata with the categories of the index.
+
+    Returns
+    ----------------------------
+    Regions index, with chrom, chromStart, chromEnd and strand levels.
+    """
+    return compact_index(pd.MultiIndex.from_arrays([
+        np.array(metadata["chroms"], dtype=object)[
+            np.load(os.path.join(path, "chrom.npy"))],
+        np.load(os.path.join(path, "chromStart.npy")),
+        np.load(os.path.join(path, "chromEnd.npy")),
+        np.array(metadata["strands"], dtype=object)[
+            np.load(os.path.join(path, "strand.npy"))],
+    ], names=INDEX_NAMES))
+
+
+def write_matrices(path: str, X: pd.DataFrame, y: pd.DataFrame, metadata: Dict = None):
+    """Write the given data and labels, with their regions index, in given directory.
+
+    The directory is written under a temporary name and then renamed,
+    so that concurrent readers never read a partially written one.
+
+    Parameters
+    ----------------------------
+    path: str,
+        Directory where to store the matrices.
+    X: pd.DataFrame,
+        The epigenomic data, indexed by region.
+    y: pd.DataFrame,
+        The labels, aligned with the data.
+    metadata: Dict = None,
+        Other metadata to store with the matrices.
+    """
+    temporary_path = "{}.{}.tmp".format(path, os.getpid())
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+    metadata = {
+        **({} if metadata is None else metadata),
+        **write_index(X.index, temporary_path)
+    }
+    for name, df in (("X", X), ("y", y)):
+        np.save(os.path.join(temporary_path, "{}.npy".format(name)), df.to_numpy())
+        metadata[name] = {
+            "columns": df.columns.tolist(),
+            "name": df.columns.name
+        }
+    with open(os.path.join(temporary_path, "metadata.json"), "w") as f:
+        json.dump(metadata, f)
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rename(temporary_path, path)
+    except OSError:
+        # Another process has stored the same matrices in the meantime.
+        shutil.rmtree(temporary_path, ignore_errors=True)
+
+
+def read_matrices_metadata(path: str) -> Dict:
+    """Return the metadata of the matrices stored in given directory."""
+    with open(os.path.join(path, "metadata.json"), "r") as f:
+        return json.load(f)
+
+
+def load_matrix(path: str, name: str, mmap_mode: str = "r") -> np.ndarray:
+    """Return the memory-mapped values of the given matrix, either X or y."""
+    return np.load(os.path.join(path, "{}.npy".format(name)), mmap_mode=mmap_mode)
+
+
+def read_matrices(
+    path: str,
+    metadata: Dict = None,
+    mmap_mode: str = "r"
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Return the data and labels stored in given directory by write_matrices.
+
+    Parameters
+    ----------------------------
+    path: str,
+        Directory where the matrices are stored.
+    metadata: Dict = None,
+        The metadata of the matrices, which are read when not given.
+    mmap_mode: str = "r",
+        How the values are memory-mapped, either "r" for read-only
+        views or "c" for copy-on-write ones, which can be edited.
+
+    Returns
+    ----------------------------
+    Tuple with the data and the labels, whose values are
+    memory-mapped and whose regions index is rebuilt.
+    """
+    if metadata is None:
+        metadata = read_matrices_metadata(path)
+    index = read_index(path, metadata)
+    return tuple(
+        pd.DataFrame(
+            load_matrix(path, name, mmap_mode),
+            index=index,
+            columns=pd.Index(
+                metadata[name]["columns"],
+                name=metadata[name]["name"]
+            ),
+            copy=False
+        )
+        for name in ("X", "y")
+    )
+
+
+def write_columnar_blocks(
+    blocks: Iterable[pd.DataFrame],
+    path: str,
+    rows: int,
+    dtype: str = "float64"
+):
+    """Write the epigenomic matrix given in blocks of rows in the columnar format.
+
+    The values of each block are written in place in the memory-mapped
+    output, so that only a block of the matrix is held in memory at once.
+
+    Parameters
+    ----------------------------
+    blocks: Iterable[pd.DataFrame],
+        Consecutive blocks of rows of the matrix, indexed by
+        the regions and with the same two-level columns.
+    path: str,
+        Directory where to store the matrix.
+    rows: int,
+        Total number of rows of the blocks.
+    dtype: str = "float64",
+        The dtype of the stored values, either float64, float32,
+        float16 or int16 for the fixed-point format with two decimals.
+
+    Raises
+    ----------------------------
+    ValueError,
+        If the blocks do not have the given number of rows,
+        or their values do not fit in the given dtype.
+    """
+    validate_dtype(dtype)
+    # Writing to a temporary directory first, so that an interrupted
+    # write does not leave a partial matrix that would be loaded later on.
+    temporary_path = "{}.tmp".format(path)
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+    values, indices, columns, written = None, [], None, 0
+    for block in blocks:
+        if values is None:
+            columns = block.columns
+            values = np.lib.format.open_memmap(
+                os.path.join(temporary_path, "values.npy"),
+                mode="w+",
+                dtype=dtype,
+                shape=(rows, len(columns)),
+                fortran_order=True
+            )
+        if written + len(block) > rows:
+            break
+        try:
+            values[written:written + len(block)] = encode_values(block.to_numpy(), dtype)
+        except ValueError:
+            del values
+            shutil.rmtree(temporary_path, ignore_errors=True)
+            raise
+        indices.append(block.index)
+        written += len(block)
+    if values is None or written != rows:
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        raise ValueError(
+            "Expected {} rows to write in {}.".format(rows, path)
+        )
+    values.flush()
+    del values
+    index_metadata = write_index(indices[0].append(indices[1:]), temporary_path)
+    with open(os.path.join(temporary_path, "metadata.json"), "w") as f:
+        json.dump({
+            "columns": [list(column) for column in columns],
+            "dtype": dtype,
+            **index_metadata
+        }, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(temporary_path, path)
+
+
+def write_columnar(data: pd.DataFrame, path: str, dtype: str = "float64"):
+    """Write given epigenomic matrix in the columnar format.
+
+    Parameters
+    ----------------------------
+    data: pd.DataFrame,
+        Matrix indexed by the regions, with two-level columns.
+    path: str,
+        Directory where to store the matrix.
+    dtype: str = "float64",
+        The dtype of the stored values.
+    """
+    write_columnar_blocks([data], path, len(data), dtype)
+
+
+def read_columnar(
+    path: str,
+    columns: Callable[[Tuple[str, str]], bool] = None,
+    dtype: str = None
+) -> pd.DataFrame:
+    """Return the epigenomic matrix stored in the given directory.
+
+    Parameters
+    ----------------------------
+    path: str,
+        Directory where the matrix is stored.
+    columns: Callable[[Tuple[str, str]], bool] = None,
+        Filter over the columns to read. The other
+        columns are never read from the disk.
+    dtype: str = None,
+        The dtype of the returned values. By default, the stored
+        dtype, or float32 when stored in the fixed-point format.
+
+    Returns
+    ----------------------------
+    Matrix indexed by the regions, with two-level columns.
+    """
+    with open(os.path.join(path, "metadata.json"), "r") as f:
+        metadata = json.load(f)
+    names = [tuple(column) for column in metadata["columns"]]
+    selected = [
+        i for i, column in enumerate(names)
+        if columns is None or columns(column)
+    ]
+    values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+    # The values are stored column-major, so each selected
+    # column is a contiguous slice of the memory-mapped file.
+    values = decode_values(
+        np.array(values[:, selected]),
+        metadata.get("dtype", "float64"),
+        dtype
+    )
+    index = read_index(path, metadata)
+    return pd.DataFrame(
+        values,
+        index=index,
+        columns=pd.MultiIndex.from_arrays([
+            [names[i][level] for i in selected]
+            for level in range(2)
+        ])
+    )
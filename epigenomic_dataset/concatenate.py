@@ -1,27 +1,174 @@
 import pandas as pd
+import gzip
+import lzma
 import os
+from itertools import zip_longest
 from tqdm.auto import tqdm
-from typing import List
+from typing import Dict, Iterator, List
 from glob import glob
 from multiprocessing import Pool, cpu_count
 from .extract import load_epigenomes_table
 from .mine import get_target_path
+from .columnar import (
+    COLUMNAR_SUFFIX,
+    get_columnar_path,
+    validate_dtype,
+    write_columnar,
+    write_columnar_blocks
+)
+from .telemetry import measured_call
+from .manifest import get_sources_inputs, is_up_to_date, load_manifest, record_output, save_manifest
+
+
+def get_feature_name(path: str) -> str:
+    """Return the name of the target stored at given path."""
+    return path.split(os.sep)[-1].split(".")[0]
 
 
 def to_dict(path: str):
-    feature_name = path.split(os.sep)[-1].split(".")[0]
     df = pd.read_csv(path, sep="\t", index_col=[0, 1, 2, 3]).round(2)
-    df.columns = pd.MultiIndex.from_product([[feature_name], df.columns])
+    df.columns = pd.MultiIndex.from_product([[get_feature_name(path)], df.columns])
     return df
 
 
+def count_rows(path: str) -> int:
+    """Return the number of rows of the target stored at given path."""
+    with gzip.open(path, "rt") as f:
+        # The first line is the header
+        return sum(1 for _ in f) - 1
+
+
+def iter_blocks(paths: List[str], block_size: int) -> Iterator[pd.DataFrame]:
+    """Yield the concatenation of the given targets block of rows by block of rows.
+
+    The targets are expected to share the same regions in the same
+    order, as the ones mined from the same regions, so that the
+    blocks are concatenated without joining their indices.
+
+    Parameters
+    ----------------------------------
+    paths: List[str],
+        Paths of the targets to concatenate.
+    block_size: int,
+        Number of rows of each block.
+
+    Raises
+    ----------------------------------
+    ValueError,
+        If the targets do not share the same regions in the same order.
+
+    Returns
+    ----------------------------------
+    Iterator over the concatenated blocks of rows.
+    """
+    readers = [
+        pd.read_csv(path, sep="\t", index_col=[0, 1, 2, 3], chunksize=block_size)
+        for path in paths
+    ]
+    try:
+        for chunks in zip_longest(*readers):
+            if any(
+                chunk is None or not chunk.index.equals(chunks[0].index)
+                for chunk in chunks
+            ):
+                raise ValueError((
+                    "The targets {} do not share the same regions in the same "
+                    "order, so they cannot be concatenated in streaming."
+                ).format(", ".join(paths)))
+            for path, chunk in zip(paths, chunks):
+                chunk.columns = pd.MultiIndex.from_product(
+                    [[get_feature_name(path)], chunk.columns]
+                )
+            yield pd.concat(chunks, axis=1).round(2)
+    finally:
+        for reader in readers:
+            reader.close()
+
+
+def concatenate_cell_line(
+    paths: List[str],
+    path: str = None,
+    columnar_path: str = None,
+    block_size: int = 50000,
+    dtype: str = "float64"
+) -> int:
+    """Concatenate the given targets in streaming into the given outputs.
+
+    Only a block of rows of the targets is held in memory at once,
+    and no matrix is moved between the processes.
+
+    Parameters
+    ----------------------------------
+    paths: List[str],
+        Paths of the targets to concatenate, sharing the same regions.
+    path: str = None,
+        Path of the compressed CSV to write, if any.
+    columnar_path: str = None,
+        Path of the columnar matrix to write, if any.
+    block_size: int = 50000,
+        Number of rows to concatenate at once.
+    dtype: str = "float64",
+        The dtype of the values of the columnar matrix.
+
+    Returns
+    ----------------------------------
+    Number of rows concatenated.
+    """
+    temporary_path = "{}.tmp".format(path)
+    csv = None if path is None else lzma.open(temporary_path, "wt")
+
+    rows = [0]
+
+    def write_csv(blocks: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        for i, block in enumerate(blocks):
+            rows[0] += len(block)
+            if csv is not None:
+                block.reset_index().to_csv(csv, index=False, header=i == 0)
+            yield block
+
+    try:
+        blocks = write_csv(iter_blocks(paths, block_size))
+        if columnar_path is None:
+            for _ in blocks:
+                pass
+        else:
+            write_columnar_blocks(blocks, columnar_path, count_rows(paths[0]), dtype)
+    except BaseException:
+        if csv is not None:
+            csv.close()
+            os.remove(temporary_path)
+        raise
+    if csv is not None:
+        csv.close()
+        os.replace(temporary_path, path)
+    return rows[0]
+
+
+def _concatenate_cell_line(job: Dict) -> Dict:
+    return {"regions": concatenate_cell_line(
+        job["paths"],
+        job["path"],
+        job["columnar_path"],
+        job["block_size"],
+        job["dtype"]
+    )}
+
+
 def concatenate(
     root: str,
     cell_lines: List[str],
-    workers: int
+    workers: int,
+    columnar: bool = False,
+    streaming: bool = True,
+    block_size: int = 50000,
+    telemetry: List[Dict] = None,
+    dtype: str = "float64"
 ):
     """Concatenate the targets into a single file.
 
+    The cell lines are concatenated again when their targets
+    changed since they were recorded in the manifest of the root.
+
     Parameters
     ----------------------------------
     root: str,
@@ -31,33 +178,117 @@ def concatenate(
         Cell lines to consider.
     workers: int,
         Workers to use to parallelize the loading.
+    columnar: bool = False,
+        Whether to also write each cell line in the columnar
+        binary format, which is preferred by load_epigenomes
+        when present and allows to read single columns.
+    streaming: bool = True,
+        Whether to concatenate the targets block of rows by block of
+        rows, with a worker for each cell line, which requires the
+        targets to share the same regions in the same order, as the
+        ones mined from the same regions do. Otherwise, the whole
+        targets are loaded and joined on their regions.
+    block_size: int = 50000,
+        Number of rows to concatenate at once when streaming.
+    telemetry: List[Dict] = None,
+        List where to append the measurements of each cell line
+        concatenated in streaming.
+    dtype: str = "float64",
+        The dtype of the values of the columnar matrices, either
+        float64, float32, float16 or int16, for the fixed-point format
+        storing the values rounded to two decimals as hundredths.
+        The compressed CSV is not affected.
     """
+    validate_dtype(dtype)
     if workers == -1:
         workers = cpu_count()
+    manifest = load_manifest(root)
+    jobs = []
+    for cell_line in [
+        directory_name
+        for directory_name in os.listdir(root)
+        if os.path.isdir(f"{root}/{directory_name}")
+        and COLUMNAR_SUFFIX not in directory_name
+    ]:
+        path = "{root}/{cell_line}.csv.xz".format(
+            root=root,
+            cell_line=cell_line
+        )
+        paths = glob("{root}/{cell_line}/*.csv.gz".format(
+            root=root,
+            cell_line=cell_line
+        ))
+
+        columnar_path = get_columnar_path(path)
+        # The columnar matrix is recorded through its values
+        columnar_values_path = os.path.join(columnar_path, "values.npy")
+        inputs = {
+            "sources": get_sources_inputs(manifest, root, sorted(paths))
+        }
+        csv_up_to_date = is_up_to_date(manifest, root, path, inputs)
+        columnar_inputs = {**inputs, "dtype": dtype}
+        columnar_up_to_date = not columnar or is_up_to_date(
+            manifest, root, columnar_values_path, columnar_inputs
+        )
+
+        if csv_up_to_date and columnar_up_to_date:
+            continue
+
+        jobs.append({
+            "cell_line": cell_line,
+            "paths": paths,
+            "path": None if csv_up_to_date else path,
+            "columnar_path": None if columnar_up_to_date else columnar_path,
+            "inputs": inputs,
+            "columnar_inputs": columnar_inputs,
+            "block_size": block_size,
+            "dtype": dtype
+        })
+
+    def record(job: Dict):
+        if job["path"] is not None:
+            record_output(manifest, root, job["path"], job["inputs"])
+        if job["columnar_path"] is not None:
+            record_output(manifest, root, os.path.join(
+                job["columnar_path"], "values.npy"), job["columnar_inputs"])
+        save_manifest(root, manifest)
+
+    if streaming:
+        with Pool(max(1, min(cpu_count(), workers, len(jobs)))) as p:
+            for job, measurement in zip(jobs, tqdm(
+                p.imap(
+                    measured_call,
+                    [(_concatenate_cell_line, job) for job in jobs]
+                ),
+                desc="Concatenating cell lines",
+                total=len(jobs),
+                leave=False
+            )):
+                record(job)
+                if telemetry is not None:
+                    telemetry.append({
+                        "task": job["cell_line"],
+                        **measurement
+                    })
+            p.close()
+            p.join()
+        return
+
     with Pool(min(cpu_count(), workers)) as p:
-        for cell_line in tqdm([
-            directory_name
-            for directory_name in os.listdir(root)
-            if os.path.isdir(f"{root}/{directory_name}")
-        ], leave=False, desc="Concatenating cell lines"):
-            path = "{root}/{cell_line}.csv.xz".format(
-                root=root,
-                cell_line=cell_line
-            )
-            paths = glob("{root}/{cell_line}/*.csv.gz".format(
-                root=root,
-                cell_line=cell_line
-            ))
-
-            if os.path.exists(path):
-                continue
-
-            pd.concat(list(tqdm(
-                p.imap(to_dict, paths),
+        for job in tqdm(jobs, leave=False, desc="Concatenating cell lines"):
+            df = pd.concat(list(tqdm(
+                p.imap(to_dict, job["paths"]),
                 desc="Concatenating files",
-                total=len(paths),
+                total=len(job["paths"]),
                 leave=False
-            )), axis=1).reset_index().to_csv(path, index=False)
+            )), axis=1)
+
+            if job["path"] is not None:
+                df.reset_index().to_csv(job["path"], index=False)
+            if job["columnar_path"] is not None:
+                write_columnar(df, job["columnar_path"], dtype)
+            record(job)
 
         p.close()
         p.join()
+
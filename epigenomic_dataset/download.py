@@ -0,0 +1,134 @@
+"""Submodule providing resumable downloads of the epigenomes."""
+import hashlib
+import os
+from typing import Dict
+import requests
+from .logging import logger
+
+
+def get_md5(path: str) -> str:
+    """Return the MD5 hash of the file at given path."""
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def get_part_path(path: str) -> str:
+    """Return the path where the partial download of given path is stored."""
+    return "{}.part".format(path)
+
+
+def download_file(
+    url: str,
+    path: str,
+    file_size: int = None,
+    md5sum: str = None,
+    retries: int = 3,
+    block_size: int = 2**16,
+    timeout: float = 60
+) -> Dict[str, int]:
+    """Download the file at given url, resuming any partial download.
+
+    The file is downloaded to a ".part" file, which is renamed to the
+    given path only once complete and valid. When the ".part" file
+    already exists, only the missing bytes are requested to the
+    server with a Range request. Existing files whose size does
+    not match the expected one are downloaded again.
+
+    Parameters
+    --------------------------
+    url: str,
+        The url from where to download the file.
+    path: str,
+        The path where to store the file.
+    file_size: int = None,
+        Expected size in bytes of the file, if known.
+    md5sum: str = None,
+        Expected MD5 hash of the file, if known.
+    retries: int = 3,
+        Number of times to resume the download after a connection error.
+    block_size: int = 2**16,
+        Size of the blocks written to the disk, which is
+        also the most data lost when a download is interrupted.
+    timeout: float = 60,
+        Timeout in seconds of the connection to the server.
+
+    Raises
+    --------------------------
+    ValueError,
+        If the downloaded file does not match the expected size or hash.
+        Files larger than expected or not matching the hash are removed,
+        while the ones still short after the retries are kept to be resumed.
+
+    Returns
+    --------------------------
+    Dictionary with the bytes downloaded and the number of retries.
+    """
+    statistics = {"downloaded_bytes": 0, "retries": 0}
+    if os.path.exists(path):
+        if file_size is None or os.path.getsize(path) == file_size:
+            return statistics
+        logger.warning(
+            "The file %s has size %s instead of %s, downloading it again.",
+            path, os.path.getsize(path), file_size
+        )
+        os.remove(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    part_path = get_part_path(path)
+    for attempt in range(retries + 1):
+        downloaded = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if file_size is not None and downloaded >= file_size:
+            break
+        headers = {"Range": "bytes={}-".format(downloaded)} if downloaded else {}
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                # The partial file is already complete.
+                if downloaded and response.status_code == 416:
+                    break
+                response.raise_for_status()
+                # The server may ignore the Range request,
+                # in which case the whole file is sent again.
+                mode = "ab" if response.status_code == 206 else "wb"
+                with open(part_path, mode) as f:
+                    for block in response.iter_content(block_size):
+                        f.write(block)
+                        statistics["downloaded_bytes"] += len(block)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == retries:
+                raise e
+            statistics["retries"] += 1
+            logger.warning(
+                "Download of %s interrupted, resuming it: %s", url, e
+            )
+            continue
+        # The stream may also end cleanly before the expected size,
+        # in which case the download is resumed from where it ended.
+        downloaded = os.path.getsize(part_path)
+        if file_size is None or downloaded >= file_size or attempt == retries:
+            break
+        statistics["retries"] += 1
+        logger.warning(
+            "Download of %s ended at %s of %s bytes, resuming it.",
+            url, downloaded, file_size
+        )
+    downloaded = os.path.getsize(part_path)
+    if file_size is not None and downloaded != file_size:
+        # The partial files are kept, so that a following download resumes them.
+        if downloaded > file_size:
+            os.remove(part_path)
+        raise ValueError(
+            "The file downloaded from {} has size {} instead of the expected {}.".format(
+                url, downloaded, file_size
+            )
+        )
+    if md5sum is not None and get_md5(part_path) != md5sum:
+        os.remove(part_path)
+        raise ValueError(
+            "The file downloaded from {} does not match the expected MD5 {}.".format(
+                url, md5sum
+            )
+        )
+    os.replace(part_path, path)
+    return statistics
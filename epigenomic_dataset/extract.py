@@ -1,43 +1,400 @@
+import gzip
 import pandas as pd
+import numpy as np
 import os
-from typing import List
-from encodeproject import download
+import time
+from typing import Dict, List, Tuple, Union
 from pybwtool import extract as extract_bigwig
 from tqdm.auto import tqdm
-from multiprocessing import Pool, cpu_count
+from multiprocessing import cpu_count
 import warnings
+from .bigwig import BigWig
+from .download import download_file
+from .scheduler import run_pipeline, sort_by_cost
+from .manifest import (
+    get_regions_hash,
+    is_stale,
+    is_up_to_date,
+    load_manifest,
+    record_output,
+    save_manifest
+)
+from .statistics import compute_statistics
 
+ENGINES = ("native", "pybwtool")
+ANCHORS = ("center", "tss")
+# The mean of the bases is the only statistic mined
+# across the replicates of each epigenome.
+SUMMARY_STATISTICS = ("mean",)
 
-def extraction_job(
+
+def load_bed(bed_path: str) -> pd.DataFrame:
+    """Return the regions listed in the given bed file.
+
+    Parameters
+    --------------------------
+    bed_path:str,
+        Path to the bed file containing the regions of interest.
+
+    Returns
+    --------------------------
+    DataFrame with chrom, chromStart, chromEnd and strand of the regions.
+    When the bed file has no strand column, the strand is set to ".".
+    """
+    bed = pd.read_csv(bed_path, sep="\t", header=None, dtype={0: str})
+    return pd.DataFrame({
+        "chrom": bed[0].values,
+        "chromStart": bed[1].values.astype(np.int64),
+        "chromEnd": bed[2].values.astype(np.int64),
+        "strand": bed[5].values if bed.shape[1] > 5 else ".",
+    })
+
+
+def get_targets_paths(targets_path: str, window_sizes: List[int] = None) -> Dict[int, str]:
+    """Return the path where to store the targets of each window size.
+
+    Parameters
+    --------------------------
+    targets_path:str,
+        Path where to store the epigenomic bed. When window sizes are
+        given, it must contain the "{window_size}" placeholder.
+    window_sizes: List[int] = None,
+        Window sizes to mine from the regions. When None, the regions
+        are used as they are and they are mapped to the None key.
+
+    Raises
+    --------------------------
+    ValueError,
+        If window sizes are given and the targets path has no placeholder.
+
+    Returns
+    --------------------------
+    Dictionary from the window sizes, sorted from the widest,
+    to the paths where to store their targets.
+    """
+    if window_sizes is None:
+        return {None: targets_path}
+    if "{window_size}" not in targets_path:
+        raise ValueError(
+            "The targets path {} must contain the {{window_size}} placeholder "
+            "to extract multiple window sizes.".format(targets_path)
+        )
+    return {
+        window_size: targets_path.format(window_size=window_size)
+        for window_size in sorted(set(window_sizes), reverse=True)
+    }
+
+
+def validate_anchor(anchor: str):
+    """Raise a ValueError if the given window anchor is not supported."""
+    if anchor not in ANCHORS:
+        raise ValueError(
+            "Given anchor {} is not supported. The supported anchors are {}.".format(
+                anchor, ", ".join(ANCHORS)
+            )
+        )
+
+
+def get_window_offsets(regions: pd.DataFrame, window_size: int, anchor: str = "center") -> np.ndarray:
+    """Return the offsets of the windows of given size within the given regions.
+
+    Parameters
+    --------------------------
+    regions: pd.DataFrame,
+        The regions, as returned by load_bed.
+    window_size: int,
+        Size of the windows.
+    anchor: str = "center",
+        Where the windows are anchored, either "center", for windows
+        centered in the regions, as the enhancers, or "tss", for windows
+        ending at the transcription start site on the strand of the
+        regions, as the promoters. With the "tss" anchor, the windows
+        of the regions without strand are centered.
+
+    Returns
+    --------------------------
+    Array with the offset of each window from the start of its region.
+    """
+    validate_anchor(anchor)
+    widths = (regions.chromEnd - regions.chromStart).values
+    offsets = (widths - window_size)//2
+    if anchor == "tss":
+        strands = regions.strand.values
+        offsets[strands == "+"] = (widths - window_size)[strands == "+"]
+        offsets[strands == "-"] = 0
+    return offsets
+
+
+def get_window_regions(regions: pd.DataFrame, window_size: int = None, anchor: str = "center") -> pd.DataFrame:
+    """Return the windows of given size within the given regions.
+
+    Parameters
+    --------------------------
+    regions: pd.DataFrame,
+        The regions, as returned by load_bed.
+    window_size: int = None,
+        Size of the windows. When None, the regions are returned as they are.
+    anchor: str = "center",
+        Where the windows are anchored, either "center" or "tss".
+
+    Returns
+    --------------------------
+    DataFrame with chrom, chromStart, chromEnd and strand of the windows.
+    """
+    window_regions = regions.copy()
+    if window_size is not None:
+        window_regions["chromStart"] += get_window_offsets(regions, window_size, anchor)
+        window_regions["chromEnd"] = window_regions.chromStart + window_size
+    return window_regions
+
+
+def load_summarized_regions(
+    path: str,
+    regions: pd.DataFrame,
+    statistics: List[str]
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Return which of the given regions are in the summary at given path, and their statistics.
+
+    Parameters
+    --------------------------
+    path: str,
+        Path of a summary written by summarize_epigenome.
+    regions: pd.DataFrame,
+        The regions to look up in the summary.
+    statistics: List[str],
+        The statistics to read for the regions.
+
+    Returns
+    --------------------------
+    Tuple with the mask of the regions found in the summary and the
+    dictionary with their statistics. When the summary is missing,
+    no region is found.
+    """
+    found = np.zeros(len(regions), dtype=bool)
+    if not os.path.exists(path):
+        return found, {}
+    summary = pd.read_csv(path, sep="\t", dtype={"chrom": str, "strand": str})
+    columns = ["chrom", "chromStart", "chromEnd", "strand"]
+    summary = summary.drop_duplicates(columns)
+    positions = pd.MultiIndex.from_frame(summary[columns]).get_indexer(
+        pd.MultiIndex.from_frame(regions[columns])
+    )
+    found = positions >= 0
+    return found, {
+        statistic: summary[statistic].values[positions[found]]
+        for statistic in statistics
+    }
+
+
+def summarize_epigenome(
     bed_path: str,
     epigenome_path: str,
-    target_path: str,
-    url: str,
-    clear_download: bool
-):
-    # Download file if it does not already exist
-    if not os.path.exists(epigenome_path):
-        download(url, epigenome_path)
-
-    # Extract the features
-    extract_bigwig(
-        bed_path=bed_path,
-        bigwig_path=epigenome_path,
-        target=target_path
-    )
+    target_path: Union[str, Dict[int, str]],
+    statistics: List[str],
+    batch_size: int = 2048,
+    update: bool = False,
+    anchor: str = "center"
+) -> int:
+    """Write the statistics of the bigWig values in each of the bed regions.
+
+    When multiple window sizes are requested, the values of the
+    bed regions are read once and each window is anchored in them.
+    When updating existing summaries, only the regions missing from
+    them are read from the bigWig, and the rows of the regions that
+    are no longer in the bed file are dropped.
+
+    Parameters
+    --------------------------
+    bed_path:str,
+        Path to the bed file containing the regions of interest.
+    epigenome_path:str,
+        Path to the bigWig file.
+    target_path: Union[str, Dict[int, str]],
+        Path where to store the summary of the regions, or dictionary
+        from window sizes to the paths where to store their summaries.
+    statistics: List[str],
+        Statistics to compute over the bases of each region.
+    batch_size: int = 2048,
+        Number of regions whose per-base values are kept in memory at once.
+    update: bool = False,
+        Whether to reuse the regions already present in the target summaries.
+    anchor: str = "center",
+        Where the windows are anchored in the bed regions, either
+        "center" or "tss", for the promoters, whose windows end at
+        the transcription start site on the strand of the regions.
+
+    Raises
+    --------------------------
+    ValueError,
+        If a window size is larger than some of the bed regions.
+
+    Returns
+    --------------------------
+    Number of regions read from the bigWig.
+    """
+    if isinstance(target_path, str):
+        target_path = {None: target_path}
+    regions = load_bed(bed_path)
+    widths = (regions.chromEnd - regions.chromStart).values
+    for window_size in target_path:
+        if window_size is not None and (widths < window_size).any():
+            raise ValueError(
+                "The window size {} is larger than some of the regions in {}.".format(
+                    window_size, bed_path
+                )
+            )
+    offsets = {
+        window_size: get_window_offsets(regions, window_size, anchor)
+        for window_size in target_path
+        if window_size is not None
+    }
+    summaries = {
+        window_size: {
+            statistic: np.full(len(regions), np.nan)
+            for statistic in statistics
+        }
+        for window_size in target_path
+    }
+    missing = np.ones(len(regions), dtype=bool)
+    if update:
+        missing[:] = False
+        for window_size, path in target_path.items():
+            found, values = load_summarized_regions(
+                path, get_window_regions(regions, window_size, anchor), statistics
+            )
+            for statistic, statistic_values in values.items():
+                summaries[window_size][statistic][found] = statistic_values
+            missing |= ~found
+    with BigWig(epigenome_path) as bigwig:
+        for _, group in regions[missing].groupby("chrom", sort=False):
+            # Sorting the regions by position makes nearby regions
+            # share the decompressed data blocks.
+            group = group.sort_values("chromStart", kind="stable")
+            for start in range(0, len(group), batch_size):
+                batch = group.iloc[start:start+batch_size]
+                values = bigwig.values(
+                    batch.chrom.values[0],
+                    batch.chromStart.values,
+                    batch.chromEnd.values
+                )
+                for window_size, window_summaries in summaries.items():
+                    if window_size is None:
+                        window_values = values
+                    else:
+                        batch_offsets = offsets[window_size][batch.index.values]
+                        window_values = values[
+                            np.arange(len(batch))[:, None],
+                            batch_offsets[:, None] + np.arange(window_size)
+                        ]
+                    for statistic, statistic_values in compute_statistics(window_values, statistics).items():
+                        window_summaries[statistic][batch.index.values] = statistic_values
+    for window_size, path in target_path.items():
+        window_regions = get_window_regions(regions, window_size, anchor)
+        for statistic, values in summaries[window_size].items():
+            window_regions[statistic] = values
+        # Writing to a temporary file first, so that an interrupted job
+        # does not leave a partial target that would be skipped later on.
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temporary_path = "{}.tmp".format(path)
+        window_regions.to_csv(
+            temporary_path,
+            sep="\t",
+            index=False,
+            na_rep="nan",
+            compression="gzip"
+        )
+        os.replace(temporary_path, path)
+    return int(missing.sum())
+
+
+def extraction_job(
+    epigenome_path: str,
+    clear_download: bool,
+    jobs: List[Dict],
+    engine: str = "native",
+    statistics: List[str] = SUMMARY_STATISTICS
+) -> int:
+    """Extract every region set from the given downloaded bigWig.
+
+    The bigWig is downloaded beforehand by the download
+    stage of the pipeline, see _download_job.
+
+    Parameters
+    --------------------------
+    epigenome_path:str,
+        Path where the bigWig is stored.
+    clear_download: bool,
+        Whetever to delete the downloaded file after
+        all the region sets have been extracted.
+    jobs: List[Dict],
+        The region sets to extract, each with the "bed_path" of
+        the regions, the "target_path" where to store them and
+        the "anchor" of their windows.
+    engine: str = "native",
+        Engine to use to extract the regions.
+    statistics: List[str] = SUMMARY_STATISTICS,
+        Statistics to compute over the bases of each region
+        when using the native engine.
+
+    Returns
+    --------------------------
+    Number of regions extracted from the bigWig.
+    """
+    # Extract the features of every region set
+    regions = 0
+    for job in jobs:
+        if engine == "native":
+            regions += summarize_epigenome(
+                bed_path=job["bed_path"],
+                epigenome_path=epigenome_path,
+                target_path=job["target_path"],
+                statistics=statistics,
+                update=True,
+                anchor=job.get("anchor", "center")
+            )
+        else:
+            # The per-base values of a different set of regions
+            # cannot be updated, so they are extracted again.
+            if os.path.exists(job["target_path"]):
+                os.remove(job["target_path"])
+            extract_bigwig(
+                bed_path=job["bed_path"],
+                bigwig_path=epigenome_path,
+                target=job["target_path"]
+            )
+            regions += len(load_bed(job["bed_path"]))
 
     # Remove the bigwig file if required
     if clear_download:
         os.remove(epigenome_path)
+    return regions
+
 
+def _extraction_job(kwargs) -> Dict:
+    return {"regions": extraction_job(
+        kwargs["epigenome_path"],
+        kwargs["clear_download"],
+        kwargs["jobs"],
+        kwargs["engine"]
+    )}
 
-def _extraction_job(kwargs):
-    return extraction_job(**kwargs)
+
+def _download_job(kwargs) -> Dict:
+    start = time.perf_counter()
+    kwargs["telemetry"] = download_file(
+        kwargs["url"],
+        kwargs["epigenome_path"],
+        kwargs["file_size"],
+        kwargs["md5sum"]
+    )
+    kwargs["telemetry"]["download_time"] = time.perf_counter() - start
+    return kwargs
 
 
 def load_epigenomes_table(
     cell_lines: List[str],
     assembly: str,
+    metadata_path: str = None
 ) -> pd.DataFrame:
     """Return epigenomic data table.
 
@@ -47,18 +404,22 @@ def load_epigenomes_table(
         List of cell lines whose epigenomes are to retrieve.
     assembly: str,
         The genomic assembly of the data to be retrieved.
+    metadata_path: str = None,
+        Path of the epigenomes metadata to use instead of the ones
+        shipped with the package for the given assembly, such as
+        the ones of the synthetic epigenomes of the benchmarks.
 
     Returns
     ----------------------------
     Pandas DataFrame with epigenomes meta data.
     """
-    # Loading the epigenomes metadata
-    epigenomes = pd.read_csv(
-        "{pwd}/epigenomes_metadata/{assembly}.csv".format(
+    if metadata_path is None:
+        metadata_path = "{pwd}/epigenomes_metadata/{assembly}.csv".format(
             pwd=os.path.dirname(os.path.abspath(__file__)),
             assembly=assembly
         )
-    )
+    # Loading the epigenomes metadata
+    epigenomes = pd.read_csv(metadata_path)
     # Filtering epigenomes for required cell lines
     return epigenomes[epigenomes.cell_line.isin(cell_lines)]
 
@@ -70,20 +431,180 @@ def load_accession_path(root: str, accession: str) -> str:
     )
 
 
+def load_accession_summary_path(root: str, accession: str) -> str:
+    return "{root}/{accession}.summary.csv.gz".format(
+        root=root,
+        accession=accession
+    )
+
+
+def get_extraction_jobs(
+    bed_path: Union[str, List[Tuple]],
+    targets_path: str,
+    anchor: str = "center"
+) -> List[Tuple[str, str, str]]:
+    """Return the list of region sets to extract.
+
+    Parameters
+    --------------------------
+    bed_path: Union[str, List[Tuple]],
+        Either path to the bed file containing the regions of interest
+        or list of pairs of bed file paths and their targets paths,
+        optionally followed by the anchor of their windows.
+    targets_path: str,
+        Path where to store the epigenomic bed of the single bed file.
+    anchor: str = "center",
+        Anchor of the windows of the region sets not specifying it.
+
+    Returns
+    --------------------------
+    List of triples of bed file paths, targets paths and window anchors.
+    """
+    if isinstance(bed_path, str):
+        bed_path = [(bed_path, targets_path)]
+    jobs = [
+        (job[0], job[1], job[2] if len(job) > 2 else anchor)
+        for job in bed_path
+    ]
+    for _, _, job_anchor in jobs:
+        validate_anchor(job_anchor)
+    return jobs
+
+
+def load_output_regions(path: str) -> pd.DataFrame:
+    """Return the regions of the extracted epigenome at given path.
+
+    Parameters
+    --------------------------
+    path: str,
+        Path of either a summary written by the native engine
+        or of the per-base values dumped by pybwtool.
+
+    Returns
+    --------------------------
+    DataFrame with the chrom, chromStart, chromEnd and strand of the regions.
+    """
+    columns = ["chrom", "chromStart", "chromEnd", "strand"]
+    if path.endswith(".summary.csv.gz"):
+        return pd.read_csv(
+            path, sep="\t", usecols=columns, dtype={"chrom": str, "strand": str}
+        )
+    # The per-base values follow the bed fields, so
+    # only the fields of the regions are split.
+    with gzip.open(path, "rt") as f:
+        fields = [
+            (chrom, int(chromStart), int(chromEnd), strand)
+            for chrom, chromStart, chromEnd, _, _, strand, *_ in (
+                line.split("\t", 6) for line in f
+            )
+        ]
+    return pd.DataFrame(fields, columns=columns)
+
+
+def adopt_output(manifest: Dict, root: str, path: str, inputs: Dict) -> bool:
+    """Return whether the output at given path was built from the given inputs.
+
+    Outputs of builds preceding the manifest are recorded
+    in it when they match the regions of the inputs.
+
+    Parameters
+    --------------------------
+    manifest: Dict,
+        The manifest of the targets directory.
+    root: str,
+        The targets directory.
+    path: str,
+        Path of the extracted epigenome.
+    inputs: Dict,
+        The accession and the hash of the regions to extract.
+
+    Returns
+    --------------------------
+    Boolean representing whether the output can be reused.
+    """
+    if is_up_to_date(manifest, root, path, inputs):
+        return True
+    if not os.path.exists(path) or is_stale(manifest, root, path, inputs):
+        return False
+    regions = load_output_regions(path)
+    if get_regions_hash(regions) != inputs["regions"]:
+        return False
+    record_output(manifest, root, path, inputs, regions=len(regions))
+    return True
+
+
+def get_extraction_output(
+    manifest: Dict,
+    root: str,
+    accession: str,
+    regions_hash: str,
+    engine: str
+) -> Tuple[str, Dict]:
+    """Return the output to extract for given accession, if any, and its inputs.
+
+    Parameters
+    --------------------------
+    manifest: Dict,
+        The manifest of the targets directory.
+    root: str,
+        The targets directory.
+    accession: str,
+        The accession of the epigenome.
+    regions_hash: str,
+        The hash of the regions to extract.
+    engine: str,
+        Engine to use to extract the regions.
+
+    Returns
+    --------------------------
+    Tuple with the path of the output to extract, None when the existing
+    outputs are up to date, and the inputs to record in the manifest.
+    """
+    summary_path = load_accession_summary_path(root, accession)
+    dump_path = load_accession_path(root, accession)
+    inputs = {
+        "accession": accession,
+        "regions": regions_hash
+    }
+    if engine == "native":
+        if adopt_output(manifest, root, summary_path, inputs):
+            return None, inputs
+        # The per-base values of previous builds are still mined.
+        if not os.path.exists(summary_path) and adopt_output(manifest, root, dump_path, inputs):
+            return None, inputs
+        return summary_path, inputs
+    if adopt_output(manifest, root, dump_path, inputs):
+        return None, inputs
+    if adopt_output(manifest, root, summary_path, inputs):
+        return None, inputs
+    return dump_path, inputs
+
+
 def build_extraction_tasks(
-    bed_path: str,
+    bed_path: Union[str, List[Tuple]],
     cell_lines: List[str],
     assembly: str,
     epigenomes_path: str,
     target_path: str,
-    clear_download: bool
+    clear_download: bool,
+    engine: str = "native",
+    window_sizes: List[int] = None,
+    manifests: Dict[str, Dict] = None,
+    metadata_path: str = None,
+    window_anchor: str = "center"
 ) -> List:
     """Download bigwigs from ENCODE and extract regions specified in given bed file.
 
+    A single task is built for each accession, extracting
+    all the region sets that still miss it. Previous extractions
+    are reused when their manifest records the same regions,
+    and are updated with the missing regions otherwise.
+
     Parameters
     --------------------------
-    bed_path:str,
-        Either path to the bed file containing the regions of interest.
+    bed_path: Union[str, List[Tuple]],
+        Either path to the bed file containing the regions of interest
+        or list of pairs of bed file paths and their targets paths.
     cell_lines:List[str],
         List of cell lines whose epigenomes are to retrieve.
     assembly: str,
@@ -91,51 +612,132 @@ def build_extraction_tasks(
     epigenomes_path:str,
         Path where to store the epigenomic bigWig.
     target_path:str,
-        Path where to store the epigenomic bed.
+        Path where to store the epigenomic bed,
+        when a single bed file is given.
     clear_download: bool = False,
         Whetever to delete the downloaded files or not.
         By default False.
+    engine: str = "native",
+        Engine to use to extract the regions, either "native",
+        which summarizes the regions in process, or "pybwtool",
+        which dumps the per-base values of the regions.
+    window_sizes: List[int] = None,
+        Window sizes to mine from the centers of the regions.
+        The target path must contain the "{window_size}" placeholder.
+    manifests: Dict[str, Dict] = None,
+        The manifests of the targets paths, which are loaded when missing.
+        Outputs of previous builds matching the regions are recorded in them.
+    metadata_path: str = None,
+        Path of the epigenomes metadata to use instead of the packaged ones.
+    window_anchor: str = "center",
+        Where the windows are anchored in the regions of the region sets
+        not specifying it, either "center" or "tss", for the promoters.
 
     Returns
     --------------------------
     Returns list of tasks to be executed.
     """
+    if manifests is None:
+        manifests = {}
+    extraction_jobs = []
+    for bed, targets, anchor in get_extraction_jobs(bed_path, target_path, window_anchor):
+        regions = load_bed(bed)
+        targets_paths = {}
+        for window_size, path in get_targets_paths(targets, window_sizes).items():
+            if path not in manifests:
+                manifests[path] = load_manifest(path)
+            targets_paths[window_size] = (
+                path,
+                get_regions_hash(get_window_regions(regions, window_size, anchor))
+            )
+        extraction_jobs.append((bed, anchor, len(regions), targets_paths))
     # Loading the epigenomes metadata
-    epigenomes = load_epigenomes_table(cell_lines, assembly)
-    # Build the tasks
-    return [
-        {
-            "bed_path": bed_path,
+    epigenomes = load_epigenomes_table(cell_lines, assembly, metadata_path)
+    tasks = []
+    for _, epigenome in epigenomes.iterrows():
+        jobs = []
+        records = []
+        for bed, anchor, regions_number, targets_paths in extraction_jobs:
+            # Where to store the extracted regions
+            missing_targets = {}
+            for window_size, (path, regions_hash) in targets_paths.items():
+                output_path, inputs = get_extraction_output(
+                    manifests[path],
+                    path,
+                    epigenome.accession,
+                    regions_hash,
+                    engine
+                )
+                if output_path is not None:
+                    missing_targets[window_size] = output_path
+                    records.append((path, output_path, inputs, regions_number))
+            if missing_targets:
+                jobs.append({
+                    "bed_path": bed,
+                    "anchor": anchor,
+                    "target_path": (
+                        missing_targets[None]
+                        if window_sizes is None
+                        else missing_targets
+                    )
+                })
+        if not jobs:
+            continue
+        tasks.append({
             # Where to store the downloaded bigWig file
             "epigenome_path": "{epigenomes_path}/{accession}.{file_format}".format(
                 epigenomes_path=epigenomes_path,
                 **epigenome.to_dict()
             ),
-            # Where to store the extracted regions
-            "target_path": load_accession_path(target_path, epigenome.accession),
             "url": epigenome.url,
-            "clear_download": clear_download
-        }
-        for _, epigenome in epigenomes.iterrows()
-        if not os.path.exists("{target_path}/{accession}.bed.gz".format(target_path=target_path, **epigenome.to_dict()))
-    ]
+            "clear_download": clear_download,
+            "jobs": jobs,
+            "engine": engine,
+            "file_size": int(epigenome.file_size),
+            # The MD5 hashes are only validated when listed in the metadata.
+            "md5sum": (
+                epigenome.md5sum
+                if pd.notna(epigenome.get("md5sum"))
+                else None
+            ),
+            # The outputs to record in the manifests once extracted
+            "records": records
+        })
+    return tasks
 
 
 def extract(
-    bed_path: str,
+    bed_path: Union[str, List[Tuple]],
     cell_lines: List[str],
     assembly: str,
     epigenomes_path: str = "epigenomes",
     targets_path: str = "targets",
     clear_download: bool = False,
-    workers: int = -1
+    workers: int = -1,
+    engine: str = "native",
+    window_sizes: List[int] = None,
+    download_workers: int = 4,
+    max_staged_bytes: int = None,
+    telemetry: List[Dict] = None,
+    metadata_path: str = None,
+    window_anchor: str = "center"
 ):
     """Download bigwigs from ENCODE and extract regions specified in given bed file.
 
+    Every bigWig is downloaded once and all the given
+    region sets are extracted from it before releasing it.
+    The downloads run in their own pool of threads, and each
+    bigWig is extracted as soon as its download completes.
+    Interrupted downloads are resumed from the partial file.
+    The total size of the bigWigs being downloaded or extracted
+    at once can be bounded with a budget in bytes, using
+    the file sizes listed in the epigenomes metadata.
+
     Parameters
     --------------------------
-    bed_path:str,
-        Either path to the bed file containing the regions of interest.
+    bed_path: Union[str, List[Tuple]],
+        Either path to the bed file containing the regions of interest
+        or list of pairs of bed file paths and their targets paths.
     cell_lines:List[str],
         List of cell lines whose epigenomes are to retrieve.
     assembly: str,
@@ -143,13 +745,43 @@ def extract(
     epigenomes_path:str,
         Path where to store the epigenomic bigWig.
     targets_path:str,
-        Path where to store the epigenomic bed.
+        Path where to store the epigenomic bed,
+        when a single bed file is given.
     clear_download: bool = False,
         Whetever to delete the downloaded files or not.
         By default False.
     workers: int = -1,
         Number of workers to use.
         The default, -1, set the workers to the maximum available.
+    engine: str = "native",
+        Engine to use to extract the regions, either "native",
+        which reads the bigWig files in process and only writes
+        the mean of the bases of each region, which is the value
+        mined across the replicates, or "pybwtool", which
+        dumps the per-base values of each region.
+    window_sizes: List[int] = None,
+        Window sizes to mine from the centers of the regions,
+        which must be at least as wide as the largest window.
+        The bigWig values of the regions are read once and each
+        window size is written in its own targets directory, so
+        the targets path must contain the "{window_size}" placeholder.
+        Only supported by the native engine.
+    download_workers: int = 4,
+        Number of bigWig files to download concurrently.
+    max_staged_bytes: int = None,
+        Maximum total size of the bigWig files that are being
+        downloaded or extracted at once. When clear_download is
+        True, this bounds the disk space used by the bigWig files.
+        By default, the size is not bounded.
+    telemetry: List[Dict] = None,
+        List where to append the measurements of each bigWig.
+    metadata_path: str = None,
+        Path of the epigenomes metadata to use instead of the packaged ones.
+    window_anchor: str = "center",
+        Where the windows are anchored in the regions of the region sets
+        not specifying it, either "center", as for the enhancers, or "tss",
+        as for the promoters, whose windows end at the transcription start
+        site on the strand of the regions.
 
     Raises
     --------------------------
@@ -157,19 +789,55 @@ def extract(
         If workers number is neiter -1 nor a strictly positive integer.
     ValueError,
         If given nan threshold is not a float value between 0 and 1.
+    ValueError,
+        If given engine is not supported.
+    ValueError,
+        If window sizes are requested with the pybwtool engine.
+    ValueError,
+        If given window anchor is not supported.
     """
+    if engine not in ENGINES:
+        raise ValueError(
+            "Given engine {} is not supported. The supported engines are {}.".format(
+                engine, ", ".join(ENGINES)
+            )
+        )
+    if window_sizes is not None and engine != "native":
+        raise ValueError(
+            "Multiple window sizes are only supported by the native engine."
+        )
     # Creating target directory if doesn't exist already
     os.makedirs(epigenomes_path, exist_ok=True)
-    os.makedirs(targets_path, exist_ok=True)
+    for _, targets, _ in get_extraction_jobs(bed_path, targets_path, window_anchor):
+        for path in get_targets_paths(targets, window_sizes).values():
+            os.makedirs(path, exist_ok=True)
     # Create the building tasks list
+    manifests = {}
     tasks = build_extraction_tasks(
         bed_path,
         cell_lines,
         assembly,
         epigenomes_path,
         targets_path,
-        clear_download
+        clear_download,
+        engine,
+        window_sizes,
+        manifests,
+        metadata_path,
+        window_anchor
     )
+    # Saving the outputs of previous builds recorded while building the tasks
+    for root, manifest in manifests.items():
+        save_manifest(root, manifest)
+
+    def record_outputs(task: Dict):
+        roots = set()
+        for root, output_path, inputs, regions_number in task["records"]:
+            record_output(manifests[root], root, output_path, inputs, regions=regions_number)
+            roots.add(root)
+        for root in roots:
+            save_manifest(root, manifests[root])
+
     # Set workers number
     if workers == -1:
         workers = cpu_count()
@@ -181,12 +849,20 @@ def extract(
     if workers < 1:
         raise ValueError(
             "Given workers number {} is neither -1 or a strictly positive integer.".format(workers))
+    if download_workers < 1:
+        raise ValueError(
+            "Given download workers number {} is not a strictly positive integer.".format(download_workers))
+    # Starting from the largest bigWigs, so that they do
+    # not end up running alone at the end of the extraction
+    tasks, _ = sort_by_cost(tasks, [task["file_size"] for task in tasks])
     # Downloading and elaborating data
-    with Pool(workers) as p:
-        list(tqdm(
-            p.imap(_extraction_job, tasks),
-            total=len(tasks),
-            desc="Parsing epigenomes"
-        ))
-        p.close()
-        p.join()
+    run_pipeline(
+        tasks,
+        _download_job,
+        _extraction_job,
+        workers,
+        download_workers,
+        max_staged_bytes,
+        on_completed=record_outputs,
+        telemetry=telemetry
+    )
@@ -0,0 +1,175 @@
+"""Submodule providing a streaming loader of the epigenomic data."""
+from typing import Generator, Tuple
+import json
+import os
+import numpy as np
+import pandas as pd
+from .columnar import decode_values, get_columnar_path, read_index
+from .load_epigenomes import (
+    DTYPES,
+    apply_tpm_thresholds,
+    get_metric_columns,
+    read_labels,
+    retrieve_epigenomes,
+    validate_tpm_thresholds
+)
+from .regions import align_labels
+
+
+def read_data_index(data_path: str, use_columnar: bool) -> pd.MultiIndex:
+    """Return the regions index of the data, in the order of their batches.
+
+    Only the index is read, so that the labels are aligned once
+    for all the batches instead of once for each of them.
+    """
+    if use_columnar:
+        path = get_columnar_path(data_path)
+        with open(os.path.join(path, "metadata.json"), "r") as f:
+            return read_index(path, json.load(f))
+    return pd.read_csv(
+        data_path,
+        index_col=[0, 1, 2, 3],
+        header=None,
+        skiprows=2,
+        usecols=list(range(len(DTYPES))),
+        dtype=dict(enumerate(DTYPES.values()))
+    ).index
+
+
+def iter_csv_batches(
+    data_path: str,
+    metric: str,
+    batch_size: int
+) -> Generator[np.ndarray, None, None]:
+    """Yield the values of given metric from the data CSV, in batches."""
+    _, selected = get_metric_columns(data_path, metric)
+    with pd.read_csv(
+        data_path,
+        header=None,
+        skiprows=2,
+        usecols=selected,
+        dtype=np.float64,
+        chunksize=batch_size
+    ) as reader:
+        for chunk in reader:
+            yield chunk.to_numpy(dtype=np.float64)
+
+
+def iter_columnar_batches(
+    path: str,
+    metric: str,
+    batch_size: int
+) -> Generator[np.ndarray, None, None]:
+    """Yield the values of given metric from the columnar format, in batches."""
+    with open(os.path.join(path, "metadata.json"), "r") as f:
+        metadata = json.load(f)
+    selected = [
+        i for i, column in enumerate(metadata["columns"])
+        if metric in column
+    ]
+    values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+    for start in range(0, values.shape[0], batch_size):
+        yield decode_values(
+            np.array(values[start:start + batch_size, selected]),
+            metadata.get("dtype", "float64"),
+            "float64"
+        )
+
+
+def iter_epigenomes(
+    cell_line: str = "K562",
+    assembly: str = "hg38",
+    dataset: str = "fantom",
+    region: str = "promoters",
+    metric: str = "mean",
+    window_size: int = 256,
+    root: str = "datasets",
+    binarize: bool = False,
+    min_active_tpm_value: float = 1,
+    max_inactive_tpm_value: float = 1,
+    verbose: int = 2,
+    batch_size: int = 10000
+) -> Generator[Tuple[np.ndarray, np.ndarray], None, None]:
+    """Yield epigenomic data and labels for given parameters, in batches.
+
+    Differently from load_epigenomes, the data are read incrementally,
+    so that only a batch of regions is kept in memory at once. The
+    labels of the requested cell line, a single column, are read fully.
+    Since the gray zone is removed from each batch, the batches may
+    contain fewer than batch_size regions.
+
+    Parameters
+    ----------------------------------------
+    cell_line: str = "K562",
+        Cell line to consider. By default K562.
+        Currently available cell lines are
+        listed in the repository README file.
+    assembly: str,
+        The genomic assembly of the data to be retrieved.
+    dataset: str = "fantom",
+        Dataset to consider. By default fantom.
+        Currently available datasets are
+        listed in the repository README file.
+    region: str = "promoters",
+        Region to consider. By default promoters.
+        Currently available region are
+        listed in the repository README file.
+    metric: str = "mean",
+        The metric to load.
+    window_size: int = 256,
+        Window size to consider. By default 256.
+        Currently available window sizes are
+        listed in the repository README file.
+    root: str = "datasets"
+        Where to store the downloaded data.
+    binarize: bool = False,
+        Whether to binarize the TPM values.
+    min_active_tpm_value: float = 1,
+        Minimum TPM value.
+    max_inactive_tpm_value: float = 1,
+        Maximum TPM value.
+        Values between the minimum and maximum will be dropped.
+    verbose: int = 2,
+        Verbosity level.
+    batch_size: int = 10000,
+        Number of regions to read at once.
+
+    Returns
+    ----------------------------------------
+    Generator of tuples with input and output NumPy arrays.
+    """
+    validate_tpm_thresholds(min_active_tpm_value, max_inactive_tpm_value)
+
+    data_path, label_path, use_columnar = retrieve_epigenomes(
+        cell_line=cell_line,
+        assembly=assembly,
+        dataset=dataset,
+        region=region,
+        window_size=window_size,
+        root=root,
+        verbose=verbose
+    )
+
+    # Making sure the labels are aligned with the data, so that
+    # the labels of each batch are the rows at the same positions.
+    labels = align_labels(
+        read_data_index(data_path, use_columnar),
+        read_labels(label_path, cell_line)
+    ).to_numpy()
+
+    if use_columnar:
+        batches = iter_columnar_batches(
+            get_columnar_path(data_path), metric, batch_size
+        )
+    else:
+        batches = iter_csv_batches(data_path, metric, batch_size)
+
+    start = 0
+    for X in batches:
+        y = labels[start:start + len(X)]
+        start += len(X)
+        X, y = apply_tpm_thresholds(
+            X, y, binarize, min_active_tpm_value, max_inactive_tpm_value
+        )
+        if len(X) > 0:
+            yield X, y
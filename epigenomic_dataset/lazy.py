@@ -0,0 +1,69 @@
+"""Submodule providing the lazy loading of the attributes of a package.
+
+The attributes of a package, and its submodules, are imported on first
+access, so that importing the package does not import the dependencies
+of the submodules that are never used, following PEP 562.
+"""
+import importlib
+import importlib.util
+import sys
+from types import ModuleType
+from typing import Callable, Dict, List, Tuple
+
+
+class LazyModule(ModuleType):
+    """Package whose lazy attributes are not replaced by their submodules.
+
+    Importing a submodule sets it as an attribute of its package, which
+    would hide the attribute of the package with the same name, such as
+    the load_epigenomes function of the load_epigenomes submodule.
+    """
+
+    def __setattr__(self, name: str, value):
+        if (
+            isinstance(value, ModuleType)
+            and name in self.__dict__.get("_lazy_attributes", {})
+        ):
+            return
+        super().__setattr__(name, value)
+
+
+def attach(package_name: str, attributes: Dict[str, str]) -> Tuple[Callable, Callable]:
+    """Return the __getattr__ and __dir__ loading lazily the given attributes.
+
+    Parameters
+    ----------------------------
+    package_name: str,
+        Name of the package, to be called with __name__.
+    attributes: Dict[str, str],
+        Mapping from the names of the attributes to
+        the submodules where they are defined.
+
+    Returns
+    ----------------------------
+    Tuple with the __getattr__ and __dir__ functions of the package.
+    """
+    package = sys.modules[package_name]
+    package._lazy_attributes = attributes
+    package.__class__ = LazyModule
+
+    def __getattr__(name: str):
+        if name not in attributes:
+            # The submodules are also imported on first access.
+            if name.startswith("__") or importlib.util.find_spec("{}.{}".format(package_name, name)) is None:
+                raise AttributeError(
+                    "module {} has no attribute {}".format(package_name, name)
+                )
+            return importlib.import_module("{}.{}".format(package_name, name))
+        value = getattr(
+            importlib.import_module(attributes[name], package_name),
+            name
+        )
+        # Storing the attribute, so that it is imported once.
+        ModuleType.__setattr__(package, name, value)
+        return value
+
+    def __dir__() -> List[str]:
+        return sorted(set(package.__dict__) | set(attributes))
+
+    return __getattr__, __dir__
@@ -1,11 +1,369 @@
-from typing import Tuple
+from typing import Dict, List, Tuple, Union
 import os
-from downloaders import BaseDownloader
+import numpy as np
 import pandas as pd
+from .columnar import encode_values, get_columnar_path, read_columnar, validate_dtype
+from .logging import logger
+from .cache import get_cache_key, load_cached, store_cached
+from .regions import align_labels, compact_index
+
+
+DTYPES = {
+    "chrom": "str",
+    "chromStart": "int",
+    "chromEnd": "int",
+    "strand": "str"
+}
+
+
+def get_metric_columns(data_path: str, metric: str) -> Tuple[pd.MultiIndex, List[int]]:
+    """Return the columns of given metric in the data CSV and their positions.
+
+    Only the header is decompressed here, so that the positions can
+    be used to avoid parsing the columns of the other metrics.
+
+    Parameters
+    ----------------------------------------
+    data_path: str,
+        Path of the compressed CSV with the data.
+    metric: str,
+        The metric to load.
+
+    Returns
+    ----------------------------------------
+    Return tuple with the selected columns and their positions.
+    """
+    header = pd.read_csv(data_path, header=[0, 1], nrows=0).columns
+    selected = [
+        i for i, col in enumerate(header)
+        if i >= len(DTYPES) and metric in col
+    ]
+    return header[selected], selected
+
+
+def normalize_cell_line(cell_line: str) -> str:
+    """Return the name of given cell line as used in the labels columns."""
+    return cell_line.replace("-", "").upper()
+
+
+def read_labels(label_path: str, cell_line: Union[str, List[str]]) -> pd.DataFrame:
+    """Return the labels of given cell lines.
+
+    Since the labels of all the cell lines are stored in the same
+    file, the labels of multiple cell lines are parsed at once.
+
+    Parameters
+    ----------------------------------------
+    label_path: str,
+        Path of the compressed BED with the labels.
+    cell_line: Union[str, List[str]],
+        Cell line or cell lines to consider.
+
+    Raises
+    ----------------------------------------
+    ValueError,
+        If a cell line is not present in the labels.
+
+    Returns
+    ----------------------------------------
+    Return DataFrame with the labels of the cell lines, indexed by region.
+    """
+    cell_lines = [cell_line] if isinstance(cell_line, str) else cell_line
+    # Normalize the cell lines
+    normalized_cell_lines = list(dict.fromkeys(
+        normalize_cell_line(cell_line)
+        for cell_line in cell_lines
+    ))
+
+    columns = pd.read_csv(label_path, sep="\t", nrows=0).columns[len(DTYPES):]
+
+    for normalized_cell_line in normalized_cell_lines:
+        if normalized_cell_line not in columns:
+            raise ValueError(
+                (
+                    "The requested cell line {} is not present in the labels. "
+                    "The available cell lines are {}"
+                ).format(normalized_cell_line, ", ".join(columns))
+            )
+
+    # Query for the requested cell lines
+    return pd.read_csv(
+        label_path,
+        index_col=[0, 1, 2, 3],
+        usecols=[*DTYPES, *normalized_cell_lines],
+        sep="\t",
+        low_memory=False,
+        dtype=DTYPES
+    )[normalized_cell_lines]
+
+
+def parse_epigenomes(
+    data_path: str,
+    label_path: str,
+    cell_line: str,
+    metric: str,
+    use_columnar: bool,
+    labels: pd.DataFrame = None
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Return the epigenomic data and the labels parsed from given files.
+
+    Parameters
+    ----------------------------------------
+    data_path: str,
+        Path of the compressed CSV with the data.
+    label_path: str,
+        Path of the compressed BED with the labels.
+    cell_line: str,
+        Cell line to consider.
+    metric: str,
+        The metric to load.
+    use_columnar: bool,
+        Whether to load the data from the columnar format.
+    labels: pd.DataFrame = None,
+        The labels already parsed from the label file, including the
+        ones of the cell line. By default, they are parsed here.
+
+    Returns
+    ----------------------------------------
+    Return tuple with input and output DataFrames, aligned.
+    """
+    if labels is None:
+        y = read_labels(label_path, cell_line)
+    else:
+        y = labels[[normalize_cell_line(cell_line)]]
+
+    if use_columnar:
+        # The values are decoded as the ones parsed from the CSV,
+        # and only then converted to the requested dtype.
+        X = read_columnar(
+            get_columnar_path(data_path),
+            columns=lambda col: metric in col,
+            dtype="float64"
+        )
+    else:
+        columns, selected = get_metric_columns(data_path, metric)
+        X = pd.read_csv(
+            data_path,
+            index_col=[0, 1, 2, 3],
+            header=None,
+            skiprows=2,
+            usecols=list(range(len(DTYPES))) + selected,
+            low_memory=False,
+            dtype=dict(enumerate(DTYPES.values()))
+        )
+
+        X.index.rename(
+            list(DTYPES.keys()),
+            inplace=True
+        )
+
+        X.columns = columns
+
+    X = X.droplevel(1, axis=1)
+    X.index = compact_index(X.index)
+
+    # Making sure the two datasets indices are aligned
+    y = align_labels(X.index, y)
+
+    return X, y
+
+
+def validate_tpm_thresholds(min_active_tpm_value: float, max_inactive_tpm_value: float):
+    """Raise a ValueError if the given TPM thresholds are not consistent."""
+    if max_inactive_tpm_value > min_active_tpm_value:
+        raise ValueError(
+            "The maximum inactive TPM value is higher ",
+            "than the given minimum active TPM value."
+        )
+
+
+def get_tpm_mask(
+    y: Union[pd.DataFrame, np.ndarray],
+    min_active_tpm_value: float,
+    max_inactive_tpm_value: float
+) -> np.ndarray:
+    """Return the boolean mask of the regions out of the gray zone.
+
+    Parameters
+    ----------------------------------------
+    y: Union[pd.DataFrame, np.ndarray],
+        The TPM values.
+    min_active_tpm_value: float,
+        Minimum TPM value.
+    max_inactive_tpm_value: float,
+        Maximum TPM value.
+        Values between the minimum and maximum are in the gray zone.
+
+    Returns
+    ----------------------------------------
+    Return boolean array with the regions to keep.
+    """
+    if min_active_tpm_value == max_inactive_tpm_value:
+        return np.ones(len(y), dtype=bool)
+    return ~np.asarray(
+        (y > max_inactive_tpm_value) & (y < min_active_tpm_value)
+    ).flatten()
+
+
+def apply_tpm_thresholds(
+    X: Union[pd.DataFrame, np.ndarray],
+    y: Union[pd.DataFrame, np.ndarray],
+    binarize: bool,
+    min_active_tpm_value: float,
+    max_inactive_tpm_value: float
+) -> Tuple[Union[pd.DataFrame, np.ndarray], Union[pd.DataFrame, np.ndarray]]:
+    """Return data and labels without the gray zone, optionally binarized.
+
+    Parameters
+    ----------------------------------------
+    X: Union[pd.DataFrame, np.ndarray],
+        The epigenomic data.
+    y: Union[pd.DataFrame, np.ndarray],
+        The TPM values, aligned with the data.
+    binarize: bool,
+        Whether to binarize the TPM values.
+    min_active_tpm_value: float,
+        Minimum TPM value.
+    max_inactive_tpm_value: float,
+        Maximum TPM value.
+        Values between the minimum and maximum will be dropped.
+
+    Returns
+    ----------------------------------------
+    Return tuple with input and output data.
+    """
+    # If the minimum and maximum values are not equal,
+    # we need to drop the unknown values
+    if min_active_tpm_value != max_inactive_tpm_value:
+        mask = get_tpm_mask(y, min_active_tpm_value, max_inactive_tpm_value)
+        y = y[mask]
+        X = X[mask]
+
+    if binarize:
+        y = y > min_active_tpm_value
+
+    return X, y
+
+
+def cast_values(X: pd.DataFrame, dtype: str) -> pd.DataFrame:
+    """Return the epigenomic data converted to the given dtype.
+
+    When the dtype is smaller, the memory saved and the maximum
+    absolute difference from the values before the conversion
+    are logged.
+
+    Parameters
+    ----------------------------------------
+    X: pd.DataFrame,
+        The epigenomic data.
+    dtype: str,
+        The dtype to convert the data to.
+
+    Raises
+    ----------------------------------------
+    ValueError,
+        If some of the values do not fit in the given dtype.
+
+    Returns
+    ----------------------------------------
+    Return the converted epigenomic data.
+    """
+    if (X.dtypes == dtype).all():
+        return X
+    values = X.to_numpy()
+    cast = encode_values(values, dtype)
+    if cast.itemsize >= values.itemsize:
+        return pd.DataFrame(cast, index=X.index, columns=X.columns)
+    difference = np.abs(cast.astype(np.float64) - values)
+    logger.info(
+        "Converted the data from %s to %s, saving %.1f MB, with a maximum "
+        "absolute difference of %g.",
+        values.dtype, dtype, (values.nbytes - cast.nbytes)/2**20,
+        np.max(difference, initial=0, where=~np.isnan(difference))
+    )
+    return pd.DataFrame(cast, index=X.index, columns=X.columns)
+
+
+def retrieve_epigenomes(
+    cell_line: str,
+    assembly: str,
+    dataset: str,
+    region: str,
+    window_size: int,
+    root: str,
+    verbose: int
+) -> Tuple[str, str, bool]:
+    """Download, if needed, the data and labels for given parameters.
+
+    Parameters
+    ----------------------------------------
+    cell_line: str,
+        Cell line to consider.
+    assembly: str,
+        The genomic assembly of the data to be retrieved.
+    dataset: str,
+        Dataset to consider.
+    region: str,
+        Region to consider.
+    window_size: int,
+        Window size to consider.
+    root: str,
+        Where to store the downloaded data.
+    verbose: int,
+        Verbosity level.
+
+    Returns
+    ----------------------------------------
+    Return tuple with the path of the data, the path of the labels
+    and whether the data are available in the columnar format.
+    """
+    repository = "https://github.com/LucaCappelletti94/epigenomic_dataset/blob/master/preprocessed"
+    get_parameter = "?raw=true"
+    data_path_placeholder = "{{root}}/{dataset}/{assembly}/{window_size}/{region}/{cell_line}.csv.xz".format(
+        root=root,
+        dataset=dataset,
+        assembly=assembly,
+        window_size=window_size,
+        region=region,
+        cell_line=cell_line
+    )
+    data_path = data_path_placeholder.format(root=root)
+    label_path_placeholder = "{{root}}/{dataset}/{assembly}/{window_size}/{region}.bed.xz".format(
+        root=root,
+        dataset=dataset,
+        assembly=assembly,
+        window_size=window_size,
+        region=region
+    )
+    label_path = label_path_placeholder.format(root=root)
+
+    use_columnar = os.path.exists(get_columnar_path(data_path))
+
+    urls, paths = [], []
+    if not use_columnar:
+        urls.append(data_path_placeholder.format(root=repository)+get_parameter)
+        paths.append(data_path)
+    urls.append(label_path_placeholder.format(root=repository)+get_parameter)
+    paths.append(label_path)
+
+    missing = [
+        (url, path)
+        for url, path in zip(urls, paths)
+        if not os.path.exists(path)
+    ]
+    if missing:
+        # The downloader and its dependencies are only
+        # imported when some of the files are missing.
+        from downloaders import BaseDownloader
+        downloader = BaseDownloader(target_directory=root, verbose=verbose)
+        for url, path in missing:
+            downloader.download(urls=url, paths=path)
+
+    return data_path, label_path, use_columnar
 
 
 def load_epigenomes(
-    cell_line: str = "K562",
+    cell_line: Union[str, List[str]] = "K562",
     assembly: str = "hg38",
     dataset: str = "fantom",
     region: str = "promoters",
@@ -15,14 +373,26 @@ def load_epigenomes(
     binarize: bool = False,
     min_active_tpm_value: float = 1,
     max_inactive_tpm_value: float = 1,
-    verbose: int = 2
-) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    verbose: int = 2,
+    cache: bool = False,
+    cache_size: int = 2**32,
+    workers: int = None,
+    dtype: str = "float64"
+) -> Union[Tuple[pd.DataFrame, pd.DataFrame], Dict[str, Tuple[pd.DataFrame, pd.DataFrame]]]:
     """Return epigenomic data and labels for given parameters.
 
+    When the data of the cell line are available in the columnar
+    format written by concatenate, they are loaded from there
+    instead of downloading and parsing the compressed CSV.
+
+    When a list of cell lines is given, the label file shared by the
+    cell lines is parsed once, and the data of the cell lines are
+    parsed concurrently.
+
     Parameters
     ----------------------------------------
-    cell_line: str = "K562",
-        Cell line to consider. By default K562.
+    cell_line: Union[str, List[str]] = "K562",
+        Cell line or list of cell lines to consider. By default K562.
         Currently available cell lines are
         listed in the repository README file.
     assembly: str,
@@ -52,112 +422,133 @@ def load_epigenomes(
         Values between the minimum and maximum will be dropped.
     verbose: int = 2,
         Verbosity level.
+    cache: bool = False,
+        Whether to cache the parsed data and labels under the
+        root, so that following calls with the same parameters
+        do not need to parse the compressed files again.
+        The cached entries are invalidated when the source files change.
+    cache_size: int = 2**32,
+        Maximum size in bytes of the cache, after which
+        the least recently used entries are removed.
+    workers: int = None,
+        Number of threads parsing the data of the cell lines
+        when a list of cell lines is given. By default, the
+        minimum between the cell lines and the CPUs.
+    dtype: str = "float64",
+        The dtype of the returned epigenomic data, either
+        float64, float32 or float16. The memory saved and
+        the maximum absolute difference from the parsed
+        values are logged.
 
     Returns
     ----------------------------------------
-    Return tuple with input and output DataFrames.
+    Return tuple with input and output DataFrames, or when a list of
+    cell lines is given, dictionary with such tuple for each cell line.
     """
 
-    if max_inactive_tpm_value > min_active_tpm_value:
-        raise ValueError(
-            "The maximum inactive TPM value is higher ",
-            "than the given minimum active TPM value."
-        )
-
-    repository = "https://github.com/LucaCappelletti94/epigenomic_dataset/blob/master/preprocessed"
-    get_parameter = "?raw=true"
-    data_path_placeholder = "{{root}}/{dataset}/{assembly}/{window_size}/{region}/{cell_line}.csv.xz".format(
-        root=root,
-        dataset=dataset,
-        assembly=assembly,
-        window_size=window_size,
-        region=region,
-        cell_line=cell_line
-    )
-    data_path = data_path_placeholder.format(root=root)
-    label_path_placeholder = "{{root}}/{dataset}/{assembly}/{window_size}/{region}.bed.xz".format(
-        root=root,
-        dataset=dataset,
-        assembly=assembly,
-        window_size=window_size,
-        region=region
-    )
-    label_path = label_path_placeholder.format(root=root)
-
-    downloader = BaseDownloader(target_directory=root, verbose=verbose)
-
-    downloader.download(
-        urls=data_path_placeholder.format(root=repository)+get_parameter,
-        paths=data_path
-    )
-    downloader.download(
-        urls=label_path_placeholder.format(root=repository)+get_parameter,
-        paths=label_path
-    )
-
-    dtypes = {
-        "chrom": "str",
-        "chromStart": "int",
-        "chromEnd": "int",
-        "strand": "str"
-    }
-
-    X = pd.read_csv(
-        data_path,
-        index_col=[0, 1, 2, 3],
-        header=[0, 1],
-        low_memory=False,
-        dtype=dtypes
-    )
+    validate_tpm_thresholds(min_active_tpm_value, max_inactive_tpm_value)
+    validate_dtype(dtype, ("float64", "float32", "float16"))
 
-    X.index.rename(
-        list(dtypes.keys()),
-        inplace=True
-    )
-
-    X = X[[
-        col
-        for col in X.columns
-        if metric in col
-    ]]
+    cell_lines = [cell_line] if isinstance(cell_line, str) else list(cell_line)
 
-    X = X.droplevel(1, axis=1)
-
-    y = pd.read_csv(
-        label_path,
-        index_col=[0, 1, 2, 3],
-        sep="\t",
-        low_memory=False,
-        dtype=dtypes
-    )
+    jobs = {}
+    for current_cell_line in cell_lines:
+        data_path, label_path, use_columnar = retrieve_epigenomes(
+            cell_line=current_cell_line,
+            assembly=assembly,
+            dataset=dataset,
+            region=region,
+            window_size=window_size,
+            root=root,
+            verbose=verbose
+        )
+        columnar_path = get_columnar_path(data_path)
+        jobs[current_cell_line] = dict(
+            data_path=data_path,
+            label_path=label_path,
+            use_columnar=use_columnar,
+            sources=[
+                os.path.join(columnar_path, "values.npy") if use_columnar else data_path,
+                label_path
+            ],
+            key=get_cache_key(
+                cell_line=current_cell_line,
+                assembly=assembly,
+                dataset=dataset,
+                region=region,
+                metric=metric,
+                window_size=window_size
+            )
+        )
 
-    # Making sure the two datasets indices are aligned
-    y = y.loc[X.index]
+    results = {}
+    if cache:
+        for current_cell_line, job in jobs.items():
+            cached = load_cached(root, job["key"], job["sources"])
+            if cached is not None:
+                results[current_cell_line] = cached
 
-    # Normalize the cell lines
-    normalized_cell_line = cell_line.replace("-", "").upper()
+    missing = [
+        current_cell_line
+        for current_cell_line in jobs
+        if current_cell_line not in results
+    ]
 
-    if normalized_cell_line not in y.columns:
-        raise ValueError(
-            (
-                "The requested cell line {} is not present in the labels. "
-                "The available cell lines are {}"
-            ).format(normalized_cell_line, ", ".join(y.columns))
+    if len(missing) == 1:
+        job = jobs[missing[0]]
+        results[missing[0]] = parse_epigenomes(
+            job["data_path"], job["label_path"], missing[0], metric, job["use_columnar"]
         )
+    elif missing:
+        # All the cell lines share the same label file,
+        # whose columns are the cell lines, so it is parsed once.
+        labels = read_labels(jobs[missing[0]]["label_path"], missing)
+        if workers is None:
+            workers = min(len(missing), os.cpu_count())
+        # The decompression and the parsing of the data mostly
+        # release the GIL, so threads avoid copying the labels.
+        # The pool is imported here to keep the import of the loader light.
+        from multiprocessing.pool import ThreadPool
+        with ThreadPool(workers) as p:
+            parsed = p.starmap(
+                parse_epigenomes,
+                [
+                    (
+                        jobs[current_cell_line]["data_path"],
+                        jobs[current_cell_line]["label_path"],
+                        current_cell_line,
+                        metric,
+                        jobs[current_cell_line]["use_columnar"],
+                        labels
+                    )
+                    for current_cell_line in missing
+                ]
+            )
+        results.update(zip(missing, parsed))
 
-    # Query for the requested cell line
-    y = y[[normalized_cell_line]]
+    if cache:
+        for current_cell_line in missing:
+            X, y = results[current_cell_line]
+            store_cached(
+                root,
+                jobs[current_cell_line]["key"],
+                jobs[current_cell_line]["sources"],
+                X, y,
+                cache_size
+            )
 
-    # If the minimum and maximum values are not equal,
-    # we need to drop the unknown values
-    if min_active_tpm_value != max_inactive_tpm_value:
-        gray_zone_values = (
-            (y > max_inactive_tpm_value) & (y < min_active_tpm_value)
-        ).values.flatten()
-        y = y[~gray_zone_values]
-        X = X[~gray_zone_values]
-    
-    if binarize:
-        y = y > min_active_tpm_value
+    for current_cell_line in cell_lines:
+        X, y = apply_tpm_thresholds(
+            *results[current_cell_line],
+            binarize,
+            min_active_tpm_value,
+            max_inactive_tpm_value
+        )
+        results[current_cell_line] = cast_values(X, dtype), y
 
-    return X, y
+    if isinstance(cell_line, str):
+        return results[cell_line]
+    return {
+        current_cell_line: results[current_cell_line]
+        for current_cell_line in cell_lines
+    }
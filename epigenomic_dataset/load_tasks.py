@@ -1,8 +1,87 @@
 """Module providing straightforward methods to load the tasks."""
-from typing import Tuple, Dict
+from typing import Tuple, Dict, Union
+import numpy as np
 import pandas as pd
 from tqdm.auto import tqdm
 from .load_epigenomes import load_epigenomes
+from .sweep import ThresholdSweep
+
+
+def load_region(
+    cell_line: str,
+    assembly: str,
+    dataset: str,
+    region: str,
+    metric: str,
+    window_size: int,
+    root: str,
+    binarize: bool,
+    min_active_tpm_value: float,
+    max_inactive_tpm_value: float,
+    verbose: int,
+    regions_cache: Dict = None
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Return epigenomic data and labels of given region, loading them at most once.
+
+    The regions are stored in the given cache before the binarization,
+    so that the tasks with and without binarized labels share them.
+
+    Parameters
+    ----------------------------------------
+    cell_line: str,
+        Cell line to consider.
+    assembly: str,
+        The genomic assembly of the data to be retrieved.
+    dataset: str,
+        Dataset to consider.
+    region: str,
+        Region to consider.
+    metric: str,
+        The metric to load.
+    window_size: int,
+        Window size to consider.
+    root: str,
+        Where to store the downloaded data.
+    binarize: bool,
+        Whether to binarize the TPM values.
+    min_active_tpm_value: float,
+        Minimum TPM value.
+    max_inactive_tpm_value: float,
+        Maximum TPM value.
+    verbose: int,
+        Verbosity level.
+    regions_cache: Dict = None,
+        Dictionary where to store the loaded regions.
+
+    Returns
+    ----------------------------------------
+    Return tuple with input and output DataFrames.
+    """
+    key = (
+        cell_line, assembly, dataset, region, metric,
+        window_size, root, min_active_tpm_value, max_inactive_tpm_value
+    )
+    if regions_cache is not None and key in regions_cache:
+        X, y = regions_cache[key]
+    else:
+        X, y = load_epigenomes(
+            cell_line=cell_line,
+            assembly=assembly,
+            dataset=dataset,
+            region=region,
+            metric=metric,
+            window_size=window_size,
+            root=root,
+            binarize=False,
+            min_active_tpm_value=min_active_tpm_value,
+            max_inactive_tpm_value=max_inactive_tpm_value,
+            verbose=verbose
+        )
+        if regions_cache is not None:
+            regions_cache[key] = X, y
+    if binarize:
+        y = y > min_active_tpm_value
+    return X, y
 
 
 def load_task(
@@ -20,7 +99,9 @@ def load_task(
     binarize: bool = False,
     min_active_tpm_value: float = 1,
     max_inactive_tpm_value: float = 1,
-) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    regions_cache: Dict = None,
+    sweep: bool = False
+) -> Union[Tuple[pd.DataFrame, pd.DataFrame], ThresholdSweep]:
     """Return epigenomic data and labels for given parameters.
 
     Parameters
@@ -60,10 +141,19 @@ def load_task(
     max_inactive_tpm_value: float = 1,
         Maximum TPM value.
         Values between the minimum and maximum will be dropped.
+    regions_cache: Dict = None,
+        Dictionary where to store the loaded regions, so that
+        they can be shared with the following tasks without
+        being loaded again. By default, nothing is shared.
+    sweep: bool = False,
+        Whether to return the sweep over the TPM thresholds of the
+        task, loading the data once for all the thresholds, which
+        are then given to its methods instead.
 
     Returns
     ----------------------------------------
-    Return tuple with input and output DataFrames.
+    Return tuple with input and output DataFrames,
+    or the sweep over the TPM thresholds of the task.
     """
     if only_active and only_inactive:
         raise ValueError(
@@ -79,6 +169,41 @@ def load_task(
             "you must load both enhancers and promoters."
         )
 
+    if sweep:
+        # With equal thresholds no region is dropped,
+        # so the raw TPM values of all the regions are loaded.
+        regions = [
+            (region, load_region(
+                cell_line=cell_line,
+                assembly=assembly,
+                dataset=dataset,
+                region=region,
+                metric=metric,
+                window_size=window_size,
+                root=root,
+                binarize=False,
+                min_active_tpm_value=1,
+                max_inactive_tpm_value=1,
+                verbose=verbose,
+                regions_cache=regions_cache
+            ))
+            for region, enabled in (
+                ("promoters", load_promoters),
+                ("enhancers", load_enhancers),
+            )
+            if enabled
+        ]
+        return ThresholdSweep(
+            pd.concat([X for _, (X, _) in regions]),
+            pd.concat([y for _, (_, y) in regions]),
+            promoters=np.concatenate([
+                np.full(len(X), region == "promoters")
+                for region, (X, _) in regions
+            ]),
+            only_active=only_active,
+            only_inactive=only_inactive
+        )
+
     if (only_active or only_active) and min_active_tpm_value != max_inactive_tpm_value:
         raise ValueError(
             "It does not make sense to threshold different cis-regulatory "
@@ -86,7 +211,7 @@ def load_task(
         )
 
     (promoters_epi, promoters_labels), (enhancers_epi, enhancers_labels) = [
-        load_epigenomes(
+        load_region(
             cell_line=cell_line,
             assembly=assembly,
             dataset=dataset,
@@ -97,7 +222,8 @@ def load_task(
             binarize=binarize,
             min_active_tpm_value=min_active_tpm_value,
             max_inactive_tpm_value=max_inactive_tpm_value,
-            verbose=verbose
+            verbose=verbose,
+            regions_cache=regions_cache
         ) if enabled else (None, None)
         for region, enabled in (
             ("promoters", load_promoters),
@@ -152,6 +278,8 @@ def active_promoters_vs_inactive_promoters(
     min_active_tpm_value: float = 1,
     max_inactive_tpm_value: float = 1,
     verbose: int = 2,
+    regions_cache: Dict = None,
+    sweep: bool = False
 ):
     """Return epigenomic data and labels for given parameters.
 
@@ -184,10 +312,16 @@ def active_promoters_vs_inactive_promoters(
         Values between the minimum and maximum will be dropped.
     verbose: int = 2,
         Verbosity level.
+    regions_cache: Dict = None,
+        Dictionary where to store the loaded regions, so that
+        they can be shared with the other tasks.
+    sweep: bool = False,
+        Whether to return the sweep over the TPM thresholds of the task.
 
     Returns
     ----------------------------------------
-    Return tuple with input and output DataFrames.
+    Return tuple with input and output DataFrames,
+    or the sweep over the TPM thresholds of the task.
     """
     return load_task(
         cell_line=cell_line,
@@ -204,6 +338,8 @@ def active_promoters_vs_inactive_promoters(
         binarize=binarize,
         min_active_tpm_value=min_active_tpm_value,
         max_inactive_tpm_value=max_inactive_tpm_value,
+        regions_cache=regions_cache,
+        sweep=sweep
     )
 
 
@@ -218,6 +354,8 @@ def active_enhancers_vs_inactive_enhancers(
     min_active_tpm_value: float = 1,
     max_inactive_tpm_value: float = 1,
     verbose: int = 2,
+    regions_cache: Dict = None,
+    sweep: bool = False
 ):
     """Return epigenomic data and labels for given parameters.
 
@@ -250,10 +388,16 @@ def active_enhancers_vs_inactive_enhancers(
         Values between the minimum and maximum will be dropped.
     verbose: int = 2,
         Verbosity level.
+    regions_cache: Dict = None,
+        Dictionary where to store the loaded regions, so that
+        they can be shared with the other tasks.
+    sweep: bool = False,
+        Whether to return the sweep over the TPM thresholds of the task.
 
     Returns
     ----------------------------------------
-    Return tuple with input and output DataFrames.
+    Return tuple with input and output DataFrames,
+    or the sweep over the TPM thresholds of the task.
     """
     return load_task(
         cell_line=cell_line,
@@ -270,6 +414,8 @@ def active_enhancers_vs_inactive_enhancers(
         binarize=binarize,
         min_active_tpm_value=min_active_tpm_value,
         max_inactive_tpm_value=max_inactive_tpm_value,
+        regions_cache=regions_cache,
+        sweep=sweep
     )
 
 
@@ -280,9 +426,12 @@ def active_enhancers_vs_active_promoters(
     metric: str = "mean",
     window_size: int = 256,
     root: str = "datasets",
+    binarize: bool = True,
     min_active_tpm_value: float = 1,
     max_inactive_tpm_value: float = 1,
-    verbose: int = 2
+    verbose: int = 2,
+    regions_cache: Dict = None,
+    sweep: bool = False
 ):
     """Return epigenomic data and labels for given parameters.
 
@@ -308,17 +457,24 @@ def active_enhancers_vs_active_promoters(
         Where to store the downloaded data.
         min_active_tpm_value: float = 1,
         Minimum TPM value.
-    binarize: bool = False,
-        Whether to binarize the TPM values.
+    binarize: bool = True,
+        The labels of this task are always binary, so this parameter
+        is only accepted for consistency with the other tasks.
     max_inactive_tpm_value: float = 1,
         Maximum TPM value.
         Values between the minimum and maximum will be dropped.
     verbose: int = 2,
         Verbosity level.
+    regions_cache: Dict = None,
+        Dictionary where to store the loaded regions, so that
+        they can be shared with the other tasks.
+    sweep: bool = False,
+        Whether to return the sweep over the TPM thresholds of the task.
 
     Returns
     ----------------------------------------
-    Return tuple with input and output DataFrames.
+    Return tuple with input and output DataFrames,
+    or the sweep over the TPM thresholds of the task.
     """
     return load_task(
         cell_line=cell_line,
@@ -335,6 +491,8 @@ def active_enhancers_vs_active_promoters(
         binarize=True,
         min_active_tpm_value=min_active_tpm_value,
         max_inactive_tpm_value=max_inactive_tpm_value,
+        regions_cache=regions_cache,
+        sweep=sweep
     )
 
 
@@ -345,9 +503,12 @@ def inactive_enhancers_vs_inactive_promoters(
     metric: str = "mean",
     window_size: int = 256,
     root: str = "datasets",
+    binarize: bool = True,
     min_active_tpm_value: float = 1,
     max_inactive_tpm_value: float = 1,
-    verbose: int = 2
+    verbose: int = 2,
+    regions_cache: Dict = None,
+    sweep: bool = False
 ):
     """Return epigenomic data and labels for given parameters.
 
@@ -371,8 +532,9 @@ def inactive_enhancers_vs_inactive_promoters(
         listed in the repository README file.
     root: str = "datasets"
         Where to store the downloaded data.
-    binarize: bool = False,
-        Whether to binarize the TPM values.
+    binarize: bool = True,
+        The labels of this task are always binary, so this parameter
+        is only accepted for consistency with the other tasks.
     min_active_tpm_value: float = 1,
         Minimum TPM value.
     max_inactive_tpm_value: float = 1,
@@ -380,10 +542,16 @@ def inactive_enhancers_vs_inactive_promoters(
         Values between the minimum and maximum will be dropped.
     verbose: int = 2,
         Verbosity level.
+    regions_cache: Dict = None,
+        Dictionary where to store the loaded regions, so that
+        they can be shared with the other tasks.
+    sweep: bool = False,
+        Whether to return the sweep over the TPM thresholds of the task.
 
     Returns
     ----------------------------------------
-    Return tuple with input and output DataFrames.
+    Return tuple with input and output DataFrames,
+    or the sweep over the TPM thresholds of the task.
     """
     return load_task(
         cell_line=cell_line,
@@ -400,6 +568,8 @@ def inactive_enhancers_vs_inactive_promoters(
         binarize=True,
         min_active_tpm_value=min_active_tpm_value,
         max_inactive_tpm_value=max_inactive_tpm_value,
+        regions_cache=regions_cache,
+        sweep=sweep
     )
 
 
@@ -415,6 +585,7 @@ def load_all_tasks(
     binarize: bool = False,
     min_active_tpm_value: float = 1,
     max_inactive_tpm_value: float = 1,
+    sweep: bool = False
 ):
     """Return generator with all the tasks.
 
@@ -449,11 +620,17 @@ def load_all_tasks(
     max_inactive_tpm_value: float = 1,
         Maximum TPM value.
         Values between the minimum and maximum will be dropped.
+    sweep: bool = False,
+        Whether to return the sweeps over the TPM thresholds of the
+        tasks instead, loading the data once for all the thresholds.
 
     Returns
     ----------------------------------------
     Return tuple with input and output DataFrames.
     """
+    # The regions are loaded once and shared between the tasks,
+    # and released together with the returned generator.
+    regions_cache = {}
     return (
         (
             task(
@@ -467,6 +644,8 @@ def load_all_tasks(
                 binarize=binarize,
                 min_active_tpm_value=min_active_tpm_value,
                 max_inactive_tpm_value=max_inactive_tpm_value,
+                regions_cache=regions_cache,
+                sweep=sweep
             ),
             task.__name__
         )
@@ -0,0 +1,187 @@
+"""Submodule providing the build manifest of a targets directory.
+
+The manifest records, for each output of the build, the inputs it was built
+from, such as the hash of the regions of an extracted epigenome or the
+checksums of the sources and the statistics of a mined target, together with
+the signature of the output itself. An output is reused by a following build
+only when its inputs are unchanged and the output was not modified since.
+"""
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+import pandas as pd
+from .cache import get_file_signature, is_valid_signature
+
+MANIFEST_NAME = "manifest.json"
+
+
+def get_manifest_path(root: str) -> str:
+    """Return the path of the manifest of given targets directory."""
+    return os.path.join(root, MANIFEST_NAME)
+
+
+def load_manifest(root: str) -> Dict:
+    """Return the manifest of given targets directory, empty if missing.
+
+    Parameters
+    --------------------------
+    root: str,
+        The targets directory.
+
+    Returns
+    --------------------------
+    Dictionary with the outputs recorded in the manifest.
+    """
+    path = get_manifest_path(root)
+    if not os.path.exists(path):
+        return {"outputs": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(root: str, manifest: Dict):
+    """Write the given manifest in the given targets directory.
+
+    Parameters
+    --------------------------
+    root: str,
+        The targets directory.
+    manifest: Dict,
+        The manifest to write.
+    """
+    path = get_manifest_path(root)
+    temporary_path = "{}.tmp".format(path)
+    with open(temporary_path, "w") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+def get_regions_hash(regions: pd.DataFrame) -> str:
+    """Return the hash of the chrom, chromStart, chromEnd and strand of given regions."""
+    sha256 = hashlib.sha256()
+    for column in ("chrom", "chromStart", "chromEnd", "strand"):
+        sha256.update("\t".join(regions[column].astype(str)).encode("utf8"))
+        sha256.update(b"\n")
+    return sha256.hexdigest()
+
+
+def is_up_to_date(manifest: Dict, root: str, path: str, inputs: Dict) -> bool:
+    """Return whether the output at given path was built from the given inputs.
+
+    Parameters
+    --------------------------
+    manifest: Dict,
+        The manifest of the targets directory.
+    root: str,
+        The targets directory.
+    path: str,
+        Path of the output.
+    inputs: Dict,
+        Description of the inputs the output should be built from.
+
+    Returns
+    --------------------------
+    Boolean representing whether the output exists, is recorded
+    with the given inputs and was not modified since.
+    """
+    entry = manifest["outputs"].get(os.path.relpath(path, root))
+    return (
+        entry is not None
+        and entry["inputs"] == inputs
+        and is_valid_signature(path, entry["signature"])
+    )
+
+
+def is_stale(manifest: Dict, root: str, path: str, inputs: Dict) -> bool:
+    """Return whether the output at given path is recorded with different inputs.
+
+    Outputs not recorded in the manifest, such as the ones of builds
+    preceding the manifest, are not considered stale.
+    """
+    return (
+        os.path.relpath(path, root) in manifest["outputs"]
+        and not is_up_to_date(manifest, root, path, inputs)
+    )
+
+
+def record_output(manifest: Dict, root: str, path: str, inputs: Dict, regions: int = None):
+    """Record in the manifest that the output at given path was built from the given inputs.
+
+    Parameters
+    --------------------------
+    manifest: Dict,
+        The manifest of the targets directory.
+    root: str,
+        The targets directory.
+    path: str,
+        Path of the output.
+    inputs: Dict,
+        Description of the inputs the output was built from.
+    regions: int = None,
+        Number of regions in the output, such as an extracted epigenome,
+        so that it is not counted again when the output is mined.
+    """
+    entry = {
+        "inputs": inputs,
+        "signature": get_file_signature(path)
+    }
+    if regions is not None:
+        entry["regions"] = int(regions)
+    manifest["outputs"][os.path.relpath(path, root)] = entry
+
+
+def get_checksum(manifest: Dict, root: str, path: str) -> str:
+    """Return the SHA256 checksum of the file at given path.
+
+    The checksum recorded in the manifest is used when
+    the file was not modified since it was recorded.
+
+    Parameters
+    --------------------------
+    manifest: Dict,
+        The manifest of the targets directory.
+    root: str,
+        The targets directory.
+    path: str,
+        Path of the file.
+
+    Returns
+    --------------------------
+    Hexadecimal SHA256 checksum of the file.
+    """
+    entry = manifest["outputs"].get(os.path.relpath(path, root))
+    if entry is not None and is_valid_signature(path, entry["signature"]):
+        return entry["signature"]["sha256"]
+    return get_file_signature(path)["sha256"]
+
+
+def get_regions_number(manifest: Dict, root: str, path: str) -> Optional[int]:
+    """Return the number of regions recorded for the output at given path.
+
+    Parameters
+    --------------------------
+    manifest: Dict,
+        The manifest of the targets directory.
+    root: str,
+        The targets directory.
+    path: str,
+        Path of the output.
+
+    Returns
+    --------------------------
+    The number of regions of the output, or None when it was not
+    recorded or the output was modified since it was recorded.
+    """
+    entry = manifest["outputs"].get(os.path.relpath(path, root))
+    if entry is None or not is_valid_signature(path, entry["signature"]):
+        return None
+    return entry.get("regions")
+
+
+def get_sources_inputs(manifest: Dict, root: str, sources: List[str]) -> Dict[str, str]:
+    """Return the checksums of the given sources, keyed by their relative paths."""
+    return {
+        os.path.relpath(source, root): get_checksum(manifest, root, source)
+        for source in sources
+    }
@@ -1,14 +1,20 @@
 from glob import glob
 from multiprocessing import Pool, cpu_count
 import os
-from typing import Dict, List
+import shutil
+import time
+from typing import Dict, List, Tuple
+from itertools import islice
 from tqdm.auto import tqdm
 import numpy as np
 import pandas as pd
-import csv
 import gzip
 import warnings
-from .extract import load_epigenomes_table, load_accession_path
+from .extract import load_epigenomes_table, load_accession_path, load_accession_summary_path
+from .statistics import compute_statistics
+from .scheduler import report_makespan, sort_by_cost
+from .telemetry import measured_call
+from .manifest import get_regions_number, get_sources_inputs, is_up_to_date, load_manifest, record_output, save_manifest
 
 
 def compute_header(statistics: Dict[str, bool]) -> str:
@@ -29,16 +35,6 @@ def compute_header(statistics: Dict[str, bool]) -> str:
     ])+'\n'
 
 
-def get_callback(statistic: str):
-    return {
-        "mean": np.nanmean,
-        "var": np.nanvar,
-        "max": np.nanmax,
-        "min": np.nanmin,
-        "median": np.nanmedian
-    }[statistic]
-
-
 def get_target_path(root: str, cell_line: str, assembly: str, assay_term_name: str, target: str) -> str:
     """Return path where the target epigenomic data are to be stored.
 
@@ -68,8 +64,29 @@ def get_target_path(root: str, cell_line: str, assembly: str, assay_term_name: s
     )
 
 
-def parse_extracted_epigenome(sources: List[str], target: str, statistics: Dict[str, bool]):
-    """Parse the given source bed-like file.
+def get_source_path(root: str, accession: str) -> str:
+    """Return path of the extracted epigenome of given accession.
+
+    The summaries written by the native extraction engine are
+    preferred over the per-base values written by pybwtool.
+    """
+    path = load_accession_summary_path(root, accession)
+    if os.path.exists(path):
+        return path
+    return load_accession_path(root, accession)
+
+
+def parse_summarized_epigenome(
+    sources: List[str],
+    target: str,
+    statistics: Dict[str, bool],
+    start: int = 0,
+    stop: int = None
+) -> int:
+    """Parse the given summaries written by the native extraction engine.
+
+    The mean of each window in each replicate is used as
+    the score of the replicate, as in the per-base parsing.
 
     Parameters
     ----------------------------
@@ -79,59 +96,260 @@ def parse_extracted_epigenome(sources: List[str], target: str, statistics: Dict[
         Epigenomic data target.
     statistics: Dict[str, bool]
         Statistics to be extracted.
+    start: int = 0,
+        Index of the first region to parse. The header
+        is only written when starting from the first region.
+    stop: int = None,
+        Index after the last region to parse. By default, up to the last.
+
+    Returns
+    ----------------------------
+    Number of regions parsed.
     """
-    header = compute_header(statistics)
-    callbacks = [
-        get_callback(s)
-        for s, enabled in statistics.items()
-        if enabled
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    summaries = [
+        pd.read_csv(
+            source,
+            sep="\t",
+            usecols=["chrom", "chromStart", "chromEnd", "strand", "mean"],
+            dtype=str,
+            skiprows=range(1, start + 1),
+            nrows=None if stop is None else stop - start
+        )
+        for source in sources
     ]
+    mined = summaries[0][["chrom", "chromStart", "chromEnd", "strand"]].copy()
+    metrics = compute_statistics(
+        np.stack([
+            summary["mean"].values.astype(np.float64)
+            for summary in summaries
+        ], axis=1),
+        [s for s, enabled in statistics.items() if enabled]
+    )
+    for statistic, values in metrics.items():
+        mined[statistic] = values
+    mined.to_csv(
+        target,
+        sep="\t",
+        index=False,
+        header=start == 0,
+        na_rep=str(np.nan),
+        compression="gzip"
+    )
+    return len(mined)
+
+
+def parse_scores_block(lines: List[str]) -> Tuple[List[List[str]], np.ndarray, np.ndarray]:
+    """Return the regions and the per-base scores of given extracted lines.
+
+    Parameters
+    ----------------------------
+    lines: List[str],
+        Lines of a file extracted by pybwtool.
+
+    Raises
+    ----------------------------
+    ValueError,
+        If the scores of the lines cannot be parsed.
+
+    Returns
+    ----------------------------
+    Tuple with the chrom, chromStart, chromEnd and strand of each
+    region, the flat array of the scores, where missing values are NaN,
+    and the number of scores of each region.
+    """
+    regions, scores = [], []
+    for line in lines:
+        fields = line.rstrip("\n").split("\t", 7)
+        regions.append([*fields[:3], fields[5]])
+        scores.append(fields[7] if len(fields) > 7 else "")
+    lengths = np.array([
+        score.count("\t") + 1 if score else 0
+        for score in scores
+    ])
+    # Parsing all the scores of the block at once
+    values = np.fromstring(
+        "\t".join(score for score in scores if score).replace("NA", "nan"),
+        sep="\t"
+    )
+    if values.size != lengths.sum():
+        raise ValueError(
+            "Unable to parse the scores of the extracted regions."
+        )
+    return regions, values, lengths
+
+
+def parse_summary_block(lines: List[str], column: int) -> Tuple[List[List[str]], np.ndarray]:
+    """Return the regions and the window means of given summarized lines.
+
+    Parameters
+    ----------------------------
+    lines: List[str],
+        Lines of a summary written by the native extraction engine.
+    column: int,
+        Index of the column of the means.
+
+    Returns
+    ----------------------------
+    Tuple with the chrom, chromStart, chromEnd and strand
+    of each region and the array of their means.
+    """
+    regions, means = [], []
+    for line in lines:
+        fields = line.rstrip("\n").split("\t")
+        regions.append(fields[:4])
+        means.append(fields[column])
+    return regions, np.array(means, dtype=np.float64)
+
+
+def average_scores(scores: List[np.ndarray], lengths: List[np.ndarray]) -> np.ndarray:
+    """Return the (regions, replicates) matrix of the window averages.
+
+    Parameters
+    ----------------------------
+    scores: List[np.ndarray],
+        The flat scores of each replicate.
+    lengths: List[np.ndarray],
+        The number of scores of each region in each replicate.
+
+    Returns
+    ----------------------------
+    Matrix with the average of the scores of each region in each replicate.
+    """
+    regions_number = len(lengths[0])
+    width = lengths[0][0]
+    if all((length == width).all() for length in lengths):
+        # All the windows have the same size, so the whole block
+        # is reduced at once as a (replicates, regions, bases) tensor.
+        return compute_statistics(
+            np.stack(scores).reshape(len(scores), regions_number, width),
+            ["mean"]
+        )["mean"].T
+    # Otherwise the windows are reduced grouping them by size,
+    # so that no padding changes the summation order.
+    averages = np.empty((regions_number, len(scores)))
+    for replicate, (values, length) in enumerate(zip(scores, lengths)):
+        offsets = np.concatenate([[0], np.cumsum(length)[:-1]])
+        for width in np.unique(length):
+            mask = length == width
+            averages[mask, replicate] = compute_statistics(
+                values[offsets[mask, None] + np.arange(width)],
+                ["mean"]
+            )["mean"]
+    return averages
+
+
+def parse_extracted_epigenome(
+    sources: List[str],
+    target: str,
+    statistics: Dict[str, bool],
+    batch_size: int = 1024,
+    start: int = 0,
+    stop: int = None
+) -> int:
+    """Parse the given source bed-like file.
+
+    The lines of the sources are decoded in blocks, and the averages
+    of the replicates and the requested statistics are computed
+    with vectorized reductions over each block. Each source is read
+    in its own format, so the replicates extracted as summaries
+    may be mined together with the per-base values of others.
+
+    Parameters
+    ----------------------------
+    sources: List[str],
+        Paths from where to load the sources.
+    target: str,
+        Epigenomic data target.
+    statistics: Dict[str, bool]
+        Statistics to be extracted.
+    batch_size: int = 1024,
+        Number of regions to decode at once from each source.
+    start: int = 0,
+        Index of the first region to parse. The header
+        is only written when starting from the first region.
+    stop: int = None,
+        Index after the last region to parse. By default, up to the last.
+
+    Returns
+    ----------------------------
+    Number of regions parsed.
+    """
+    if all(source.endswith(".summary.csv.gz") for source in sources):
+        return parse_summarized_epigenome(sources, target, statistics, start, stop)
+    enabled = [s for s, enabled in statistics.items() if enabled]
     os.makedirs(os.path.dirname(target), exist_ok=True)
 
+    summarized = [
+        index
+        for index, source in enumerate(sources)
+        if source.endswith(".summary.csv.gz")
+    ]
+    dumped = [
+        index
+        for index in range(len(sources))
+        if index not in summarized
+    ]
     source_files = [
         gzip.open(source, "rt")
         for source in sources
     ]
-
-    readers = [
-        csv.reader(source_file, delimiter='\t')
+    # The summaries start with a header, where the mean column is looked up.
+    mean_columns = {
+        index: next(source_files[index]).rstrip("\n").split("\t").index("mean")
+        for index in summarized
+    }
+    source_lines = [
+        islice(source_file, start, stop)
         for source_file in source_files
     ]
+    parsed = 0
+
     try:
         with gzip.open(target, "wt") as t:
             # Starting by writing the head
-            t.write(header)
-            # And now we parse the lines one by one
-            for rows in zip(*readers):
-                # We extract the values
-                chrom, chromStart, chromEnd, _, _, strand = rows[0][:6]
-                # Convert the scores to float values
-                scores = [
-                    [
-                        float(s) if s != "NA" else np.nan
-                        for s in row[7:]
-                    ]
-                    for row in rows
-                ]
-                # Compute the averages in a fully defined way
-                averaged_scores = [
-                    np.nan
-                    if len(sub_scores) == 0 or np.all(np.isnan(sub_scores))
-                    else np.nanmean(sub_scores)
-                    for sub_scores in scores
-                ]
-                # Compute the metrics
-                metrics = [
-                    str(np.nan)
-                    if len(averaged_scores) == 0 or np.all(np.isnan(averaged_scores))
-                    else cal(averaged_scores).astype(str)
-                    for cal in callbacks
+            if start == 0:
+                t.write(compute_header(statistics))
+            # And now we parse the lines block by block
+            while True:
+                blocks = [
+                    list(islice(lines, batch_size))
+                    for lines in source_lines
                 ]
+                # As when zipping the files, we stop at the shortest one
+                regions_number = min(len(block) for block in blocks)
+                if regions_number == 0:
+                    break
+                parsed += regions_number
+                # Compute the averages of each replicate,
+                # obtaining a (regions, replicates) matrix.
+                averaged_scores = np.empty((regions_number, len(sources)))
+                regions, scores, lengths = zip(*[
+                    parse_scores_block(blocks[index][:regions_number])
+                    for index in dumped
+                ])
+                averaged_scores[:, dumped] = average_scores(scores, lengths)
+                # As when zipping the files, the regions are the ones
+                # of the first per-base source.
+                for index in summarized:
+                    _, averaged_scores[:, index] = parse_summary_block(
+                        blocks[index][:regions_number],
+                        mean_columns[index]
+                    )
+                # Compute the metrics across the replicates
+                mined = pd.DataFrame(regions[0], columns=[
+                    "chrom", "chromStart", "chromEnd", "strand"
+                ])
+                for statistic, values in compute_statistics(averaged_scores, enabled).items():
+                    mined[statistic] = values
                 # And write the results
-                t.write("\t".join([
-                    chrom, chromStart, chromEnd, strand,
-                    *metrics
-                ])+'\n')
+                mined.to_csv(
+                    t,
+                    sep="\t",
+                    header=False,
+                    index=False,
+                    na_rep=str(np.nan)
+                )
     except EOFError:
         warnings.warn((
             "Unable to properly finish reading corrupted compressed files {}. "
@@ -141,24 +359,90 @@ def parse_extracted_epigenome(sources: List[str], target: str, statistics: Dict[
             ", ".join(sources)
         ))
         for source in sources:
-            os.remove(source)
+            # Another shard of the same sources may have removed them.
+            if os.path.exists(source):
+                os.remove(source)
 
     for source_file in source_files:
         source_file.close()
+    return parsed
+
+
+def _parse_extracted_epigenome(kwargs: Dict) -> Dict:
+    return {"regions": parse_extracted_epigenome(**kwargs)}
+
+
+def get_shard_path(target: str, shard: int) -> str:
+    """Return path where the given shard of the target is to be stored."""
+    return "{target}.shard{shard}".format(target=target, shard=shard)
+
+
+def split_regions(regions_number: int, shards: int) -> List[Tuple[int, int]]:
+    """Return the ranges splitting the regions in the given number of shards.
 
+    Parameters
+    -----------------------
+    regions_number: int,
+        Number of regions to split.
+    shards: int,
+        Number of shards.
+
+    Returns
+    -----------------------
+    List with the start and stop of the regions of each shard.
+    """
+    bounds = np.linspace(0, regions_number, shards + 1).astype(int)
+    # The last shard is left open, so that it includes all the
+    # regions of the sources, as when mining the whole target.
+    return [
+        (int(start), int(stop) if shard < shards - 1 else None)
+        for shard, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:]))
+    ]
 
-def _parse_extracted_epigenome(kwargs: Dict):
-    return parse_extracted_epigenome(**kwargs)
+
+def stitch_shards(shards: List[str], target: str):
+    """Join the given gzip shards into the target and remove them.
+
+    A concatenation of gzip members is a valid gzip file,
+    so the shards are joined without decompressing them.
+
+    Parameters
+    -----------------------
+    shards: List[str],
+        Paths of the shards, in the order of their regions.
+    target: str,
+        Path of the target to write.
+    """
+    temporary_path = "{}.tmp".format(target)
+    with open(temporary_path, "wb") as t:
+        for shard in shards:
+            with open(shard, "rb") as f:
+                shutil.copyfileobj(f, t)
+    os.replace(temporary_path, target)
+    for shard in shards:
+        os.remove(shard)
 
 
 def mine(
     root: str,
     statistics: Dict[str, bool],
     cell_lines: List[str],
-    assembly: str
+    assembly: str,
+    workers: int = -1,
+    min_shard_regions: int = 10000,
+    telemetry: List[Dict] = None,
+    metadata_path: str = None
 ):
     """Extract and saves requested statistics from epigenomic files.
 
+    The targets recorded in the manifest of the root are mined
+    again only when their extracted epigenomes or the requested
+    statistics changed since they were mined.
+
+    The targets more expensive than the share of work of a worker
+    are split in shards of contiguous regions, mined in parallel
+    and then stitched back together in the same target file.
+
     Parameters
     -----------------------
     root: str,
@@ -170,28 +454,131 @@ def mine(
         Cell line to consider.
     assembly: str,
         The genomic assembly of the data to be retrieved.
+    workers: int = -1,
+        Number of workers to use.
+        The default, -1, set the workers to the maximum available.
+    min_shard_regions: int = 10000,
+        Minimum number of regions in a shard of a target.
+    telemetry: List[Dict] = None,
+        List where to append the measurements of each mined target or shard.
+    metadata_path: str = None,
+        Path of the epigenomes metadata to use instead of the packaged ones.
+
+    Raises
+    -----------------------
+    ValueError,
+        If workers number is neither -1 nor a strictly positive integer.
     """
-    tasks = [
-        {
-            "sources": [
-                load_accession_path(root, accession)
-                for accession in group.accession
-            ],
-            "target": get_target_path(root, cell_line, assembly, assay_term_name, target),
+    if workers == -1:
+        workers = cpu_count()
+    if workers < 1:
+        raise ValueError(
+            "Given workers number {} is neither -1 or a strictly positive integer.".format(workers))
+    manifest = load_manifest(root)
+    mined_statistics = [
+        statistic
+        for statistic, enabled in statistics.items()
+        if enabled
+    ]
+    tasks, records = [], []
+    for (cell_line, assay_term_name, target), group in load_epigenomes_table(cell_lines, assembly, metadata_path).groupby(["cell_line", "assay_term_name", "target"]):
+        sources = [
+            get_source_path(root, accession)
+            for accession in group.accession
+        ]
+        target_path = get_target_path(root, cell_line, assembly, assay_term_name, target)
+        if all(os.path.exists(source) for source in sources):
+            inputs = {
+                "sources": get_sources_inputs(manifest, root, sources),
+                "statistics": mined_statistics
+            }
+            if is_up_to_date(manifest, root, target_path, inputs):
+                continue
+            records.append((target_path, inputs))
+        elif os.path.exists(target_path):
+            # The extracted epigenomes were removed after mining them.
+            continue
+        tasks.append({
+            "sources": sources,
+            "target": target_path,
             "statistics": statistics
-        }
-        for (cell_line, assay_term_name, target), group in load_epigenomes_table(cell_lines, assembly).groupby(["cell_line", "assay_term_name", "target"])
-        if not os.path.exists(get_target_path(root, assembly, cell_line, assay_term_name, target))
+        })
+
+    costs = [
+        sum(
+            os.path.getsize(source) if os.path.exists(source) else 0
+            for source in task["sources"]
+        )
+        for task in tasks
     ]
 
-    with Pool(cpu_count()) as p:
-        list(tqdm(
+    # The targets whose cost exceeds the share of a worker are split
+    # in shards, so that a few large targets do not leave the other
+    # workers idle while they are mined.
+    share = sum(costs)/workers
+    sharded_tasks, sharded_costs, stitches = [], [], []
+    for task, cost in zip(tasks, costs):
+        # Only the targets whose sources exist and whose number of
+        # regions was recorded when they were extracted are sharded.
+        shards, regions_number = 1, None
+        if share > 0 and all(os.path.exists(source) for source in task["sources"]):
+            regions_number = get_regions_number(manifest, root, task["sources"][0])
+        if regions_number is not None:
+            shards = min(
+                workers,
+                int(np.ceil(cost/share)),
+                regions_number//min_shard_regions
+            )
+        if shards <= 1:
+            sharded_tasks.append(task)
+            sharded_costs.append(cost)
+            continue
+        paths = []
+        for shard, (start, stop) in enumerate(split_regions(regions_number, shards)):
+            paths.append(get_shard_path(task["target"], shard))
+            sharded_tasks.append({
+                **task,
+                "target": paths[-1],
+                "start": start,
+                "stop": stop
+            })
+            sharded_costs.append(cost/shards)
+        stitches.append((paths, task["target"]))
+
+    # The tasks are mined starting from the largest ones, estimated
+    # from the size of their extracted replicates, so that the
+    # largest tasks do not end up running alone at the end.
+    tasks, costs = sort_by_cost(sharded_tasks, sharded_costs)
+
+    start = time.perf_counter()
+    with Pool(workers) as p:
+        measurements = list(tqdm(
             p.imap(
-                _parse_extracted_epigenome,
-                tasks
+                measured_call,
+                [(_parse_extracted_epigenome, task) for task in tasks]
             ),
             desc="Parse extracted epigenomes",
             total=len(tasks)
         ))
         p.close()
         p.join()
+    report_makespan(
+        "Mining",
+        costs,
+        [measurement["wall_time"] for measurement in measurements],
+        workers,
+        time.perf_counter() - start
+    )
+    if telemetry is not None:
+        for task, measurement in zip(tasks, measurements):
+            telemetry.append({
+                "task": os.path.relpath(task["target"], root),
+                **measurement
+            })
+
+    for paths, target_path in stitches:
+        stitch_shards(paths, target_path)
+
+    for target_path, inputs in records:
+        record_output(manifest, root, target_path, inputs)
+    save_manifest(root, manifest)
@@ -0,0 +1,131 @@
+"""Submodule providing a compact representation of the regions index.
+
+The regions are indexed by chromosome, start, end and strand. The
+coordinates are stored as 32 bits integers, the chromosomes and the
+strands as categoricals, and the index levels, that is the distinct
+values of each field, are shared by the rows through integer codes.
+To align two indices, each region is packed
+into a single 64 bits key from the codes of its fields, so that the
+rows are matched by hashing integers instead of tuples of objects.
+"""
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+
+
+def compact_index(index: pd.MultiIndex) -> pd.MultiIndex:
+    """Return given regions index with 32 bits coordinates and categorical names.
+
+    The chromosomes and strands are kept as categoricals when the
+    index is converted into columns, as with the reset_index method.
+
+    Parameters
+    ----------------------------
+    index: pd.MultiIndex,
+        Regions index, with chrom, chromStart, chromEnd and strand levels.
+
+    Returns
+    ----------------------------
+    Regions index sharing the codes of the given one.
+    """
+    levels = list(index.levels)
+    for level in (1, 2):
+        if len(levels[level]) and levels[level].max() < np.iinfo(np.int32).max:
+            levels[level] = levels[level].astype(np.int32)
+    for level in (0, 3):
+        levels[level] = pd.CategoricalIndex(levels[level])
+    return pd.MultiIndex(
+        levels=levels,
+        codes=index.codes,
+        names=index.names,
+        verify_integrity=False
+    )
+
+
+def get_positions(values: pd.Index, level: pd.Index) -> np.ndarray:
+    """Return the positions in given values of the values of given level."""
+    # The levels are usually sorted, so a binary search is enough.
+    if values.is_monotonic_increasing and level.is_monotonic_increasing:
+        return values.searchsorted(level)
+    return values.get_indexer(level)
+
+
+def get_region_keys(*indices: pd.MultiIndex) -> Optional[List[np.ndarray]]:
+    """Return the regions of the given indices packed into 64 bits keys.
+
+    The same region has the same key in all the given indices.
+
+    Parameters
+    ----------------------------
+    *indices: pd.MultiIndex,
+        Regions indices, with chrom, chromStart, chromEnd and strand levels.
+
+    Returns
+    ----------------------------
+    List with the keys of the regions of each index, or None
+    when the distinct values of the fields do not fit in 64 bits.
+    """
+    keys = [np.zeros(len(index), dtype=np.int64) for index in indices]
+    capacity = 1
+    for level in range(indices[0].nlevels):
+        values = indices[0].levels[level]
+        shared = all(index.levels[level].equals(values) for index in indices[1:])
+        if not shared:
+            # Only the distinct values of the level are compared,
+            # the codes of the rows are then translated.
+            for index in indices[1:]:
+                values = values.union(index.levels[level])
+        capacity *= len(values) + 1
+        if capacity >= np.iinfo(np.int64).max:
+            return None
+        for key, index in zip(keys, indices):
+            codes = index.codes[level]
+            if not shared:
+                codes = np.where(
+                    codes == -1,
+                    -1,
+                    get_positions(values, index.levels[level])[codes]
+                )
+            key *= len(values) + 1
+            # Missing values have code -1, hence the shift.
+            key += codes.astype(np.int64) + 1
+    return keys
+
+
+def align_labels(index: pd.MultiIndex, labels: pd.DataFrame) -> pd.DataFrame:
+    """Return the labels of the regions in given index, in the same order.
+
+    When the labels are already in the order of the index, they are
+    returned as they are, otherwise they are matched through the packed
+    keys of the regions. The returned labels share the given index.
+
+    Parameters
+    ----------------------------
+    index: pd.MultiIndex,
+        Regions index of the epigenomic data.
+    labels: pd.DataFrame,
+        Labels indexed by the regions, including the ones of the index.
+
+    Raises
+    ----------------------------
+    KeyError,
+        If some of the regions of the index have no labels.
+
+    Returns
+    ----------------------------
+    Labels of the regions of the index.
+    """
+    if labels.index.equals(index):
+        return labels.set_axis(index, axis=0)
+    keys = get_region_keys(index, labels.index)
+    if keys is None or not pd.Index(keys[1]).is_unique:
+        return labels.loc[index].set_axis(index, axis=0)
+    positions = pd.Index(keys[1]).get_indexer(keys[0])
+    missing = positions == -1
+    if missing.any():
+        raise KeyError(
+            "The regions {} have no labels.".format(
+                list(index[missing][:5])
+            )
+        )
+    return labels.iloc[positions].set_axis(index, axis=0)
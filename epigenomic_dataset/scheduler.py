@@ -0,0 +1,226 @@
+"""Submodule scheduling the download and extraction of the epigenomes."""
+import heapq
+import os
+import threading
+import time
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from typing import Callable, Dict, List, Tuple
+from tqdm.auto import tqdm
+from .logging import logger
+from .telemetry import measured_call
+
+
+def sort_by_cost(tasks: List, costs: List[float]) -> Tuple[List, List[float]]:
+    """Return the tasks and their costs sorted from the most expensive.
+
+    Handing out the most expensive tasks first, that is the
+    longest-processing-time-first rule, avoids leaving a single
+    long task running at the end while the other workers are idle.
+
+    Parameters
+    --------------------------
+    tasks: List,
+        The tasks to sort.
+    costs: List[float],
+        The expected cost of each task.
+
+    Returns
+    --------------------------
+    Tuple with the sorted tasks and costs.
+    """
+    order = sorted(range(len(tasks)), key=lambda i: costs[i], reverse=True)
+    return [tasks[i] for i in order], [costs[i] for i in order]
+
+
+def simulate_makespan(costs: List[float], workers: int) -> float:
+    """Return the makespan of the given costs assigned in order to the first free worker.
+
+    Parameters
+    --------------------------
+    costs: List[float],
+        The costs of the tasks, in the order they are handed out.
+    workers: int,
+        Number of workers.
+
+    Returns
+    --------------------------
+    The largest total cost assigned to a worker.
+    """
+    loads = [0.0]*max(1, min(workers, len(costs)))
+    for cost in costs:
+        heapq.heapreplace(loads, loads[0] + cost)
+    return max(loads)
+
+
+def report_makespan(
+    stage: str,
+    costs: List[float],
+    durations: List[float],
+    workers: int,
+    elapsed: float
+) -> float:
+    """Log the predicted and the actual makespan of the given stage.
+
+    The costs are converted to seconds using the throughput observed
+    over all the tasks, so the predicted makespan is the one of an ideal
+    scheduling of the measured durations, without any overhead.
+
+    Parameters
+    --------------------------
+    stage: str,
+        Name of the stage.
+    costs: List[float],
+        The costs of the tasks, in the order they were handed out.
+    durations: List[float],
+        The seconds spent running each of the tasks.
+    workers: int,
+        Number of workers.
+    elapsed: float,
+        The seconds elapsed running the stage.
+
+    Returns
+    --------------------------
+    The predicted makespan in seconds.
+    """
+    if not durations:
+        return 0.0
+    seconds_per_cost = sum(durations)/sum(costs) if sum(costs) > 0 else 0
+    predicted = simulate_makespan(costs, workers)*seconds_per_cost
+    logger.info(
+        "%s: predicted makespan %.1fs, actual %.1fs, with %s workers "
+        "and %.1fs of work in %s tasks.",
+        stage, predicted, elapsed, workers, sum(durations), len(durations)
+    )
+    return predicted
+
+
+def run_pipeline(
+    tasks: List[Dict],
+    download: Callable[[Dict], Dict],
+    extraction: Callable[[Dict], None],
+    workers: int,
+    download_workers: int,
+    max_staged_bytes: int = None,
+    on_completed: Callable[[Dict], None] = None,
+    telemetry: List[Dict] = None
+):
+    """Download and extract the given tasks, overlapping the two stages.
+
+    A task is admitted, and its download started, only when the sizes of
+    the bigWigs already staged, that is downloading, waiting for extraction
+    or being extracted, leave room for its size in the given budget.
+    A bigWig larger than the whole budget is admitted alone.
+    The size of a bigWig is released once its extraction ends.
+    Once done, the predicted and the actual makespans are logged.
+
+    Parameters
+    --------------------------
+    tasks: List[Dict],
+        The tasks to run, each with the "file_size" of its bigWig.
+    download: Callable[[Dict], Dict],
+        Function downloading the bigWig of a task and returning the task.
+    extraction: Callable[[Dict], None],
+        Function extracting the region sets of a task.
+    workers: int,
+        Number of processes extracting the bigWigs.
+    download_workers: int,
+        Number of bigWigs to download concurrently.
+    max_staged_bytes: int = None,
+        Maximum total size of the staged bigWigs.
+        By default, the size is not bounded.
+    on_completed: Callable[[Dict], None] = None,
+        Function called in the main process with each extracted task.
+    telemetry: List[Dict] = None,
+        List where to append the measurements of each task, including
+        the ones of its download stored by the download function
+        in the "telemetry" of the task.
+
+    Raises
+    --------------------------
+    Exception,
+        The first exception raised by a download or an extraction.
+    """
+    condition = threading.Condition()
+    state = {"staged": 0, "completed": 0, "error": None}
+    durations = []
+    start = time.perf_counter()
+    progress = tqdm(total=len(tasks), desc="Parsing epigenomes")
+
+    def fits(task: Dict) -> bool:
+        return (
+            state["error"] is not None
+            or state["staged"] == 0
+            or max_staged_bytes is None
+            or state["staged"] + task["file_size"] <= max_staged_bytes
+        )
+
+    def on_error(error: Exception):
+        with condition:
+            if state["error"] is None:
+                state["error"] = error
+            condition.notify_all()
+
+    def on_extracted(task: Dict, record: Dict):
+        with condition:
+            if on_completed is not None:
+                try:
+                    on_completed(task)
+                except Exception as error:
+                    state["error"] = error
+            if telemetry is not None:
+                telemetry.append({
+                    "task": os.path.basename(task["epigenome_path"]),
+                    **task.get("telemetry", {}),
+                    **record
+                })
+            durations.append(record["wall_time"])
+            state["staged"] -= task["file_size"]
+            state["completed"] += 1
+            progress.update()
+            condition.notify_all()
+
+    def on_downloaded(task: Dict):
+        p.apply_async(
+            measured_call,
+            ((extraction, task),),
+            callback=lambda record: on_extracted(task, record),
+            error_callback=on_error
+        )
+
+    with Pool(workers) as p, ThreadPool(download_workers) as d:
+        for task in tasks:
+            with condition:
+                condition.wait_for(lambda: fits(task))
+                if state["error"] is not None:
+                    break
+                if max_staged_bytes is not None and task["file_size"] > max_staged_bytes:
+                    logger.warning(
+                        "The bigWig %s of %s bytes exceeds the staging budget of %s bytes.",
+                        task["epigenome_path"], task["file_size"], max_staged_bytes
+                    )
+                state["staged"] += task["file_size"]
+            d.apply_async(
+                download,
+                (task,),
+                callback=on_downloaded,
+                error_callback=on_error
+            )
+        with condition:
+            condition.wait_for(
+                lambda: state["error"] is not None or state["completed"] == len(tasks)
+            )
+        progress.close()
+        if state["error"] is not None:
+            p.terminate()
+            d.terminate()
+            raise state["error"]
+        p.close()
+        p.join()
+    report_makespan(
+        "Extraction",
+        [task["file_size"] for task in tasks],
+        durations,
+        workers,
+        time.perf_counter() - start
+    )
@@ -0,0 +1,145 @@
+"""Submodule providing epigenomic data shared between processes without copies.
+
+The data and the labels are written once as NumPy arrays in a temporary
+directory, by default in the shared memory filesystem when available,
+and memory-mapped by every process. The handle only holds the path of
+the directory, so it can be sent to worker processes, such as the ones
+of a cross-validation, which get read-only views of the same pages
+instead of parsing their own copies of the data.
+"""
+import os
+import shutil
+import tempfile
+import weakref
+from typing import Tuple
+import numpy as np
+import pandas as pd
+from .columnar import load_matrix, read_matrices, write_matrices
+
+SHARED_MEMORY_DIRECTORY = "/dev/shm"
+# The matrices are written in a subdirectory, so that the temporary
+# files of an interrupted writing are also removed with the shared data.
+MATRICES_DIRECTORY = "matrices"
+
+
+def remove_shared(path: str, pid: int):
+    """Remove the shared directory at given path, if called by its owner process."""
+    # Forked workers inherit the finalizer of the handle,
+    # and they must not remove the data of their parent.
+    if os.getpid() == pid:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class SharedEpigenomes:
+    """Picklable handle of epigenomic data and labels shared between processes.
+
+    The handle created by share_epigenomes owns the shared data, which are
+    removed when it is closed, garbage collected or when its process exits.
+    The handles unpickled by the workers only read the data.
+    """
+
+    def __init__(self, path: str, owner: bool = False):
+        """Create a handle of the data shared in the given directory.
+
+        Parameters
+        ----------------------------
+        path: str,
+            Directory where the data are shared.
+        owner: bool = False,
+            Whether the handle removes the data when closed.
+        """
+        self._path = path
+        self._owner = owner
+        self._X = None
+        self._y = None
+        if owner:
+            self._finalizer = weakref.finalize(
+                self, remove_shared, path, os.getpid()
+            )
+
+    def __getstate__(self):
+        return {"path": self._path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def __enter__(self) -> "SharedEpigenomes":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def path(self) -> str:
+        """Return the directory where the data are shared."""
+        return self._path
+
+    @property
+    def X(self) -> np.ndarray:
+        """Return a read-only view of the shared epigenomic data."""
+        if self._X is None:
+            self._X = load_matrix(os.path.join(self._path, MATRICES_DIRECTORY), "X")
+        return self._X
+
+    @property
+    def y(self) -> np.ndarray:
+        """Return a read-only view of the shared labels."""
+        if self._y is None:
+            self._y = load_matrix(os.path.join(self._path, MATRICES_DIRECTORY), "y")
+        return self._y
+
+    def to_frames(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Return the shared data and labels as DataFrames indexed by region.
+
+        The values of the DataFrames are read-only views of the shared
+        data, while the regions index is rebuilt in each process.
+        """
+        return read_matrices(os.path.join(self._path, MATRICES_DIRECTORY))
+
+    def close(self):
+        """Remove the shared data, when the handle owns them."""
+        self._X = None
+        self._y = None
+        if self._owner:
+            self._finalizer()
+
+
+def share_epigenomes(
+    X: pd.DataFrame,
+    y: pd.DataFrame,
+    directory: str = None
+) -> SharedEpigenomes:
+    """Return handle of the given data and labels shared between processes.
+
+    Parameters
+    ----------------------------
+    X: pd.DataFrame,
+        The epigenomic data, indexed by region.
+    y: pd.DataFrame,
+        The labels, aligned with the data.
+    directory: str = None,
+        Directory where to share the data. By default, the shared
+        memory filesystem when available, otherwise the temporary
+        directory of the system.
+
+    Raises
+    ----------------------------
+    ValueError,
+        If the data and the labels are not aligned.
+
+    Returns
+    ----------------------------
+    The handle owning the shared data, to be sent to the workers.
+    """
+    if not X.index.equals(y.index):
+        raise ValueError(
+            "The given data and labels are not aligned."
+        )
+    if directory is None and os.path.isdir(SHARED_MEMORY_DIRECTORY):
+        directory = SHARED_MEMORY_DIRECTORY
+    path = tempfile.mkdtemp(prefix="epigenomic_dataset-", dir=directory)
+    # The handle is created first, so that the directory
+    # is removed even if the writing is interrupted.
+    shared = SharedEpigenomes(path, owner=True)
+    write_matrices(os.path.join(path, MATRICES_DIRECTORY), X, y)
+    return shared
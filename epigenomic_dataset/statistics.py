@@ -0,0 +1,46 @@
+"""Submodule providing the statistics mined from the epigenomic windows."""
+from typing import Dict, List
+import warnings
+import numpy as np
+
+
+def get_callback(statistic: str):
+    return {
+        "mean": np.nanmean,
+        "var": np.nanvar,
+        "max": np.nanmax,
+        "min": np.nanmin,
+        "median": np.nanmedian
+    }[statistic]
+
+
+def compute_statistics(scores: np.ndarray, statistics: List[str]) -> Dict[str, np.ndarray]:
+    """Return the given statistics computed along the last axis of the scores.
+
+    Rows that are empty or only contain NaN values get a NaN statistic.
+
+    Parameters
+    ------------------
+    scores: np.ndarray,
+        The scores to reduce.
+    statistics: List[str],
+        The statistics to be computed.
+
+    Returns
+    ------------------
+    Dictionary with the reduced scores for each statistic.
+    """
+    # Reducing along a contiguous axis keeps the same summation
+    # order used when reducing each row on its own.
+    scores = np.ascontiguousarray(scores, dtype=np.float64)
+    if scores.shape[-1] == 0:
+        return {
+            statistic: np.full(scores.shape[:-1], np.nan)
+            for statistic in statistics
+        }
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return {
+            statistic: get_callback(statistic)(scores, axis=-1)
+            for statistic in statistics
+        }
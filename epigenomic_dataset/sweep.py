@@ -0,0 +1,177 @@
+"""Submodule providing sweeps over the TPM thresholds without reloading the data.
+
+The epigenomic data and the raw TPM values are loaded once, and for each
+pair of thresholds only the boolean mask of the regions to keep and their
+labels are computed. The data are copied only when explicitly materialized.
+"""
+from typing import Tuple
+import numpy as np
+import pandas as pd
+from .load_epigenomes import get_tpm_mask, validate_tpm_thresholds
+
+
+class ThresholdSweep:
+    """Epigenomic data and raw TPM values to threshold without copies.
+
+    The data of a task comparing promoters and enhancers hold the
+    promoters followed by the enhancers, as returned by load_task,
+    and the regions of the task are selected by their activity.
+    """
+
+    def __init__(
+        self,
+        X: pd.DataFrame,
+        y: pd.DataFrame,
+        promoters: np.ndarray = None,
+        only_active: bool = False,
+        only_inactive: bool = False
+    ):
+        """Create a sweep over given data and raw TPM values.
+
+        Parameters
+        ----------------------------
+        X: pd.DataFrame,
+            The epigenomic data.
+        y: pd.DataFrame,
+            The raw TPM values, aligned with the data.
+        promoters: np.ndarray = None,
+            Boolean array with the rows of the promoters,
+            required when filtering by activity.
+        only_active: bool = False,
+            Whether to keep only the active regions, labelling
+            the promoters as positives and the enhancers as negatives.
+        only_inactive: bool = False,
+            Whether to keep only the inactive regions, labelling
+            the promoters as positives and the enhancers as negatives.
+
+        Raises
+        ----------------------------
+        ValueError,
+            If the regions are filtered by activity
+            and the promoters are not given.
+        """
+        if (only_active or only_inactive) and promoters is None:
+            raise ValueError(
+                "The promoters are required to filter the regions by activity."
+            )
+        self._X = X
+        self._y = y
+        self._tpm = y.to_numpy().flatten()
+        self._promoters = None if promoters is None else np.asarray(promoters, dtype=bool)
+        self._only_active = only_active
+        self._only_inactive = only_inactive
+
+    @property
+    def X(self) -> pd.DataFrame:
+        """Return the epigenomic data of all the regions."""
+        return self._X
+
+    @property
+    def y(self) -> pd.DataFrame:
+        """Return the raw TPM values of all the regions."""
+        return self._y
+
+    def mask(
+        self,
+        min_active_tpm_value: float = 1,
+        max_inactive_tpm_value: float = 1
+    ) -> np.ndarray:
+        """Return the boolean mask of the regions kept with given thresholds.
+
+        Parameters
+        ----------------------------
+        min_active_tpm_value: float = 1,
+            Minimum TPM value.
+        max_inactive_tpm_value: float = 1,
+            Maximum TPM value.
+            Values between the minimum and maximum are dropped.
+
+        Raises
+        ----------------------------
+        ValueError,
+            If the thresholds are not consistent.
+
+        Returns
+        ----------------------------
+        Boolean array with the regions to keep.
+        """
+        validate_tpm_thresholds(min_active_tpm_value, max_inactive_tpm_value)
+        if self._only_active and min_active_tpm_value != max_inactive_tpm_value:
+            raise ValueError(
+                "It does not make sense to threshold different cis-regulatory "
+                "regions TPMs."
+            )
+        mask = get_tpm_mask(self._tpm, min_active_tpm_value, max_inactive_tpm_value)
+        if self._only_active:
+            mask &= self._tpm > min_active_tpm_value
+        elif self._only_inactive:
+            mask &= ~(self._tpm > min_active_tpm_value)
+        return mask
+
+    def indices(
+        self,
+        min_active_tpm_value: float = 1,
+        max_inactive_tpm_value: float = 1
+    ) -> np.ndarray:
+        """Return the positions of the regions kept with given thresholds."""
+        return np.flatnonzero(self.mask(min_active_tpm_value, max_inactive_tpm_value))
+
+    def labels(
+        self,
+        min_active_tpm_value: float = 1,
+        max_inactive_tpm_value: float = 1,
+        binarize: bool = False
+    ) -> np.ndarray:
+        """Return the labels of the regions kept with given thresholds.
+
+        Parameters
+        ----------------------------
+        min_active_tpm_value: float = 1,
+            Minimum TPM value.
+        max_inactive_tpm_value: float = 1,
+            Maximum TPM value.
+            Values between the minimum and maximum are dropped.
+        binarize: bool = False,
+            Whether to binarize the TPM values. The regions filtered
+            by activity are always labelled by their type.
+
+        Returns
+        ----------------------------
+        Array with the labels of the kept regions.
+        """
+        mask = self.mask(min_active_tpm_value, max_inactive_tpm_value)
+        if self._only_active or self._only_inactive:
+            return self._promoters[mask]
+        if binarize:
+            return self._tpm[mask] > min_active_tpm_value
+        return self._tpm[mask]
+
+    def materialize(
+        self,
+        min_active_tpm_value: float = 1,
+        max_inactive_tpm_value: float = 1,
+        binarize: bool = False
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Return copies of the data and labels kept with given thresholds.
+
+        Parameters
+        ----------------------------
+        min_active_tpm_value: float = 1,
+            Minimum TPM value.
+        max_inactive_tpm_value: float = 1,
+            Maximum TPM value.
+            Values between the minimum and maximum are dropped.
+        binarize: bool = False,
+            Whether to binarize the TPM values.
+
+        Returns
+        ----------------------------
+        Tuple with input and output DataFrames.
+        """
+        indices = self.indices(min_active_tpm_value, max_inactive_tpm_value)
+        X = self._X.iloc[indices]
+        return X, pd.DataFrame(
+            self.labels(min_active_tpm_value, max_inactive_tpm_value, binarize),
+            index=X.index,
+            columns=self._y.columns
+        )
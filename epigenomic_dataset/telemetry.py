@@ -0,0 +1,221 @@
+"""Submodule measuring the time and the resources spent by the build.
+
+Each task run by the workers is measured within its own process, and each
+stage of the build is measured in the main process, adding up the bytes,
+the regions and the retries of its tasks. The measurements are logged
+and written as a JSON and a CSV report next to the targets, so that the
+reports of different builds can be compared.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import pandas as pd
+from .logging import logger
+
+try:
+    import resource
+except ImportError:
+    # The resource module is not available on Windows.
+    resource = None
+
+COUNTERS = ("read_bytes", "written_bytes", "downloaded_bytes", "regions", "retries")
+
+
+def get_io_counters() -> Dict[str, int]:
+    """Return the bytes read and written by the current process.
+
+    The counters include the reads served by the page cache,
+    and are zero on the systems not exposing them.
+    """
+    counters = {"read_bytes": 0, "written_bytes": 0}
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                name, value = line.split(":")
+                if name == "rchar":
+                    counters["read_bytes"] = int(value)
+                elif name == "wchar":
+                    counters["written_bytes"] = int(value)
+    except OSError:
+        pass
+    return counters
+
+
+def get_peak_rss() -> Optional[int]:
+    """Return the peak resident memory in bytes of the current process.
+
+    Without the resource module, the peak is read with psutil when
+    installed, and is None on the systems not exposing it.
+    """
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memory = psutil.Process().memory_info()
+    # The peak working set is only reported on Windows.
+    return getattr(memory, "peak_wset", None)
+
+
+def get_resource_usage(children: bool = False) -> Dict[str, float]:
+    """Return the CPU seconds and the peak resident memory in bytes of given processes.
+
+    Parameters
+    --------------------------
+    children: bool = False,
+        Whether to measure the terminated children of the current
+        process instead of the current process itself.
+
+    Returns
+    --------------------------
+    Dictionary with the CPU seconds and the peak resident memory,
+    which is None when it cannot be measured.
+    """
+    if resource is None:
+        times = os.times()
+        # The CPU times of the children are zero on Windows.
+        if children:
+            return {"cpu_time": times.children_user + times.children_system, "peak_rss": None}
+        return {"cpu_time": times.user + times.system, "peak_rss": get_peak_rss()}
+    usage = resource.getrusage(
+        resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    )
+    return {
+        "cpu_time": usage.ru_utime + usage.ru_stime,
+        # The peak resident memory is reported in kilobytes on Linux.
+        "peak_rss": usage.ru_maxrss*1024
+    }
+
+
+def measured_call(arguments: Tuple[Callable, Dict]) -> Dict:
+    """Call the given function on the given task and return its measurements.
+
+    Parameters
+    --------------------------
+    arguments: Tuple[Callable, Dict],
+        The function and the task to call it on. When the function
+        returns a dictionary, such as the number of regions it
+        processed, it is added to the measurements.
+
+    Returns
+    --------------------------
+    Dictionary with the wall and CPU seconds spent running the task, the
+    peak resident memory of the worker and the bytes read and written.
+    """
+    function, task = arguments
+    usage, counters = get_resource_usage(), get_io_counters()
+    start = time.perf_counter()
+    result = function(task)
+    wall_time = time.perf_counter() - start
+    final_usage, final_counters = get_resource_usage(), get_io_counters()
+    return {
+        "wall_time": wall_time,
+        "cpu_time": final_usage["cpu_time"] - usage["cpu_time"],
+        "peak_rss": final_usage["peak_rss"],
+        **{
+            counter: final_counters[counter] - counters[counter]
+            for counter in counters
+        },
+        **(result if isinstance(result, dict) else {})
+    }
+
+
+def get_regions_per_second(record: Dict) -> float:
+    """Return the regions processed per second in given measurement."""
+    if not record.get("regions") or not record["wall_time"]:
+        return 0.0
+    return record["regions"]/record["wall_time"]
+
+
+@contextmanager
+def measure_stage(report: List[Dict], stage: str, **fields) -> Iterator[Dict]:
+    """Measure the stage run within the context and append it to the report.
+
+    The yielded record has a list of "tasks", where the measurements of
+    the tasks of the stage are to be appended, whose counters are added
+    to the ones of the stage. The CPU time includes the worker processes
+    that terminated within the stage.
+
+    Parameters
+    --------------------------
+    report: List[Dict],
+        The report where to append the measurements of the stage.
+    stage: str,
+        Name of the stage.
+    **fields,
+        Other fields describing the stage, such as its targets.
+    """
+    record = {"stage": stage, **fields, "tasks": []}
+    usage = get_resource_usage()
+    children_usage = get_resource_usage(children=True)
+    counters = get_io_counters()
+    start = time.perf_counter()
+    yield record
+    record["wall_time"] = time.perf_counter() - start
+    final_usage = get_resource_usage()
+    final_children_usage = get_resource_usage(children=True)
+    final_counters = get_io_counters()
+    record["cpu_time"] = (
+        final_usage["cpu_time"] - usage["cpu_time"] +
+        final_children_usage["cpu_time"] - children_usage["cpu_time"]
+    )
+    peak_rss = [
+        peak
+        for peak in (final_usage["peak_rss"], *[task.get("peak_rss") for task in record["tasks"]])
+        if peak is not None
+    ]
+    record["peak_rss"] = max(peak_rss) if peak_rss else None
+    for counter in COUNTERS:
+        record[counter] = (
+            final_counters.get(counter, 0) - counters.get(counter, 0) +
+            sum(task.get(counter, 0) for task in record["tasks"])
+        )
+    record["regions_per_second"] = get_regions_per_second(record)
+    report.append(record)
+    logger.info(
+        "%s: %.1fs wall, %.1fs CPU, %s MB peak RSS, %.1f MB read, %.1f MB written, "
+        "%.1f MB downloaded, %s regions at %.0f regions/s and %s retries over %s tasks.",
+        stage, record["wall_time"], record["cpu_time"],
+        "unknown" if record["peak_rss"] is None else "{:.1f}".format(record["peak_rss"]/2**20),
+        record["read_bytes"]/2**20, record["written_bytes"]/2**20,
+        record["downloaded_bytes"]/2**20, record["regions"],
+        record["regions_per_second"], record["retries"], len(record["tasks"])
+    )
+
+
+def write_report(report: List[Dict], root: str, name: str = None) -> str:
+    """Write the given report as JSON and CSV in the given targets directory.
+
+    Parameters
+    --------------------------
+    report: List[Dict],
+        The measured stages, with their tasks.
+    root: str,
+        The targets directory.
+    name: str = None,
+        Name of the report files. By default, the report is named
+        after the current time, so that each build has its own.
+
+    Returns
+    --------------------------
+    The path of the JSON report, next to which the CSV one is written.
+    """
+    if name is None:
+        name = "telemetry-{}".format(time.strftime("%Y%m%d-%H%M%S"))
+    path = os.path.join(root, "{}.json".format(name))
+    with open(path, "w") as f:
+        json.dump(report, f, indent=4)
+    # The CSV has a row for each stage followed by a row for each of its tasks.
+    rows = []
+    for record in report:
+        stage = {key: value for key, value in record.items() if key != "tasks"}
+        rows.append(stage)
+        for task in record["tasks"]:
+            rows.append({
+                "stage": record["stage"],
+                **task,
+                "regions_per_second": get_regions_per_second(task)
+            })
+    pd.DataFrame(rows).to_csv(os.path.join(root, "{}.csv".format(name)), index=False)
+    return path
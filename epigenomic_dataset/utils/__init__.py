@@ -1,11 +1,20 @@
 """Generic utilities used in the package."""
-from .normalize_epigenomic_data import normalize_epigenomic_data
-from .cell_lines import get_cell_lines
-from .window_sizes import get_window_sizes
-from .available_metrics import get_available_metrics
+from ..lazy import attach
+
+# The normalization imports scikit-learn, so it is imported on first access.
+__getattr__, __dir__ = attach(__name__, {
+    "normalize_epigenomic_data": ".normalize_epigenomic_data",
+    "evaluate_imputation": ".normalize_epigenomic_data",
+    "EpigenomicNormalizer": ".normalize_epigenomic_data",
+    "get_cell_lines": ".cell_lines",
+    "get_window_sizes": ".window_sizes",
+    "get_available_metrics": ".available_metrics",
+})
 
 __all__ = [
     "normalize_epigenomic_data",
+    "evaluate_imputation",
+    "EpigenomicNormalizer",
     "get_cell_lines",
     "get_window_sizes",
     "get_available_metrics"
@@ -1,46 +1,440 @@
 """Module providing normalization for epigenomic data."""
-from typing import Tuple
+import hashlib
+import os
+import pickle
+from typing import Dict, Tuple
 import numpy as np
+from joblib import Parallel, delayed
+from sklearn import config_context
 from sklearn.impute import KNNImputer
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
+from ..cache import get_cache_key
+from ..logging import logger
+
+IMPUTATIONS = ("exact", "subsample")
+
+
+def get_imputer(
+    train_x: np.ndarray,
+    imputation: str = "exact",
+    max_donors: int = 10000,
+    random_state: int = 42
+) -> KNNImputer:
+    """Return KNN imputer fitted on the given training data.
+
+    Parameters
+    -------------------------
+    train_x: np.ndarray,
+        Training data to use to fit the imputer.
+    imputation: str = "exact",
+        Imputation strategy, either "exact", which uses all the training
+        rows as neighbours, or "subsample", which uses as neighbours at
+        most max_donors training rows sampled uniformly, bounding the
+        cost of imputing each row.
+    max_donors: int = 10000,
+        Maximum number of training rows used as neighbours when subsampling.
+    random_state: int = 42,
+        Random state used to sample the neighbours.
+
+    Raises
+    -------------------------
+    ValueError,
+        If the given imputation strategy is not supported.
+
+    Returns
+    -------------------------
+    The fitted imputer.
+    """
+    if imputation not in IMPUTATIONS:
+        raise ValueError(
+            "Given imputation {} is not supported. The supported imputations are {}.".format(
+                imputation, ", ".join(IMPUTATIONS)
+            )
+        )
+    if imputation == "subsample" and len(train_x) > max_donors:
+        train_x = train_x[np.sort(
+            np.random.RandomState(random_state).choice(
+                len(train_x), max_donors, replace=False)
+        )]
+    return KNNImputer().fit(train_x)
+
+
+def transform_batch(imputer: KNNImputer, x: np.ndarray, working_memory: int = None) -> np.ndarray:
+    """Return the given batch imputed with the given working memory."""
+    # The scikit-learn configuration is local to each thread,
+    # so it is set in the thread imputing the batch.
+    with config_context(working_memory=working_memory):
+        return imputer.transform(x)
+
+
+def impute(
+    imputer: KNNImputer,
+    x: np.ndarray,
+    batch_size: int = None,
+    n_jobs: int = None,
+    working_memory: int = None
+) -> np.ndarray:
+    """Return the given data imputed with the given imputer.
+
+    Each row is imputed independently from the others, so the rows are
+    imputed in batches, optionally in parallel, with the same results.
+
+    Parameters
+    -------------------------
+    imputer: KNNImputer,
+        The fitted imputer.
+    x: np.ndarray,
+        Data to impute.
+    batch_size: int = None,
+        Number of rows imputed at once. By default, all of them.
+    n_jobs: int = None,
+        Number of threads imputing the batches. By default, one.
+        The distances are computed by NumPy, which releases the GIL.
+    working_memory: int = None,
+        Maximum memory in MiB of the chunks of the distances
+        between the rows and the neighbours. By default,
+        the working memory of the scikit-learn configuration.
+
+    Returns
+    -------------------------
+    The imputed data.
+    """
+    if batch_size is None:
+        batch_size = max(1, len(x))
+    batches = Parallel(n_jobs=n_jobs, prefer="threads")(
+        delayed(transform_batch)(imputer, x[start:start + batch_size], working_memory)
+        for start in range(0, len(x), batch_size)
+    )
+    return np.vstack(batches)
+
+
+def evaluate_imputation(
+    train_x: np.ndarray,
+    imputation: str = "subsample",
+    max_donors: int = 10000,
+    batch_size: int = None,
+    n_jobs: int = None,
+    missing_rate: float = 0.1,
+    max_rows: int = 2000,
+    random_state: int = 42
+) -> Dict[str, float]:
+    """Return how the given imputation compares with the exact one.
+
+    A fraction of the known values of a sample of the rows is hidden,
+    and then imputed both with the given strategy and with the exact
+    one, using all the training data as neighbours.
+
+    Parameters
+    -------------------------
+    train_x: np.ndarray,
+        Training data to use to fit the imputers.
+    imputation: str = "subsample",
+        Imputation strategy to compare with the exact one.
+    max_donors: int = 10000,
+        Maximum number of training rows used as neighbours when subsampling.
+    batch_size: int = None,
+        Number of rows imputed at once. By default, all of them.
+    n_jobs: int = None,
+        Number of threads imputing the batches. By default, one.
+    missing_rate: float = 0.1,
+        Fraction of the known values of the sampled rows to hide.
+    max_rows: int = 2000,
+        Maximum number of rows whose values are hidden and imputed.
+    random_state: int = 42,
+        Random state used to sample the rows and the values to hide.
+
+    Returns
+    -------------------------
+    Dictionary with the root mean squared error of the exact and of the
+    given imputation over the hidden values, the relative change of the
+    error and the largest absolute difference between the two imputations.
+    """
+    random = np.random.RandomState(random_state)
+    rows = np.sort(random.choice(
+        len(train_x), min(max_rows, len(train_x)), replace=False))
+    hidden = ~np.isnan(train_x[rows]) & (random.uniform(size=(len(rows), train_x.shape[1])) < missing_rate)
+    masked_x = train_x.copy()
+    masked_x[rows] = np.where(hidden, np.nan, train_x[rows])
+    true_values = train_x[rows][hidden]
+    exact_values = impute(
+        get_imputer(masked_x), masked_x[rows], batch_size, n_jobs)[hidden]
+    values = impute(
+        get_imputer(masked_x, imputation, max_donors, random_state),
+        masked_x[rows], batch_size, n_jobs
+    )[hidden]
+    exact_rmse = np.sqrt(np.mean((exact_values - true_values)**2))
+    rmse = np.sqrt(np.mean((values - true_values)**2))
+    report = {
+        "exact_rmse": float(exact_rmse),
+        "rmse": float(rmse),
+        "relative_change": float((rmse - exact_rmse)/exact_rmse) if exact_rmse > 0 else 0.0,
+        "max_absolute_difference": float(np.abs(values - exact_values).max()) if hidden.any() else 0.0
+    }
+    logger.info(
+        "The %s imputation has RMSE %.4f against %.4f of the exact one (%+.2f%%) "
+        "over %s hidden values.",
+        imputation, report["rmse"], report["exact_rmse"],
+        report["relative_change"]*100, hidden.sum()
+    )
+    return report
+
+
+def get_array_hash(x: np.ndarray) -> str:
+    """Return the SHA256 hash of the shape, type and values of given array."""
+    sha256 = hashlib.sha256("{}{}".format(x.shape, x.dtype).encode("utf8"))
+    x = np.ascontiguousarray(x)
+    for start in range(0, len(x), 2**16):
+        sha256.update(x[start:start + 2**16].tobytes())
+    return sha256.hexdigest()
+
+
+class EpigenomicNormalizer:
+    """Imputer and scaler of epigenomic data, fitted once and reused."""
+
+    def __init__(
+        self,
+        imputation: str = "exact",
+        max_donors: int = 10000,
+        batch_size: int = None,
+        n_jobs: int = None,
+        working_memory: int = None,
+        random_state: int = 42
+    ):
+        """Create new normalizer.
+
+        Parameters
+        -------------------------
+        imputation: str = "exact",
+            Imputation strategy, either "exact" or "subsample".
+            When fitting in chunks, the neighbours are always
+            sampled from at most max_donors training rows.
+        max_donors: int = 10000,
+            Maximum number of training rows used as neighbours when subsampling.
+        batch_size: int = None,
+            Number of rows imputed at once. By default, all of them.
+        n_jobs: int = None,
+            Number of threads imputing the batches. By default, one.
+        working_memory: int = None,
+            Maximum memory in MiB of the chunks of the distances
+            between the rows and the neighbours.
+        random_state: int = 42,
+            Random state used to sample the neighbours.
+
+        Raises
+        -------------------------
+        ValueError,
+            If the given imputation strategy is not supported.
+        """
+        if imputation not in IMPUTATIONS:
+            raise ValueError(
+                "Given imputation {} is not supported. The supported imputations are {}.".format(
+                    imputation, ", ".join(IMPUTATIONS)
+                )
+            )
+        self._imputation = imputation
+        self._max_donors = max_donors
+        self._batch_size = batch_size
+        self._n_jobs = n_jobs
+        self._working_memory = working_memory
+        self._random_state = random_state
+        self._imputer = None
+        self._scaler = None
+        # State of the fitting in chunks.
+        self._donors = None
+        self._seen = 0
+        self._minimums = None
+        self._maximums = None
+        self._random = np.random.RandomState(random_state)
+
+    def get_parameters(self) -> Dict:
+        """Return the parameters determining the fitted normalizer."""
+        return {
+            "imputation": self._imputation,
+            "max_donors": self._max_donors,
+            "random_state": self._random_state
+        }
+
+    def _impute(self, x: np.ndarray) -> np.ndarray:
+        return impute(
+            self._imputer, x, self._batch_size, self._n_jobs, self._working_memory
+        )
+
+    def fit(self, train_x: np.ndarray) -> "EpigenomicNormalizer":
+        """Fit the normalizer on the given training data."""
+        self.fit_transform(train_x)
+        return self
+
+    def fit_transform(self, train_x: np.ndarray) -> np.ndarray:
+        """Fit the normalizer on the given training data and return them normalized."""
+        self._imputer = get_imputer(
+            train_x, self._imputation, self._max_donors, self._random_state)
+        imputed_train_x = self._impute(train_x)
+        self._scaler = MinMaxScaler().fit(imputed_train_x)
+        return self._scaler.transform(imputed_train_x)
+
+    def partial_fit(self, train_x: np.ndarray) -> "EpigenomicNormalizer":
+        """Update the normalizer with the given chunk of the training data.
+
+        The neighbours of the imputation are a uniform sample of at most
+        max_donors of the rows seen so far, kept with reservoir sampling.
+        As the imputed values are averages of known values, the range
+        of each imputed feature is the one of its known values, so the
+        scaler is fitted without imputing the training data.
+        Empty chunks are ignored.
+
+        Parameters
+        -------------------------
+        train_x: np.ndarray,
+            Chunk of the training data.
+
+        Returns
+        -------------------------
+        The normalizer itself.
+        """
+        if len(train_x) == 0:
+            return self
+        if self._donors is None:
+            self._donors = np.empty((0, train_x.shape[1]))
+            self._minimums = np.full(train_x.shape[1], np.nan)
+            self._maximums = np.full(train_x.shape[1], np.nan)
+        # The first rows fill the reservoir.
+        free = max(0, min(self._max_donors - len(self._donors), len(train_x)))
+        self._donors = np.vstack([self._donors, train_x[:free]])
+        # Each following row replaces a random donor with probability
+        # given by the size of the reservoir over the rows seen so far.
+        positions = self._random.randint(
+            0, self._seen + np.arange(free, len(train_x)) + 1)
+        replaced = positions < self._max_donors
+        self._donors[positions[replaced]] = train_x[free:][replaced]
+        self._seen += len(train_x)
+        self._minimums = np.fmin(self._minimums, np.fmin.reduce(train_x, axis=0))
+        self._maximums = np.fmax(self._maximums, np.fmax.reduce(train_x, axis=0))
+        self._imputer = KNNImputer().fit(self._donors)
+        # The features without values in the donors are dropped by the imputer.
+        valid = ~np.isnan(self._donors).all(axis=0)
+        self._scaler = MinMaxScaler().fit(
+            np.vstack([self._minimums, self._maximums])[:, valid]
+        )
+        return self
+
+    def transform(self, x: np.ndarray) -> np.ndarray:
+        """Return the given data imputed and scaled.
+
+        Raises
+        -------------------------
+        ValueError,
+            If the normalizer was not fitted.
+        """
+        if self._scaler is None:
+            raise ValueError("The normalizer must be fitted before transforming data.")
+        return self._scaler.transform(self._impute(x))
+
+    def save(self, path: str):
+        """Write the normalizer at the given path."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temporary_path = "{}.tmp".format(path)
+        with open(temporary_path, "wb") as f:
+            pickle.dump(self, f)
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def load(path: str) -> "EpigenomicNormalizer":
+        """Return the normalizer written at the given path."""
+        with open(path, "rb") as f:
+            return pickle.load(f)
 
 
 def normalize_epigenomic_data(
     train_x: np.ndarray,
-    test_x: np.ndarray = None
+    test_x: np.ndarray = None,
+    imputation: str = "exact",
+    max_donors: int = 10000,
+    batch_size: int = None,
+    n_jobs: int = None,
+    working_memory: int = None,
+    normalizer: EpigenomicNormalizer = None,
+    cache_directory: str = None,
+    return_normalizer: bool = False
 ) -> Tuple[np.ndarray]:
     """Return imputed and normalized epigenomic data.
 
     We fit the imputation and normalization on the training data and
     apply it to both the training data and the test data.
 
+    The exact KNN imputation compares each row with missing values with
+    all the training rows, so its cost grows quadratically with the rows.
+    On large matrices, the neighbours can be sampled from a bounded
+    subsample of the training rows, whose effect on the quality of the
+    imputation can be measured with evaluate_imputation.
+
     Parameters
     -------------------------
     train_x: np.ndarray,
         Training data to use to fit the imputer and scaled.
     test_x: np.ndarray = None,
         Test data to be normalized.
+    imputation: str = "exact",
+        Imputation strategy, either "exact" or "subsample".
+    max_donors: int = 10000,
+        Maximum number of training rows used as neighbours when subsampling.
+    batch_size: int = None,
+        Number of rows imputed at once. By default, all of them.
+    n_jobs: int = None,
+        Number of threads imputing the batches. By default, one.
+    working_memory: int = None,
+        Maximum memory in MiB of the chunks of the distances
+        between the rows and the neighbours.
+    normalizer: EpigenomicNormalizer = None,
+        Normalizer already fitted on the training data, for instance
+        in chunks with its partial_fit method, to use instead of
+        fitting a new one. The imputation parameters are then ignored.
+    cache_directory: str = None,
+        Directory where to cache the normalizer fitted on the training
+        data, together with the normalized training data, keyed by the
+        hash of the training data and of the imputation parameters.
+        By default, nothing is cached.
+    return_normalizer: bool = False,
+        Whether to also return the fitted normalizer.
+
+    Raises
+    -------------------------
+    ValueError,
+        If the given imputation strategy is not supported.
 
     Returns
     -------------------------
-    Tuple with imputed and scaled train and test data.
+    Tuple with imputed and scaled train and test data,
+    followed by the fitted normalizer when requested.
     """
-    # Create the imputer and scaler object
-    imputer = KNNImputer()
-    scaler = MinMaxScaler()
-    # Fit the imputer object
-    imputer.fit(train_x)
-    # Impute the train and test data
-    imputed_train_x = imputer.transform(train_x)
-    if test_x is not None:
-        imputed_test_x = imputer.transform(test_x)
-    # Fit the scaler object
-    scaler.fit(imputed_train_x)
-    # Scale the train and test data
-    scaled_train_x = scaler.transform(imputed_train_x)
-    if test_x is not None:
-        scaled_test_x = scaler.transform(imputed_test_x)
+    if normalizer is None:
+        normalizer = EpigenomicNormalizer(
+            imputation, max_donors, batch_size, n_jobs, working_memory
+        )
+        scaled_train_x = None
+        if cache_directory is not None:
+            key = get_cache_key(
+                data=get_array_hash(train_x), **normalizer.get_parameters()
+            )
+            normalizer_path = os.path.join(cache_directory, "normalizer-{}.pkl".format(key))
+            train_path = os.path.join(cache_directory, "normalized-{}.npy".format(key))
+            if os.path.exists(normalizer_path) and os.path.exists(train_path):
+                normalizer = EpigenomicNormalizer.load(normalizer_path)
+                scaled_train_x = np.load(train_path)
+        if scaled_train_x is None:
+            # Fit the imputer and the scaler, and normalize the train data
+            scaled_train_x = normalizer.fit_transform(train_x)
+            if cache_directory is not None:
+                os.makedirs(cache_directory, exist_ok=True)
+                np.save(train_path, scaled_train_x)
+                normalizer.save(normalizer_path)
+    else:
+        scaled_train_x = normalizer.transform(train_x)
+    results = [scaled_train_x]
     if test_x is not None:
-        # Return the normalized data
-        return scaled_train_x, scaled_test_x
-    return scaled_train_x
\ No newline at end of file
+        # Normalize the test data
+        results.append(normalizer.transform(test_x))
+    if return_normalizer:
+        results.append(normalizer)
+    if len(results) == 1:
+        return scaled_train_x
+    return tuple(results)
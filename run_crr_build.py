@@ -1,7 +1,7 @@
 from crr_labels import fantom, roadmap
 from epigenomic_dataset import build, logger
 import pandas as pd
-from typing import List
+from typing import Dict, List
 import os
 from tqdm.auto import tqdm
 
@@ -22,17 +22,61 @@ def bed_files_exist(root: str, assembly: str, window_size: int):
     )
 
 
-def run_pipeline(
+def load_beds(dataset: str, assembly: str, windows_size: int, cell_lines: List[str]):
+    """Return enhancers and promoters of given dataset and window size."""
+    enhancers_path = get_bed_path(dataset, assembly,
+                                  "enhancers", windows_size)
+    promoters_path = get_bed_path(dataset, assembly,
+                                  "promoters", windows_size)
+
+    if not bed_files_exist(dataset, assembly, windows_size):
+        logger.info("Retrieving {} labels".format(dataset.upper()))
+        if dataset == "fantom":
+            enhancers, promoters = next(fantom(
+                # list of cell lines to be considered.
+                cell_lines=cell_lines,
+                # Genomic assembly to retrieve.
+                genome=assembly,
+                # window size to use for the various regions.
+                window_sizes=[windows_size],
+            ))
+        else:
+            enhancers, promoters = roadmap(
+                # List of cell lines to be considered.
+                cell_lines=cell_lines,
+                # Genomic assembly to retrieve.
+                genome=assembly,
+                # Window size to use for the various regions.
+                window_size=windows_size,
+            )
+        for path, bed in ((enhancers_path, enhancers), (promoters_path, promoters)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            bed.to_csv(
+                path,
+                sep="\t",
+                index=False
+            )
+        return enhancers, promoters
+
+    logger.info("Loading {} labels.".format(dataset.upper()))
+    return [
+        pd.read_csv(
+            path,
+            sep="\t",
+            low_memory=False
+        )
+        for path in (enhancers_path, promoters_path)
+    ]
+
+
+def write_regions(
     bed: pd.DataFrame,
     root: str,
     assembly: str,
     region: str,
-    windows_size: int,
-    cell_lines: List[str]
-):
-    path = get_bed_path(root, assembly, region, windows_size)
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    bed.to_csv(path, sep="\t", index=False)
+    windows_size: int
+) -> str:
+    """Write the regions to extract and return the path of the bed file."""
     regions_path = "{root}/{assembly}/{windows_size}/{region}/regions.bed".format(
         root=root,
         assembly=assembly,
@@ -56,23 +100,64 @@ def run_pipeline(
         header=False,
         index=False
     )
+    return regions_path
+
+
+def get_window_anchor(dataset: str, region: str) -> str:
+    """Return where the smaller windows are anchored in the regions of given dataset.
+
+    Only the FANTOM promoters end at the transcription start site on
+    their strand, while the other regions, including the ROADMAP
+    promoters, are centered windows.
+    """
+    return "tss" if dataset == "fantom" and region == "promoters" else "center"
+
+
+def run_pipeline(
+    beds: Dict[str, pd.DataFrame],
+    dataset: str,
+    root: str,
+    assembly: str,
+    windows_sizes: List[int],
+    cell_lines: List[str]
+):
+    """Build the epigenomic data of all the window sizes of given regions.
+
+    The bigWig files are downloaded and extracted once for all the
+    region sets, using the regions of the widest window size. As in
+    the labels, the smaller windows of the FANTOM promoters are anchored
+    at the transcription start site, while the ones of the other regions
+    are centered within them.
+    """
     build(
-        bed_path=regions_path,
+        bed_path=[
+            (
+                write_regions(
+                    bed,
+                    root=root,
+                    assembly=assembly,
+                    region=region,
+                    windows_size=max(windows_sizes)
+                ),
+                "{root}/{assembly}/{{window_size}}/{region}".format(
+                    root=root,
+                    assembly=assembly,
+                    region=region
+                ),
+                get_window_anchor(dataset, region)
+            )
+            for region, bed in beds.items()
+        ],
         cell_lines=cell_lines,
         assembly=assembly,
-        targets_path="{root}/{assembly}/{windows_size}/{region}".format(
-            root=root,
-            assembly=assembly,
-            windows_size=windows_size,
-            region=region
-        ),
         extraction_workers=1,
         concatenation_workers=20,
         mine_max=True,
         mine_min=False,
         mine_mean=True,
         mine_median=True,
-        mine_variance=False
+        mine_variance=False,
+        window_sizes=windows_sizes
     )
 
 
@@ -87,109 +172,34 @@ if __name__ == "__main__":
     # because we are still choosing the states from the model to be used.
     build_roadmap = False
 
-    for windows_size in tqdm(windows_sizes, desc="Parsing window sizes"):
-
-        enhancers_path = get_bed_path("fantom", assembly,
-                                      "enhancers", windows_size)
-        promoters_path = get_bed_path("fantom", assembly,
-                                      "promoters", windows_size)
+    datasets = [("fantom", cell_lines_fantom, cell_lines_encode)]
+    if build_roadmap:
+        datasets.append(
+            ("roadmap", cell_lines_roadmap, cell_lines_roadmap)
+        )
 
+    for dataset, label_cell_lines, epigenomes_cell_lines in datasets:
         ####################################################
-        # HERE WE BUILD FANTOM                             #
+        # HERE WE BUILD THE LABELS OF EACH WINDOW SIZE     #
         ####################################################
+        for windows_size in tqdm(windows_sizes, desc="Parsing window sizes"):
+            beds = load_beds(dataset, assembly,
+                             windows_size, label_cell_lines)
+            if windows_size == max(windows_sizes):
+                enhancers, promoters = beds
 
-        if not bed_files_exist("fantom", assembly, windows_size):
-            logger.info("Retrieving FANTOM labels")
-            enhancers, promoters = next(fantom(
-                # list of cell lines to be considered.
-                cell_lines=cell_lines_fantom,
-                # Genomic assembly to retrieve.
-                genome=assembly,
-                # window size to use for the various regions.
-                window_sizes=[windows_size],
-            ))
-            for path in (enhancers_path, promoters_path):
-                os.makedirs(os.path.dirname(path), exist_ok=True)
-
-            enhancers.to_csv(
-                enhancers_path,
-                sep="\t",
-                index=False
-            )
-            promoters.to_csv(
-                promoters_path,
-                sep="\t",
-                index=False
-            )
-        else:
-            logger.info("Loading FANTOM labels.")
-            logger.info("Loading Enhancers.")
-            enhancers = pd.read_csv(
-                enhancers_path,
-                sep="\t",
-                low_memory=False
-            )
-            logger.info("Loading Promoters.")
-            promoters = pd.read_csv(
-                promoters_path,
-                sep="\t",
-                low_memory=False
-            )
-
-        logger.info("Starting to extract enhancers data.")
-        run_pipeline(
-            enhancers,
-            root="fantom",
-            assembly=assembly,
-            region="enhancers",
-            windows_size=windows_size,
-            cell_lines=cell_lines_encode
-        )
-        logger.info("Starting to extract promoters data.")
+        ####################################################
+        # HERE WE BUILD THE EPIGENOMIC DATA                #
+        ####################################################
+        logger.info("Starting to extract enhancers and promoters data.")
         run_pipeline(
-            promoters,
-            root="fantom",
+            {
+                "enhancers": enhancers,
+                "promoters": promoters
+            },
+            dataset=dataset,
+            root=dataset,
             assembly=assembly,
-            region="promoters",
-            windows_size=windows_size,
-            cell_lines=cell_lines_encode
+            windows_sizes=windows_sizes,
+            cell_lines=epigenomes_cell_lines
         )
-
-        if build_roadmap:
-            ####################################################
-            # HERE WE BUILD ROADMAP                            #
-            ####################################################
-
-            if not bed_files_exist("roadmap", assembly, windows_size):
-                logger.info("Retrieving ROADMAP labels")
-                enhancers, promoters = roadmap(
-                    # List of cell lines to be considered.
-                    cell_lines=cell_lines_roadmap,
-                    # Genomic assembly to retrieve.
-                    genome=assembly,
-                    # Window size to use for the various regions.
-                    window_size=windows_size,
-                )
-            else:
-                print("Loading ROADMAP labels")
-                enhancers = pd.read_csv(get_bed_path(
-                    "roadmap", assembly, "enhancers", windows_size), sep="\t")
-                promoters = pd.read_csv(get_bed_path(
-                    "roadmap", assembly, "promoters", windows_size), sep="\t")
-
-            run_pipeline(
-                enhancers,
-                root="roadmap",
-                assembly=assembly,
-                region="enhancers",
-                windows_size=windows_size,
-                cell_lines=cell_lines_roadmap
-            )
-            run_pipeline(
-                promoters,
-                root="roadmap",
-                assembly=assembly,
-                region="promoters",
-                windows_size=windows_size,
-                cell_lines=cell_lines_roadmap
-            )
@@ -60,11 +60,11 @@ setup(
     tests_require=test_deps,
     # Add here the package dependencies
     install_requires=[
-        "encodeproject>=1.0.19",
         "downloaders",
         "pandas>=1.1.5",
         "pybwtool>=1.0.8",
         "crr_labels>=1.1.1",
+        "requests",
     ],
     extras_require=extras,
 )
\ No newline at end of file
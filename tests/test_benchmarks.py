@@ -0,0 +1,24 @@
+import json
+from benchmarks.benchmark import compare_to_baseline, main
+
+
+def test_benchmarks(tmp_path):
+    """Test that the benchmarks run offline and are compared to their baseline."""
+    baseline_path = str(tmp_path / "baseline.json")
+    arguments = ["--regions", "200", "--targets", "2", "--cell-lines", "K562", "--workers", "1"]
+    assert main(arguments + ["--output", baseline_path]) == 0
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    assert set(baseline["benchmarks"]) == {
+        "extract", "mine", "concatenate", "load_epigenomes",
+        "load_all_tasks", "normalize_epigenomic_data",
+        "import_package", "import_loaders"
+    }
+    # Extracting the two region sets of the four bigWigs.
+    assert baseline["benchmarks"]["extract"]["regions"] == 1600
+    assert all(record["peak_rss"] > 0 for record in baseline["benchmarks"].values())
+    assert compare_to_baseline(baseline, baseline) == []
+    slower = json.loads(json.dumps(baseline))
+    slower["benchmarks"]["mine"]["regions_per_second"] /= 2
+    slower["benchmarks"]["import_package"]["wall_time"] *= 2
+    assert len(compare_to_baseline(slower, baseline)) == 2
@@ -0,0 +1,69 @@
+import importlib
+import os
+import pandas as pd
+from epigenomic_dataset import load_epigenomes
+from epigenomic_dataset.cache import CACHE_DIRECTORY
+from .utils import create_dataset
+
+
+def fail_parsing(*args, **kwargs):
+    raise AssertionError("The cached matrices should have been used.")
+
+
+def test_cache_matches_parsing(tmp_path, monkeypatch):
+    """Test that the cached matrices match the parsed ones."""
+    root = str(tmp_path)
+    create_dataset(root)
+    kwargs = dict(root=root, verbose=0, min_active_tpm_value=2, binarize=True)
+    X, y = load_epigenomes(**kwargs)
+    X_cached, y_cached = load_epigenomes(cache=True, **kwargs)
+    assert len(os.listdir(os.path.join(root, CACHE_DIRECTORY))) == 1
+    pd.testing.assert_frame_equal(X, X_cached)
+    pd.testing.assert_frame_equal(y, y_cached)
+    expected = {
+        threshold: load_epigenomes(**{**kwargs, "min_active_tpm_value": threshold})
+        for threshold in (1, 3)
+    }
+    # Since the thresholds are applied after the cache, the
+    # same entry is used for all the values of the thresholds.
+    monkeypatch.setattr(
+        importlib.import_module("epigenomic_dataset.load_epigenomes"),
+        "parse_epigenomes",
+        fail_parsing
+    )
+    for threshold, (X, y) in expected.items():
+        X_cached, y_cached = load_epigenomes(
+            cache=True, **{**kwargs, "min_active_tpm_value": threshold})
+        pd.testing.assert_frame_equal(X, X_cached)
+        pd.testing.assert_frame_equal(y, y_cached)
+    # The returned matrices can be edited without changing the cache.
+    X_cached.iloc[0, 0] = -1
+    X_cached, _ = load_epigenomes(
+        cache=True, **{**kwargs, "min_active_tpm_value": threshold})
+    pd.testing.assert_frame_equal(X, X_cached)
+
+
+def test_cache_invalidation_and_eviction(tmp_path):
+    """Test that outdated entries are parsed again and old entries evicted."""
+    root = str(tmp_path)
+    create_dataset(root)
+    load_epigenomes(root=root, verbose=0, cache=True)
+    label_path = os.path.join(root, "fantom", "hg38", "256", "promoters.bed.xz")
+    labels = pd.read_csv(label_path, sep="\t")
+    labels["K562"] += 1
+    labels.to_csv(label_path, sep="\t", index=False)
+    _, y = load_epigenomes(root=root, verbose=0, cache=True)
+    _, y_parsed = load_epigenomes(root=root, verbose=0)
+    pd.testing.assert_frame_equal(y, y_parsed)
+    cache_path = os.path.join(root, CACHE_DIRECTORY)
+    assert len(os.listdir(cache_path)) == 1
+    # With a cap fitting a single entry, only the last one is kept.
+    entry, = os.listdir(cache_path)
+    size = sum(
+        os.path.getsize(os.path.join(cache_path, entry, file_name))
+        for file_name in os.listdir(os.path.join(cache_path, entry))
+    )
+    load_epigenomes(root=root, verbose=0, cache=True,
+                    region="enhancers", cache_size=size*3//2)
+    assert len(os.listdir(cache_path)) == 1
+    assert os.listdir(cache_path) != [entry]
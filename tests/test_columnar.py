@@ -0,0 +1,53 @@
+import os
+import pandas as pd
+from epigenomic_dataset import load_epigenomes
+from epigenomic_dataset.concatenate import concatenate
+from epigenomic_dataset.columnar import get_columnar_path, read_columnar, write_columnar
+from epigenomic_dataset.regions import compact_index
+from .utils import create_dataset, create_regions, create_cell_line_matrix, TARGETS
+
+
+def test_concatenate_columnar(tmp_path):
+    """Test that the columnar output matches the compressed CSV."""
+    root = str(tmp_path)
+    matrix = create_cell_line_matrix(create_regions(100, 128), 0)
+    os.makedirs(os.path.join(root, "K562"))
+    for target in TARGETS:
+        matrix[target].reset_index().to_csv(
+            os.path.join(root, "K562", "{}.csv.gz".format(target)),
+            sep="\t",
+            index=False
+        )
+    concatenate(root, ["K562"], 1, columnar=True)
+    csv = pd.read_csv(
+        os.path.join(root, "K562.csv.xz"),
+        index_col=[0, 1, 2, 3],
+        header=[0, 1]
+    )
+    csv.index = compact_index(csv.index)
+    columnar = read_columnar(os.path.join(root, "K562.columnar"))
+    # The CSV parser does not restore the names of the index levels.
+    pd.testing.assert_frame_equal(
+        csv, columnar[csv.columns], check_names=False)
+    mean = read_columnar(
+        os.path.join(root, "K562.columnar"),
+        columns=lambda column: "mean" in column
+    )
+    assert (mean.columns.get_level_values(1) == "mean").all()
+    pd.testing.assert_frame_equal(mean, columnar[mean.columns])
+
+
+def test_load_epigenomes_prefers_columnar(tmp_path):
+    """Test that load_epigenomes returns the same data from the columnar format."""
+    root = str(tmp_path)
+    create_dataset(root)
+    X, y = load_epigenomes(root=root, verbose=0)
+    data_path = os.path.join(root, "fantom", "hg38", "256", "promoters", "K562.csv.xz")
+    X_csv = pd.read_csv(data_path, index_col=[0, 1, 2, 3], header=[0, 1])
+    write_columnar(X_csv, get_columnar_path(data_path))
+    os.remove(data_path)
+    X_columnar, y_columnar = load_epigenomes(root=root, verbose=0)
+    assert not os.path.exists(data_path)
+    pd.testing.assert_frame_equal(X, X_columnar, check_names=False)
+    assert list(X.index.names) == list(X_columnar.index.names)
+    pd.testing.assert_frame_equal(y, y_columnar)
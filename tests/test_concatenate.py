@@ -0,0 +1,49 @@
+import lzma
+import os
+import pandas as pd
+import pytest
+from epigenomic_dataset.concatenate import concatenate, concatenate_cell_line
+from epigenomic_dataset.columnar import read_columnar
+from .utils import create_cell_line_matrix, create_regions, TARGETS
+
+
+def create_targets(root: str, regions_number: int = 1000):
+    """Write the targets of a cell line in given root."""
+    matrix = create_cell_line_matrix(create_regions(regions_number, 128), 0)
+    os.makedirs(os.path.join(root, "K562"))
+    for target in TARGETS:
+        matrix[target].reset_index().to_csv(
+            os.path.join(root, "K562", "{}.csv.gz".format(target)),
+            sep="\t",
+            index=False
+        )
+
+
+def test_streaming_concatenate_matches_in_memory(tmp_path):
+    """Test that concatenating in streaming writes the same outputs."""
+    outputs = {}
+    for streaming in (True, False):
+        root = str(tmp_path / str(streaming))
+        create_targets(root)
+        concatenate(root, ["K562"], 1, columnar=True, streaming=streaming, block_size=128)
+        with lzma.open(os.path.join(root, "K562.csv.xz"), "rt") as f:
+            outputs[streaming] = f.read(), read_columnar(os.path.join(root, "K562.columnar"))
+    assert outputs[True][0] == outputs[False][0]
+    pd.testing.assert_frame_equal(outputs[True][1], outputs[False][1])
+
+
+def test_streaming_concatenate_requires_aligned_targets(tmp_path):
+    """Test that targets with different regions are not concatenated in streaming."""
+    root = str(tmp_path)
+    create_targets(root, 100)
+    path = os.path.join(root, "K562", "{}.csv.gz".format(TARGETS[0]))
+    target = pd.read_csv(path, sep="\t")
+    target.iloc[::-1].to_csv(path, sep="\t", index=False)
+    paths = [
+        os.path.join(root, "K562", "{}.csv.gz".format(target))
+        for target in TARGETS
+    ]
+    with pytest.raises(ValueError):
+        concatenate_cell_line(paths, os.path.join(root, "K562.csv.xz"), block_size=30)
+    assert not os.path.exists(os.path.join(root, "K562.csv.xz"))
+    assert not os.path.exists(os.path.join(root, "K562.csv.xz.tmp"))
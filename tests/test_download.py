@@ -0,0 +1,142 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pytest
+from epigenomic_dataset.download import download_file, get_part_path
+from epigenomic_dataset.extract import _download_job, _extraction_job
+from epigenomic_dataset.scheduler import run_pipeline
+from .test_extract import create_bigwig, create_bed
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serve the files of the server, supporting Range requests."""
+
+    def do_GET(self):
+        content = self.server.files[self.path]
+        self.server.ranges.append(self.headers.get("Range"))
+        start = 0
+        if self.headers.get("Range") is not None:
+            start = int(self.headers["Range"].split("=")[1].split("-")[0])
+            self.send_response(206)
+        else:
+            self.send_response(200)
+        # The first response ends cleanly halfway when requested.
+        if self.server.truncate:
+            self.server.truncate = False
+            content = content[:(start + len(content))//2]
+        self.send_header("Content-Length", str(len(content) - start))
+        self.end_headers()
+        # The first response is interrupted halfway when requested.
+        if self.server.interrupt:
+            self.server.interrupt = False
+            self.wfile.write(content[start:(start + len(content))//2])
+            return
+        self.wfile.write(content[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    server.files, server.ranges = {}, []
+    server.interrupt, server.truncate = False, False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_url(server, path: str) -> str:
+    return "http://127.0.0.1:{}{}".format(server.server_address[1], path)
+
+
+def test_download_resumes_partial_file(tmp_path, server):
+    """Test that the partial and interrupted downloads are resumed."""
+    content = np.random.RandomState(42).bytes(100000)
+    server.files["/file.bin"] = content
+    path = str(tmp_path / "file.bin")
+    with open(get_part_path(path), "wb") as f:
+        f.write(content[:30000])
+    server.interrupt = True
+    statistics = download_file(
+        get_url(server, "/file.bin"), path,
+        file_size=len(content),
+        md5sum=hashlib.md5(content).hexdigest(),
+        block_size=1000
+    )
+    with open(path, "rb") as f:
+        assert f.read() == content
+    assert not os.path.exists(get_part_path(path))
+    assert server.ranges == ["bytes=30000-", "bytes=65000-"]
+    assert statistics == {"downloaded_bytes": 70000, "retries": 1}
+    # Complete files are not downloaded again.
+    assert download_file(get_url(server, "/file.bin"), path, file_size=len(content))["downloaded_bytes"] == 0
+    assert len(server.ranges) == 2
+
+
+def test_download_resumes_short_stream(tmp_path, server):
+    """Test that a stream ending cleanly before the expected size is resumed."""
+    content = np.random.RandomState(42).bytes(100000)
+    server.files["/file.bin"] = content
+    path = str(tmp_path / "file.bin")
+    server.truncate = True
+    statistics = download_file(get_url(server, "/file.bin"), path, file_size=len(content))
+    with open(path, "rb") as f:
+        assert f.read() == content
+    assert server.ranges == [None, "bytes=50000-"]
+    assert statistics == {"downloaded_bytes": 100000, "retries": 1}
+    # Without retries, the short file is kept to be resumed later.
+    other_path = str(tmp_path / "other.bin")
+    server.truncate = True
+    with pytest.raises(ValueError):
+        download_file(get_url(server, "/file.bin"), other_path, file_size=len(content), retries=0)
+    assert os.path.getsize(get_part_path(other_path)) == 50000
+    download_file(get_url(server, "/file.bin"), other_path, file_size=len(content))
+    with open(other_path, "rb") as f:
+        assert f.read() == content
+
+
+def test_download_validation(tmp_path, server):
+    """Test that the downloads not matching the metadata are rejected."""
+    content = np.random.RandomState(42).bytes(1000)
+    server.files["/file.bin"] = content
+    path = str(tmp_path / "file.bin")
+    with pytest.raises(ValueError):
+        download_file(get_url(server, "/file.bin"), path, file_size=999)
+    with pytest.raises(ValueError):
+        download_file(get_url(server, "/file.bin"), path, md5sum="0"*32)
+    assert not os.path.exists(path)
+    assert not os.path.exists(get_part_path(path))
+
+
+def test_pipeline_downloads_bigwig_once(tmp_path, server):
+    """Test that the pipeline downloads the bigWig once and then extracts it."""
+    source_path = str(tmp_path / "source.bigWig")
+    create_bigwig(source_path, 0)
+    with open(source_path, "rb") as f:
+        server.files["/test.bigWig"] = f.read()
+    create_bed(str(tmp_path / "regions.bed"))
+    target_path = str(tmp_path / "targets" / "test.summary.csv.gz")
+    run_pipeline(
+        [{
+            "epigenome_path": str(tmp_path / "epigenomes" / "test.bigWig"),
+            "url": get_url(server, "/test.bigWig"),
+            "clear_download": True,
+            "jobs": [{"bed_path": str(tmp_path / "regions.bed"), "target_path": target_path}],
+            "engine": "native",
+            "file_size": os.path.getsize(source_path),
+            "md5sum": None
+        }],
+        _download_job,
+        _extraction_job,
+        workers=1,
+        download_workers=1
+    )
+    assert server.ranges == [None]
+    assert os.path.exists(target_path)
+    assert not os.path.exists(str(tmp_path / "epigenomes" / "test.bigWig"))
@@ -0,0 +1,74 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from epigenomic_dataset import load_epigenomes
+from epigenomic_dataset.columnar import encode_values, read_columnar, write_columnar
+from epigenomic_dataset.concatenate import concatenate
+from .utils import create_dataset, create_regions, create_cell_line_matrix, TARGETS
+
+
+@pytest.mark.parametrize("dtype,tolerance", [
+    ("float32", 1e-5),
+    ("float16", 1e-2),
+    ("int16", 1e-5),
+])
+def test_columnar_dtypes(tmp_path, dtype, tolerance):
+    """Test that the values stored with smaller dtypes match the float64 ones."""
+    matrix = create_cell_line_matrix(create_regions(200, 128), 0)
+    write_columnar(matrix, str(tmp_path / "float64"))
+    write_columnar(matrix, str(tmp_path / dtype), dtype)
+    reference = read_columnar(str(tmp_path / "float64"))
+    stored = read_columnar(str(tmp_path / dtype))
+    assert stored.dtypes.iloc[0] == ("float32" if dtype == "int16" else dtype)
+    assert (
+        os.path.getsize(tmp_path / dtype / "values.npy") <
+        os.path.getsize(tmp_path / "float64" / "values.npy")
+    )
+    pd.testing.assert_frame_equal(
+        reference, stored, check_dtype=False, rtol=tolerance, atol=tolerance
+    )
+
+
+def test_concatenate_dtype(tmp_path):
+    """Test that the columnar matrices are written again when their dtype changes."""
+    root = str(tmp_path)
+    matrix = create_cell_line_matrix(create_regions(100, 128), 0)
+    os.makedirs(os.path.join(root, "K562"))
+    for target in TARGETS:
+        matrix[target].reset_index().to_csv(
+            os.path.join(root, "K562", "{}.csv.gz".format(target)),
+            sep="\t",
+            index=False
+        )
+    columnar_path = os.path.join(root, "K562.columnar")
+    concatenate(root, ["K562"], 1, columnar=True)
+    reference = read_columnar(columnar_path)
+    concatenate(root, ["K562"], 1, columnar=True, dtype="int16")
+    stored = read_columnar(columnar_path)
+    assert (stored.dtypes == "float32").all()
+    pd.testing.assert_frame_equal(reference, stored, check_dtype=False, rtol=1e-5)
+
+
+def test_fixed_point_overflow():
+    """Test that the values out of the fixed-point range are not silently stored."""
+    with pytest.raises(ValueError):
+        encode_values(np.array([1.5, 400.0]), "int16")
+
+
+def test_load_epigenomes_dtypes(tmp_path):
+    """Test that the loaded data with smaller dtypes match the float64 ones."""
+    root = str(tmp_path)
+    create_dataset(root)
+    X, y = load_epigenomes(root=root, verbose=0)
+    assert X.index.get_level_values("chrom").dtype == "category"
+    assert X.reset_index().strand.dtype == "category"
+    for dtype in ("float32", "float16"):
+        X_small, y_small = load_epigenomes(root=root, verbose=0, dtype=dtype)
+        assert (X_small.dtypes == dtype).all()
+        assert X_small.values.nbytes < X.values.nbytes
+        pd.testing.assert_frame_equal(
+            X, X_small, check_dtype=False, rtol=1e-2)
+        pd.testing.assert_frame_equal(y, y_small)
+    with pytest.raises(ValueError):
+        load_epigenomes(root=root, verbose=0, dtype="int16")
@@ -0,0 +1,230 @@
+import gzip
+import numpy as np
+import pandas as pd
+from epigenomic_dataset.bigwig import BigWig, write_bigwig
+import os
+from epigenomic_dataset.extract import summarize_epigenome, extraction_job
+from epigenomic_dataset.mine import parse_extracted_epigenome
+from run_crr_build import get_window_anchor
+
+
+def create_bigwig(path: str, seed: int):
+    """Write a random bigWig and return its dense values."""
+    random_state = np.random.RandomState(seed)
+    chromosomes = {"chr1": 20000, "chr2": 10000}
+    intervals, dense = {}, {}
+    for chrom, size in chromosomes.items():
+        bounds = np.sort(random_state.choice(size, size//5, replace=False))
+        starts, ends = bounds[:-1:2], bounds[1::2]
+        values = random_state.uniform(0, 10, len(starts)).astype(np.float32)
+        intervals[chrom] = (starts, ends, values)
+        dense[chrom] = np.full(size, np.nan, dtype=np.float32)
+        for start, end, value in zip(starts, ends, values):
+            dense[chrom][start:end] = value
+    write_bigwig(path, chromosomes, intervals, items_per_block=16, block_size=8)
+    return dense
+
+
+def create_bed(path: str, window_size: int = 64) -> pd.DataFrame:
+    random_state = np.random.RandomState(42)
+    bed = pd.DataFrame({
+        "chrom": random_state.choice(["chr1", "chr2", "chr3"], 300),
+        "chromStart": random_state.randint(0, 9000, 300),
+    })
+    bed["chromEnd"] = bed.chromStart + window_size
+    bed["name"] = "."
+    bed["score"] = 0
+    bed["strand"] = random_state.choice(["+", "-"], 300)
+    bed.to_csv(path, sep="\t", header=False, index=False)
+    return bed
+
+
+def test_bigwig_values(tmp_path):
+    """Test that the bigWig reader returns the written values."""
+    path = str(tmp_path / "test.bigWig")
+    dense = create_bigwig(path, 0)
+    starts = np.array([0, 150, 4000, 19990])
+    ends = np.array([100, 400, 4001, 20000])
+    with BigWig(path) as bigwig:
+        values = bigwig.values("chr1", starts, ends)
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            assert np.array_equal(
+                values[i, :end-start],
+                dense["chr1"][start:end],
+                equal_nan=True
+            )
+            assert np.isnan(values[i, end-start:]).all()
+        assert np.isnan(bigwig.values("chrX", [0], [10])).all()
+
+
+def test_native_extraction_matches_per_base_dump(tmp_path):
+    """Test that the native engine mines the same values of the per-base dump."""
+    bed_path = str(tmp_path / "regions.bed")
+    bed = create_bed(bed_path)
+    statistics = {"max": True, "min": True, "mean": True, "median": True, "var": True}
+    summaries, dumps = [], []
+    for replicate in range(3):
+        bigwig_path = str(tmp_path / "{}.bigWig".format(replicate))
+        dense = create_bigwig(bigwig_path, replicate)
+        summary_path = str(tmp_path / "{}.summary.csv.gz".format(replicate))
+        summarize_epigenome(bed_path, bigwig_path, summary_path, ["mean"])
+        summaries.append(summary_path)
+        dump_path = str(tmp_path / "{}.bed.gz".format(replicate))
+        with gzip.open(dump_path, "wt") as f:
+            for _, row in bed.iterrows():
+                values = dense.get(row.chrom, np.full(20000, np.nan))[
+                    row.chromStart:row.chromEnd]
+                f.write("\t".join([
+                    row.chrom, str(row.chromStart), str(row.chromEnd),
+                    ".", "0", row.strand, str(len(values)),
+                    *["NA" if np.isnan(v) else repr(float(v)) for v in values]
+                ]) + "\n")
+        dumps.append(dump_path)
+    native_path = str(tmp_path / "native" / "target.csv.gz")
+    dump_path = str(tmp_path / "dump" / "target.csv.gz")
+    parse_extracted_epigenome(summaries, native_path, statistics)
+    parse_extracted_epigenome(dumps, dump_path, statistics)
+    native = pd.read_csv(native_path, sep="\t")
+    dump = pd.read_csv(dump_path, sep="\t")
+    assert native.shape == (300, 9)
+    pd.testing.assert_frame_equal(native, dump)
+    # Replicates extracted by different engines are mined together.
+    mixed_path = str(tmp_path / "mixed" / "target.csv.gz")
+    parse_extracted_epigenome([summaries[0], dumps[1], summaries[2]], mixed_path, statistics)
+    pd.testing.assert_frame_equal(pd.read_csv(mixed_path, sep="\t"), dump)
+
+
+def test_multiple_window_sizes(tmp_path):
+    """Test that nested windows match their separate extraction."""
+    bigwig_path = str(tmp_path / "test.bigWig")
+    create_bigwig(bigwig_path, 0)
+    bed = create_bed(str(tmp_path / "regions.bed"), window_size=128)
+    window_sizes = [128, 64, 32]
+    targets = {
+        window_size: str(tmp_path / str(window_size) / "test.summary.csv.gz")
+        for window_size in window_sizes
+    }
+    summarize_epigenome(
+        str(tmp_path / "regions.bed"), bigwig_path, targets, ["mean", "max"]
+    )
+    for window_size in window_sizes:
+        window_bed = bed.copy()
+        window_bed["chromStart"] += (128 - window_size)//2
+        window_bed["chromEnd"] = window_bed.chromStart + window_size
+        window_bed_path = str(tmp_path / "{}.bed".format(window_size))
+        window_bed.to_csv(window_bed_path, sep="\t", header=False, index=False)
+        expected_path = str(tmp_path / "{}.summary.csv.gz".format(window_size))
+        summarize_epigenome(
+            window_bed_path, bigwig_path, expected_path, ["mean", "max"]
+        )
+        pd.testing.assert_frame_equal(
+            pd.read_csv(targets[window_size], sep="\t"),
+            pd.read_csv(expected_path, sep="\t")
+        )
+
+
+def create_promoters(path: str, window_size: int) -> pd.DataFrame:
+    """Write promoters anchored at the transcription start sites, as crr_labels."""
+    random_state = np.random.RandomState(42)
+    tss = random_state.randint(200, 9000, 300)
+    strands = random_state.choice(["+", "-"], 300)
+    bed = pd.DataFrame({
+        "chrom": random_state.choice(["chr1", "chr2"], 300),
+        "chromStart": np.where(strands == "+", tss - window_size, tss),
+        "chromEnd": np.where(strands == "+", tss, tss + window_size),
+        "name": ".",
+        "score": 0,
+        "strand": strands
+    })
+    bed.to_csv(path, sep="\t", header=False, index=False)
+    return bed
+
+
+def test_promoters_window_sizes(tmp_path):
+    """Test that the promoter windows match the promoters of each window size."""
+    bigwig_path = str(tmp_path / "test.bigWig")
+    create_bigwig(bigwig_path, 0)
+    create_promoters(str(tmp_path / "promoters.bed"), 128)
+    window_sizes = [128, 64, 32]
+    targets = {
+        window_size: str(tmp_path / str(window_size) / "test.summary.csv.gz")
+        for window_size in window_sizes
+    }
+    summarize_epigenome(
+        str(tmp_path / "promoters.bed"), bigwig_path, targets, ["mean"], anchor="tss"
+    )
+    for window_size in window_sizes:
+        window_bed_path = str(tmp_path / "{}.bed".format(window_size))
+        create_promoters(window_bed_path, window_size)
+        expected_path = str(tmp_path / "{}.summary.csv.gz".format(window_size))
+        summarize_epigenome(window_bed_path, bigwig_path, expected_path, ["mean"])
+        pd.testing.assert_frame_equal(
+            pd.read_csv(targets[window_size], sep="\t"),
+            pd.read_csv(expected_path, sep="\t")
+        )
+
+
+def create_centered_promoters(path: str, window_size: int) -> pd.DataFrame:
+    """Write promoters centered in the regions, as the ROADMAP ones of crr_labels."""
+    random_state = np.random.RandomState(42)
+    starts = random_state.randint(200, 9000, 300)
+    center = starts + random_state.randint(1, 200, 300)/2
+    bed = pd.DataFrame({
+        "chrom": random_state.choice(["chr1", "chr2"], 300),
+        "chromStart": (center - window_size/2).astype(int),
+        "chromEnd": (center + window_size/2).astype(int),
+        "name": ".",
+        "score": 0,
+        "strand": random_state.choice(["+", "-"], 300)
+    })
+    bed.to_csv(path, sep="\t", header=False, index=False)
+    return bed
+
+
+def test_roadmap_promoters_window_sizes(tmp_path):
+    """Test that the ROADMAP promoter windows stay centered at each window size."""
+    assert get_window_anchor("fantom", "promoters") == "tss"
+    assert get_window_anchor("roadmap", "promoters") == "center"
+    bigwig_path = str(tmp_path / "test.bigWig")
+    create_bigwig(bigwig_path, 0)
+    create_centered_promoters(str(tmp_path / "promoters.bed"), 128)
+    window_sizes = [128, 64]
+    targets = {
+        window_size: str(tmp_path / str(window_size) / "test.summary.csv.gz")
+        for window_size in window_sizes
+    }
+    summarize_epigenome(
+        str(tmp_path / "promoters.bed"), bigwig_path, targets, ["mean"],
+        anchor=get_window_anchor("roadmap", "promoters")
+    )
+    for window_size in window_sizes:
+        window_bed_path = str(tmp_path / "{}.bed".format(window_size))
+        create_centered_promoters(window_bed_path, window_size)
+        expected_path = str(tmp_path / "{}.summary.csv.gz".format(window_size))
+        summarize_epigenome(window_bed_path, bigwig_path, expected_path, ["mean"])
+        pd.testing.assert_frame_equal(
+            pd.read_csv(targets[window_size], sep="\t"),
+            pd.read_csv(expected_path, sep="\t")
+        )
+
+
+def test_extraction_job_fans_out_region_sets(tmp_path):
+    """Test that a single bigWig is extracted for all the region sets."""
+    bigwig_path = str(tmp_path / "test.bigWig")
+    create_bigwig(bigwig_path, 0)
+    create_bed(str(tmp_path / "enhancers.bed"), window_size=32)
+    create_bed(str(tmp_path / "promoters.bed"), window_size=64)
+    jobs = [
+        {
+            "bed_path": str(tmp_path / "{}.bed".format(region)),
+            "target_path": str(tmp_path / region / "test.summary.csv.gz")
+        }
+        for region in ("enhancers", "promoters")
+    ]
+    extraction_job(bigwig_path, True, jobs)
+    for job in jobs:
+        # Only the mean, which is mined, is written in the summaries.
+        assert list(pd.read_csv(job["target_path"], sep="\t").columns) == [
+            "chrom", "chromStart", "chromEnd", "strand", "mean"
+        ]
+    assert not os.path.exists(bigwig_path)
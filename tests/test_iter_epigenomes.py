@@ -0,0 +1,76 @@
+import importlib
+import os
+import numpy as np
+import pandas as pd
+from epigenomic_dataset import load_epigenomes, iter_epigenomes
+from epigenomic_dataset.columnar import get_columnar_path, write_columnar
+from epigenomic_dataset.regions import align_labels
+from .utils import create_dataset
+
+
+def test_iter_epigenomes_matches_load_epigenomes(tmp_path):
+    """Test that the batches match the fully loaded data."""
+    root = str(tmp_path)
+    create_dataset(root)
+    data_path = os.path.join(root, "fantom", "hg38", "256", "promoters", "K562.csv.xz")
+    for columnar in (False, True):
+        if columnar:
+            write_columnar(
+                pd.read_csv(data_path, index_col=[0, 1, 2, 3], header=[0, 1]),
+                get_columnar_path(data_path)
+            )
+        for kwargs in (
+            dict(),
+            dict(min_active_tpm_value=3, max_inactive_tpm_value=0.5),
+            dict(binarize=True, min_active_tpm_value=2),
+        ):
+            X, y = load_epigenomes(root=root, verbose=0, **kwargs)
+            batches = list(iter_epigenomes(
+                root=root, verbose=0, batch_size=64, **kwargs))
+            assert all(len(X_batch) <= 64 for X_batch, _ in batches)
+            X_batches = np.vstack([X_batch for X_batch, _ in batches])
+            y_batches = np.vstack([y_batch for _, y_batch in batches])
+            assert np.array_equal(X.to_numpy(), X_batches, equal_nan=True)
+            assert np.array_equal(y.to_numpy(), y_batches)
+
+
+def test_iter_epigenomes_aligns_labels_once(tmp_path, monkeypatch):
+    """Test that the labels are aligned once for all the batches."""
+    root = str(tmp_path)
+    create_dataset(root)
+    calls = []
+
+    def counted_align_labels(index, labels):
+        calls.append(len(index))
+        return align_labels(index, labels)
+
+    monkeypatch.setattr(
+        importlib.import_module("epigenomic_dataset.iter_epigenomes"),
+        "align_labels",
+        counted_align_labels
+    )
+    batches = list(iter_epigenomes(root=root, verbose=0, batch_size=16))
+    assert len(batches) > 1
+    assert calls == [len(load_epigenomes(root=root, verbose=0)[0])]
+
+
+def test_iter_epigenomes_fixed_point(tmp_path):
+    """Test that the batches of the fixed-point format are decoded."""
+    root = str(tmp_path)
+    create_dataset(root)
+    data_path = os.path.join(root, "fantom", "hg38", "256", "promoters", "K562.csv.xz")
+    X_csv, _ = load_epigenomes(root=root, verbose=0)
+    write_columnar(
+        pd.read_csv(data_path, index_col=[0, 1, 2, 3], header=[0, 1]),
+        get_columnar_path(data_path),
+        "int16"
+    )
+    os.remove(data_path)
+    X, y = load_epigenomes(root=root, verbose=0)
+    # The values rounded to two decimals are decoded exactly.
+    assert np.array_equal(X.to_numpy(), X_csv.to_numpy(), equal_nan=True)
+    batches = list(iter_epigenomes(root=root, verbose=0, batch_size=64))
+    X_batches = np.vstack([X_batch for X_batch, _ in batches])
+    y_batches = np.vstack([y_batch for _, y_batch in batches])
+    assert np.array_equal(X.to_numpy(), X_batches, equal_nan=True)
+    assert np.array_equal(y.to_numpy(), y_batches)
@@ -0,0 +1,35 @@
+import subprocess
+import sys
+import epigenomic_dataset
+from epigenomic_dataset import utils
+
+
+def get_imported_modules(statement: str) -> set:
+    """Return the modules imported by the given statement in a new interpreter."""
+    return set(subprocess.run(
+        [sys.executable, "-c", "import sys\n{}\nprint(' '.join(sys.modules))".format(statement)],
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout.split())
+
+
+def test_package_import_is_lazy():
+    """Test that importing the package and the loaders imports no unneeded dependency."""
+    assert not {"pandas", "numpy", "sklearn"} & get_imported_modules("import epigenomic_dataset")
+    assert not {
+        "sklearn", "multiprocessing", "pybwtool", "encodeproject",
+        "requests", "downloaders", "epigenomic_dataset.build"
+    } & get_imported_modules("from epigenomic_dataset import load_epigenomes, iter_epigenomes")
+    assert "sklearn" not in get_imported_modules("from epigenomic_dataset.utils import get_cell_lines")
+
+
+def test_lazy_attributes():
+    """Test that the public attributes are the functions, not their submodules."""
+    import epigenomic_dataset.load_epigenomes
+    for package in (epigenomic_dataset, utils):
+        assert set(package.__all__) <= set(dir(package))
+        for name in package.__all__:
+            assert not isinstance(getattr(package, name), type(epigenomic_dataset))
+    assert callable(epigenomic_dataset.load_epigenomes)
+    assert epigenomic_dataset.extract.__name__ == "epigenomic_dataset.extract"
@@ -0,0 +1,38 @@
+import importlib
+import pandas as pd
+from epigenomic_dataset import load_epigenomes
+from .utils import create_dataset
+
+
+def test_load_multiple_cell_lines(tmp_path, monkeypatch):
+    """Test that the cell lines loaded together match the ones loaded alone."""
+    root = str(tmp_path)
+    create_dataset(root, cell_lines=["K562", "HepG2", "GM12878"])
+    kwargs = dict(root=root, verbose=0, min_active_tpm_value=2, binarize=True)
+    cell_lines = ["K562", "HepG2", "GM12878"]
+    expected = {
+        cell_line: load_epigenomes(cell_line=cell_line, **kwargs)
+        for cell_line in cell_lines
+    }
+    module = importlib.import_module("epigenomic_dataset.load_epigenomes")
+    read_labels = module.read_labels
+    calls = []
+
+    def counted_read_labels(*args, **kwargs):
+        calls.append(args)
+        return read_labels(*args, **kwargs)
+
+    monkeypatch.setattr(module, "read_labels", counted_read_labels)
+    results = load_epigenomes(cell_line=cell_lines, workers=2, **kwargs)
+    # The label file is parsed once for all the cell lines.
+    assert len(calls) == 1
+    assert list(results) == cell_lines
+    for cell_line, (X, y) in expected.items():
+        pd.testing.assert_frame_equal(X, results[cell_line][0])
+        pd.testing.assert_frame_equal(y, results[cell_line][1])
+    # The cache is shared with the loading of the single cell lines.
+    load_epigenomes(cell_line="HepG2", cache=True, **kwargs)
+    results = load_epigenomes(cell_line=cell_lines, cache=True, **kwargs)
+    for cell_line, (X, y) in expected.items():
+        pd.testing.assert_frame_equal(X, results[cell_line][0])
+        pd.testing.assert_frame_equal(y, results[cell_line][1])
@@ -0,0 +1,135 @@
+import gzip
+import os
+import numpy as np
+import pandas as pd
+from epigenomic_dataset.bigwig import BigWig
+from epigenomic_dataset.concatenate import concatenate
+from epigenomic_dataset.extract import (
+    get_extraction_output,
+    get_window_regions,
+    load_bed,
+    summarize_epigenome
+)
+from epigenomic_dataset.manifest import get_regions_hash, get_regions_number, load_manifest
+from .test_extract import create_bigwig, create_bed
+from .utils import create_cell_line_matrix, create_regions, TARGETS
+
+
+def test_summary_update_only_reads_new_regions(tmp_path, monkeypatch):
+    """Test that updating a summary extracts only the new regions."""
+    bigwig_path = str(tmp_path / "test.bigWig")
+    create_bigwig(bigwig_path, 0)
+    bed = create_bed(str(tmp_path / "all.bed"))
+    # The previous build had only part of the regions, and some
+    # regions that are no longer in the bed file.
+    old_bed = pd.concat([bed.iloc[:200], bed.iloc[:10].assign(chromStart=10, chromEnd=74)])
+    old_bed.to_csv(str(tmp_path / "old.bed"), sep="\t", header=False, index=False)
+    target_path = str(tmp_path / "update" / "test.summary.csv.gz")
+    summarize_epigenome(str(tmp_path / "old.bed"), bigwig_path, target_path, ["mean", "max"])
+    read_regions = []
+    values = BigWig.values
+
+    def counted_values(self, chrom, starts, ends):
+        read_regions.extend(starts)
+        return values(self, chrom, starts, ends)
+
+    monkeypatch.setattr(BigWig, "values", counted_values)
+    summarize_epigenome(str(tmp_path / "all.bed"), bigwig_path, target_path, ["mean", "max"], update=True)
+    assert len(read_regions) == 100
+    expected_path = str(tmp_path / "full" / "test.summary.csv.gz")
+    summarize_epigenome(str(tmp_path / "all.bed"), bigwig_path, expected_path, ["mean", "max"])
+    pd.testing.assert_frame_equal(
+        pd.read_csv(target_path, sep="\t"),
+        pd.read_csv(expected_path, sep="\t")
+    )
+
+
+def test_extraction_output_detects_stale_summaries(tmp_path):
+    """Test that summaries of different regions are not reused."""
+    root = str(tmp_path / "targets")
+    bigwig_path = str(tmp_path / "test.bigWig")
+    create_bigwig(bigwig_path, 0)
+    create_bed(str(tmp_path / "regions.bed"))
+    summarize_epigenome(
+        str(tmp_path / "regions.bed"), bigwig_path,
+        os.path.join(root, "ENCFF000AAA.summary.csv.gz"), ["mean"]
+    )
+    regions = load_bed(str(tmp_path / "regions.bed"))
+    regions_hash = get_regions_hash(get_window_regions(regions))
+    manifest = load_manifest(root)
+    # The summary preceding the manifest matches the regions and is recorded.
+    assert get_extraction_output(manifest, root, "ENCFF000AAA", regions_hash, "native")[0] is None
+    assert "ENCFF000AAA.summary.csv.gz" in manifest["outputs"]
+    summary_path = os.path.join(root, "ENCFF000AAA.summary.csv.gz")
+    assert get_regions_number(manifest, root, summary_path) == len(regions)
+    # Only the mined targets depend on the statistics.
+    assert "statistics" not in manifest["outputs"]["ENCFF000AAA.summary.csv.gz"]["inputs"]
+    assert get_extraction_output(manifest, root, "ENCFF000AAA", regions_hash, "native")[0] is None
+    # Different regions make the summary stale.
+    other_hash = get_regions_hash(get_window_regions(regions.iloc[1:]))
+    path, _ = get_extraction_output(manifest, root, "ENCFF000AAA", other_hash, "native")
+    assert path == os.path.join(root, "ENCFF000AAA.summary.csv.gz")
+    # Missing outputs are extracted.
+    path, _ = get_extraction_output(manifest, root, "ENCFF000BBB", regions_hash, "native")
+    assert path == os.path.join(root, "ENCFF000BBB.summary.csv.gz")
+    assert get_regions_number(manifest, root, path) is None
+    # The number of regions of a modified summary is not reused.
+    with open(summary_path, "ab") as f:
+        f.write(b"\0")
+    assert get_regions_number(manifest, root, summary_path) is None
+
+
+def test_extraction_output_detects_stale_dumps(tmp_path):
+    """Test that per-base dumps preceding the manifest are reused only for the same regions."""
+    root = str(tmp_path / "targets")
+    os.makedirs(root)
+    regions = create_bed(str(tmp_path / "regions.bed"))
+    for accession, dumped in (("ENCFF000AAA", regions), ("ENCFF000BBB", regions.iloc[1:])):
+        with gzip.open(os.path.join(root, "{}.bed.gz".format(accession)), "wt") as f:
+            for _, row in dumped.iterrows():
+                width = row.chromEnd - row.chromStart
+                f.write("\t".join([
+                    row.chrom, str(row.chromStart), str(row.chromEnd), ".", "0",
+                    row.strand, str(width), *["1.0"]*width
+                ]) + "\n")
+    regions_hash = get_regions_hash(get_window_regions(load_bed(str(tmp_path / "regions.bed"))))
+    manifest = load_manifest(root)
+    for engine in ("native", "pybwtool"):
+        assert get_extraction_output(manifest, root, "ENCFF000AAA", regions_hash, engine)[0] is None
+    assert get_regions_number(manifest, root, os.path.join(root, "ENCFF000AAA.bed.gz")) == len(regions)
+    # The dump of different regions is extracted again.
+    path, _ = get_extraction_output(manifest, root, "ENCFF000BBB", regions_hash, "native")
+    assert path == os.path.join(root, "ENCFF000BBB.summary.csv.gz")
+    path, _ = get_extraction_output(manifest, root, "ENCFF000BBB", regions_hash, "pybwtool")
+    assert path == os.path.join(root, "ENCFF000BBB.bed.gz")
+    assert "ENCFF000BBB.bed.gz" not in manifest["outputs"]
+
+
+def test_concatenate_detects_changed_targets(tmp_path):
+    """Test that the cell lines are concatenated again only when their targets change."""
+    root = str(tmp_path)
+    matrix = create_cell_line_matrix(create_regions(100, 128), 0)
+    os.makedirs(os.path.join(root, "K562"))
+    for target in TARGETS:
+        matrix[target].reset_index().to_csv(
+            os.path.join(root, "K562", "{}.csv.gz".format(target)),
+            sep="\t",
+            index=False
+        )
+    path = os.path.join(root, "K562.csv.xz")
+    concatenate(root, ["K562"], 1)
+    modification_time = os.stat(path).st_mtime_ns
+    concatenate(root, ["K562"], 1)
+    assert os.stat(path).st_mtime_ns == modification_time
+    (matrix[TARGETS[0]] + 1).reset_index().to_csv(
+        os.path.join(root, "K562", "{}.csv.gz".format(TARGETS[0])),
+        sep="\t",
+        index=False
+    )
+    concatenate(root, ["K562"], 1)
+    concatenated = pd.read_csv(path, index_col=[0, 1, 2, 3], header=[0, 1])
+    assert np.allclose(
+        concatenated[TARGETS[0]].values,
+        matrix[TARGETS[0]].values + 1,
+        equal_nan=True
+    )
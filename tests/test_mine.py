@@ -0,0 +1,114 @@
+import gzip
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from epigenomic_dataset.mine import (
+    get_shard_path,
+    mine,
+    parse_extracted_epigenome,
+    split_regions,
+    stitch_shards
+)
+from epigenomic_dataset.statistics import get_callback
+
+
+def mine_row_by_row(sources, statistics) -> str:
+    """Return the mined values computed one region at a time."""
+    readers = [gzip.open(source, "rt") for source in sources]
+    lines = []
+    for rows in zip(*readers):
+        rows = [row.rstrip("\n").split("\t") for row in rows]
+        chrom, chromStart, chromEnd, _, _, strand = rows[0][:6]
+        averaged_scores = []
+        for row in rows:
+            scores = [float(s) if s != "NA" else np.nan for s in row[7:]]
+            averaged_scores.append(
+                np.nan
+                if len(scores) == 0 or np.all(np.isnan(scores))
+                else np.nanmean(scores)
+            )
+        lines.append("\t".join([chrom, chromStart, chromEnd, strand, *[
+            str(np.nan)
+            if np.all(np.isnan(averaged_scores))
+            else get_callback(statistic)(averaged_scores).astype(str)
+            for statistic, enabled in statistics.items()
+            if enabled
+        ]]))
+    for reader in readers:
+        reader.close()
+    return lines
+
+
+def test_block_parsing_matches_row_by_row(tmp_path):
+    """Test that the vectorized parsing returns the same values."""
+    random_state = np.random.RandomState(42)
+    statistics = {"max": True, "min": False, "mean": True, "median": True, "var": True}
+    sources = []
+    for replicate in range(3):
+        path = str(tmp_path / "{}.bed.gz".format(replicate))
+        with gzip.open(path, "wt") as f:
+            for region in range(500):
+                # Some regions are shorter or have no values at all.
+                width = 0 if region % 97 == 0 else 64 - (region % 5 == 0)*10
+                values = random_state.uniform(0, 100, width)
+                values[random_state.uniform(size=width) < 0.2] = np.nan
+                if region % 31 == 0:
+                    values[:] = np.nan
+                f.write("\t".join([
+                    "chr1", str(region*100), str(region*100 + width),
+                    ".", "0", "+", str(width),
+                    *["NA" if np.isnan(v) else "{:.4f}".format(v) for v in values]
+                ]) + "\n")
+        sources.append(path)
+    target = str(tmp_path / "mined" / "target.csv.gz")
+    parse_extracted_epigenome(sources, target, statistics, batch_size=64)
+    with gzip.open(target, "rt") as f:
+        mined = f.read().split("\n")
+    assert mined[0] == "chrom\tchromStart\tchromEnd\tstrand\tmax\tmean\tmedian\tvar"
+    assert mined[1:-1] == mine_row_by_row(sources, statistics)
+
+
+def test_sharded_parsing_matches_whole_parsing(tmp_path):
+    """Test that stitching the mined shards returns the whole target."""
+    statistics = {"max": True, "min": False, "mean": True, "median": False, "var": False}
+    random_state = np.random.RandomState(42)
+    for name in ("extracted", "summarized", "mixed"):
+        sources = []
+        for replicate in range(2):
+            if name == "extracted" or (name == "mixed" and replicate == 0):
+                path = str(tmp_path / "{}.bed.gz".format(replicate))
+                with gzip.open(path, "wt") as f:
+                    for region in range(103):
+                        f.write("\t".join([
+                            "chr1", str(region*100), str(region*100 + 8), ".", "0", "+", "8",
+                            *["{:.4f}".format(v) for v in random_state.uniform(0, 100, 8)]
+                        ]) + "\n")
+            else:
+                path = str(tmp_path / "{}.summary.csv.gz".format(replicate))
+                pd.DataFrame({
+                    "chrom": "chr1",
+                    "chromStart": np.arange(103)*100,
+                    "chromEnd": np.arange(103)*100 + 8,
+                    "strand": "+",
+                    "mean": random_state.uniform(0, 100, 103)
+                }).to_csv(path, sep="\t", index=False)
+            sources.append(path)
+        whole = str(tmp_path / name / "whole.csv.gz")
+        parse_extracted_epigenome(sources, whole, statistics)
+        target = str(tmp_path / name / "sharded.csv.gz")
+        shards = []
+        for shard, (start, stop) in enumerate(split_regions(103, 4)):
+            shards.append(get_shard_path(target, shard))
+            parse_extracted_epigenome(sources, shards[-1], statistics, start=start, stop=stop)
+        stitch_shards(shards, target)
+        assert not any(os.path.exists(shard) for shard in shards)
+        with gzip.open(whole, "rt") as f, gzip.open(target, "rt") as g:
+            assert f.read() == g.read()
+
+
+def test_mine_workers_validation(tmp_path):
+    """Test that the workers number is either -1 or strictly positive."""
+    for workers in (0, -2):
+        with pytest.raises(ValueError):
+            mine(str(tmp_path), {"mean": True}, ["K562"], "hg38", workers=workers)
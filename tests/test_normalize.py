@@ -0,0 +1,119 @@
+import os
+import numpy as np
+import pytest
+from sklearn import get_config
+from sklearn.impute import KNNImputer
+from sklearn.preprocessing import MinMaxScaler
+from epigenomic_dataset.utils import EpigenomicNormalizer, evaluate_imputation, normalize_epigenomic_data
+from epigenomic_dataset.utils.normalize_epigenomic_data import impute
+
+
+def create_matrix(rows: int, seed: int = 42) -> np.ndarray:
+    random_state = np.random.RandomState(seed)
+    # Correlated columns, so that the neighbours are informative.
+    x = random_state.normal(size=(rows, 3)) @ random_state.normal(size=(3, 8))
+    x[random_state.uniform(size=x.shape) < 0.1] = np.nan
+    return x
+
+
+def test_batched_imputation_matches_exact():
+    """Test that imputing in parallel batches returns the exact imputation."""
+    train_x, test_x = create_matrix(500), create_matrix(100, 1)
+    imputer = KNNImputer().fit(train_x)
+    scaler = MinMaxScaler().fit(imputer.transform(train_x))
+    expected_train_x = scaler.transform(imputer.transform(train_x))
+    expected_test_x = scaler.transform(imputer.transform(test_x))
+    for kwargs in ({}, {"batch_size": 64, "n_jobs": 2, "working_memory": 1}, {"imputation": "subsample", "max_donors": 500}):
+        normalized_train_x, normalized_test_x = normalize_epigenomic_data(train_x, test_x, **kwargs)
+        assert np.allclose(normalized_train_x, expected_train_x)
+        assert np.allclose(normalized_test_x, expected_test_x)
+
+
+def test_parallel_imputation_working_memory(monkeypatch):
+    """Test that the working memory is set in the threads imputing the batches."""
+    x = create_matrix(100)
+    imputer = KNNImputer().fit(x)
+    working_memories = []
+    transform = KNNImputer.transform
+
+    def recorded_transform(self, batch):
+        working_memories.append(get_config()["working_memory"])
+        return transform(self, batch)
+
+    monkeypatch.setattr(KNNImputer, "transform", recorded_transform)
+    imputed = impute(imputer, x, batch_size=10, n_jobs=2, working_memory=1)
+    assert working_memories == [1]*10
+    assert np.allclose(imputed, transform(imputer, x))
+
+
+def test_subsampled_imputation():
+    """Test that the subsampled imputation is evaluated against the exact one."""
+    train_x = create_matrix(1000)
+    normalized_x = normalize_epigenomic_data(train_x, imputation="subsample", max_donors=100)
+    assert not np.isnan(normalized_x).any()
+    report = evaluate_imputation(train_x, max_donors=100, max_rows=300)
+    assert report["rmse"] > 0 and report["exact_rmse"] > 0
+    assert report["max_absolute_difference"] > 0
+    # Without subsampling, the quality is unchanged.
+    report = evaluate_imputation(train_x, max_donors=1000, max_rows=300)
+    assert report["relative_change"] == 0 and report["max_absolute_difference"] == 0
+    with pytest.raises(ValueError):
+        normalize_epigenomic_data(train_x, imputation="approximate")
+
+
+def test_normalizer_cache(tmp_path, monkeypatch):
+    """Test that the normalizer fitted on the same training data is reused."""
+    train_x, test_x = create_matrix(300), create_matrix(50, 1)
+    cache_directory = str(tmp_path / "cache")
+    expected = normalize_epigenomic_data(train_x, test_x, cache_directory=cache_directory)
+    assert len(os.listdir(cache_directory)) == 2
+
+    def fit_transform(self, x):
+        raise AssertionError("The normalizer was fitted again.")
+
+    monkeypatch.setattr(EpigenomicNormalizer, "fit_transform", fit_transform)
+    normalized_train_x, normalized_test_x, normalizer = normalize_epigenomic_data(
+        train_x, test_x, cache_directory=cache_directory, return_normalizer=True
+    )
+    assert np.array_equal(normalized_train_x, expected[0])
+    assert np.array_equal(normalized_test_x, expected[1])
+    path = str(tmp_path / "normalizer.pkl")
+    normalizer.save(path)
+    assert np.array_equal(EpigenomicNormalizer.load(path).transform(test_x), expected[1])
+    with pytest.raises(AssertionError):
+        normalize_epigenomic_data(train_x + 1, cache_directory=cache_directory)
+
+
+def test_normalizer_partial_fit():
+    """Test that fitting in chunks matches fitting the whole training data."""
+    train_x, test_x = create_matrix(600), create_matrix(50, 1)
+    expected_train_x, expected_test_x = normalize_epigenomic_data(train_x, test_x)
+    normalizer = EpigenomicNormalizer()
+    for start in range(0, len(train_x), 128):
+        normalizer.partial_fit(train_x[start:start + 128])
+    normalized_train_x, normalized_test_x = normalize_epigenomic_data(
+        train_x, test_x, normalizer=normalizer
+    )
+    assert np.allclose(normalized_train_x, expected_train_x)
+    assert np.allclose(normalized_test_x, expected_test_x)
+    # With a bounded reservoir, a uniform sample of the rows is kept.
+    normalizer = EpigenomicNormalizer(max_donors=100)
+    for start in range(0, len(train_x), 128):
+        normalizer.partial_fit(train_x[start:start + 128])
+    assert len(normalizer._donors) == 100
+    assert not np.isnan(normalizer.transform(test_x)).any()
+
+
+def test_normalizer_partial_fit_empty_chunks():
+    """Test that the empty chunks of the training data are ignored."""
+    train_x, test_x = create_matrix(300), create_matrix(50, 1)
+    empty = train_x[:0]
+    normalizer = EpigenomicNormalizer().partial_fit(empty)
+    with pytest.raises(ValueError):
+        normalizer.transform(test_x)
+    for start in range(0, len(train_x), 100):
+        normalizer.partial_fit(train_x[start:start + 100]).partial_fit(empty)
+    expected = EpigenomicNormalizer()
+    for start in range(0, len(train_x), 100):
+        expected.partial_fit(train_x[start:start + 100])
+    assert np.allclose(normalizer.transform(test_x), expected.transform(test_x))
@@ -0,0 +1,23 @@
+import os
+import pandas as pd
+from epigenomic_dataset import load_epigenomes
+from epigenomic_dataset.regions import compact_index
+from .utils import create_dataset, METRICS
+
+
+def test_metric_projection(tmp_path):
+    """Test that only reading the metric columns returns the same data."""
+    root = str(tmp_path)
+    create_dataset(root)
+    data_path = os.path.join(root, "fantom", "hg38", "256", "promoters", "K562.csv.xz")
+    full = pd.read_csv(data_path, index_col=[0, 1, 2, 3], header=[0, 1])
+    for metric in METRICS:
+        X, _ = load_epigenomes(root=root, metric=metric, verbose=0)
+        expected = full[[
+            col
+            for col in full.columns
+            if metric in col
+        ]].droplevel(1, axis=1)
+        expected.index = compact_index(expected.index)
+        pd.testing.assert_frame_equal(X, expected, check_names=False)
+        assert list(X.index.names) == ["chrom", "chromStart", "chromEnd", "strand"]
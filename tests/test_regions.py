@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+import pytest
+from epigenomic_dataset.regions import align_labels, compact_index, get_region_keys
+from .utils import create_regions
+
+
+def test_align_labels():
+    """Test that the labels aligned through the packed keys match the ones aligned by label."""
+    regions = create_regions(1000, 256)
+    labels = pd.DataFrame(
+        {"K562": np.arange(len(regions), dtype=float)},
+        index=pd.MultiIndex.from_frame(regions)
+    ).sample(frac=1, random_state=0)
+    index = compact_index(pd.MultiIndex.from_frame(regions.iloc[::2]))
+    assert index.levels[1].dtype == np.int32
+    assert index.equals(pd.MultiIndex.from_frame(regions.iloc[::2]))
+    aligned = align_labels(index, labels)
+    assert aligned.index is index
+    np.testing.assert_array_equal(aligned.values, labels.loc[index].values)
+    # Already aligned labels are kept as they are.
+    assert align_labels(index, aligned).index is index
+    keys, labels_keys = get_region_keys(index, labels.index)
+    assert keys.dtype == np.int64
+    assert set(keys) <= set(labels_keys)
+    with pytest.raises(KeyError):
+        align_labels(pd.MultiIndex.from_frame(regions), labels.iloc[1:])
@@ -0,0 +1,64 @@
+import os
+import time
+import pytest
+from epigenomic_dataset.scheduler import run_pipeline, simulate_makespan, sort_by_cost
+
+staged_sizes = []
+
+
+def fake_download(task):
+    staged_sizes.append(sum(
+        os.path.getsize(os.path.join(task["root"], file_name))
+        for file_name in os.listdir(task["root"])
+    ) + task["file_size"])
+    time.sleep(0.01)
+    with open(task["epigenome_path"], "wb") as f:
+        f.write(b"0"*task["file_size"])
+    return task
+
+
+def fake_extraction(task):
+    time.sleep(0.05)
+    if task["file_size"] == 13:
+        raise ValueError("Corrupted bigWig.")
+    os.remove(task["epigenome_path"])
+
+
+def get_tasks(root, sizes):
+    return [
+        {
+            "root": root,
+            "epigenome_path": os.path.join(root, "{}.bigWig".format(i)),
+            "file_size": size
+        }
+        for i, size in enumerate(sizes)
+    ]
+
+
+def test_pipeline_respects_staging_budget(tmp_path):
+    """Test that the staged bigWigs never exceed the budget."""
+    staged_sizes.clear()
+    sizes = [300, 200, 500, 100, 400, 250, 350, 150, 1200, 50]
+    run_pipeline(get_tasks(str(tmp_path), sizes), fake_download, fake_extraction, 4, 4, 1000)
+    assert len(staged_sizes) == len(sizes)
+    # The bigWig larger than the budget is staged alone.
+    assert all(size <= 1000 or size == 1200 for size in staged_sizes)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_pipeline_raises_errors(tmp_path):
+    """Test that the errors of the extraction are raised."""
+    with pytest.raises(ValueError):
+        run_pipeline(get_tasks(str(tmp_path), [100, 13, 100]), fake_download, fake_extraction, 2, 2, 1000)
+
+
+def test_longest_processing_time_first():
+    """Test that sorting by cost reduces the simulated makespan."""
+    costs = [1, 1, 1, 1, 1, 1, 6]
+    tasks = list(range(len(costs)))
+    assert simulate_makespan(costs, 2) == 9
+    sorted_tasks, sorted_costs = sort_by_cost(tasks, costs)
+    assert sorted_tasks[0] == 6
+    assert sorted_costs == [6, 1, 1, 1, 1, 1, 1]
+    assert simulate_makespan(sorted_costs, 2) == 6
+    assert simulate_makespan([], 4) == 0
@@ -0,0 +1,55 @@
+import os
+import pickle
+import subprocess
+import sys
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+import pytest
+from epigenomic_dataset import load_epigenomes, share_epigenomes, SharedEpigenomes
+from .utils import create_dataset
+
+
+def sum_shared(shared: SharedEpigenomes) -> float:
+    assert not shared.X.flags.writeable
+    return float(np.nansum(shared.X)) + float(shared.y.sum())
+
+
+def test_share_epigenomes(tmp_path):
+    """Test that the workers read the shared data without copies."""
+    root = str(tmp_path)
+    create_dataset(root)
+    X, y = load_epigenomes(root=root, verbose=0)
+    with share_epigenomes(X, y, directory=root) as shared:
+        path = shared.path
+        # The handle sent to the workers only holds the path.
+        assert len(pickle.dumps(shared)) < 1000
+        with Pool(2) as p:
+            sums = p.map(sum_shared, [shared]*4)
+        assert sums == [float(np.nansum(X.values)) + float(y.values.sum())]*4
+        # The workers do not remove the shared data.
+        assert os.path.exists(path)
+        X_shared, y_shared = pickle.loads(pickle.dumps(shared)).to_frames()
+        pd.testing.assert_frame_equal(X, X_shared)
+        pd.testing.assert_frame_equal(y, y_shared)
+        with pytest.raises(ValueError):
+            X_shared.iloc[0, 0] = 0
+    assert not os.path.exists(path)
+
+
+def test_shared_cleanup_on_exit(tmp_path):
+    """Test that the shared data are removed when the owner process exits."""
+    root = str(tmp_path)
+    create_dataset(root)
+    path = subprocess.run(
+        [
+            sys.executable, "-c",
+            "from epigenomic_dataset import load_epigenomes, share_epigenomes\n"
+            "shared = share_epigenomes(*load_epigenomes(root={!r}, verbose=0))\n"
+            "print(shared.path)".format(root)
+        ],
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout.split()[-1]
+    assert not os.path.exists(path)
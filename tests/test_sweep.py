@@ -0,0 +1,53 @@
+import importlib
+import numpy as np
+import pandas as pd
+import pytest
+from epigenomic_dataset import load_all_tasks
+from .utils import create_dataset
+
+THRESHOLDS = [(1, 1), (3, 1), (2, 0.5)]
+
+
+def test_sweep_matches_tasks(tmp_path, monkeypatch):
+    """Test that the swept tasks match the tasks loaded for each threshold."""
+    root = str(tmp_path)
+    create_dataset(root)
+    load_tasks = importlib.import_module("epigenomic_dataset.load_tasks")
+    calls = []
+    load_epigenomes = load_tasks.load_epigenomes
+
+    def counted_load_epigenomes(**kwargs):
+        calls.append(kwargs["region"])
+        return load_epigenomes(**kwargs)
+
+    monkeypatch.setattr(load_tasks, "load_epigenomes", counted_load_epigenomes)
+    sweeps = {
+        name: sweep
+        for sweep, name in load_all_tasks(root=root, verbose=0, sweep=True)
+    }
+    assert sorted(calls) == ["enhancers", "promoters"]
+    monkeypatch.setattr(load_tasks, "load_epigenomes", load_epigenomes)
+    for name, sweep in sweeps.items():
+        task = getattr(load_tasks, name)
+        for binarize in (False, True):
+            for min_active_tpm_value, max_inactive_tpm_value in THRESHOLDS:
+                kwargs = dict(
+                    min_active_tpm_value=min_active_tpm_value,
+                    max_inactive_tpm_value=max_inactive_tpm_value
+                )
+                if name == "active_enhancers_vs_active_promoters" and min_active_tpm_value != max_inactive_tpm_value:
+                    with pytest.raises(ValueError):
+                        sweep.mask(**kwargs)
+                    continue
+                X, y = task(root=root, verbose=0, binarize=binarize, **kwargs)
+                mask = sweep.mask(**kwargs)
+                assert mask.dtype == bool and len(mask) == len(sweep.X)
+                np.testing.assert_array_equal(sweep.indices(**kwargs), np.flatnonzero(mask))
+                pd.testing.assert_frame_equal(X, sweep.X[mask])
+                np.testing.assert_array_equal(
+                    y.to_numpy().flatten().astype(float),
+                    sweep.labels(binarize=binarize, **kwargs).astype(float)
+                )
+                X_sweep, y_sweep = sweep.materialize(binarize=binarize, **kwargs)
+                pd.testing.assert_frame_equal(X, X_sweep)
+                pd.testing.assert_index_equal(y.index, y_sweep.index)
@@ -0,0 +1,37 @@
+import importlib
+import pandas as pd
+from epigenomic_dataset import load_all_tasks
+from .utils import create_dataset
+
+
+def test_load_all_tasks_loads_regions_once(tmp_path, monkeypatch):
+    """Test that the tasks share the loaded regions and match the single tasks."""
+    root = str(tmp_path)
+    create_dataset(root)
+    load_tasks = importlib.import_module("epigenomic_dataset.load_tasks")
+    expected = {
+        name: getattr(load_tasks, name)(root=root, verbose=0)
+        for name in (
+            "active_enhancers_vs_inactive_enhancers",
+            "active_promoters_vs_inactive_promoters",
+            "active_enhancers_vs_active_promoters",
+            "inactive_enhancers_vs_inactive_promoters",
+        )
+    }
+    calls = []
+    load_epigenomes = load_tasks.load_epigenomes
+
+    def counted_load_epigenomes(**kwargs):
+        calls.append(kwargs["region"])
+        return load_epigenomes(**kwargs)
+
+    monkeypatch.setattr(load_tasks, "load_epigenomes", counted_load_epigenomes)
+    tasks = dict(
+        (name, task)
+        for task, name in load_all_tasks(root=root, verbose=0)
+    )
+    assert sorted(calls) == ["enhancers", "promoters"]
+    assert tasks.keys() == expected.keys()
+    for name, (X, y) in tasks.items():
+        pd.testing.assert_frame_equal(X, expected[name][0])
+        pd.testing.assert_frame_equal(y, expected[name][1])
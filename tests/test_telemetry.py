@@ -0,0 +1,59 @@
+import json
+import os
+from typing import Dict
+import pandas as pd
+from epigenomic_dataset import telemetry
+from epigenomic_dataset.scheduler import run_pipeline
+from epigenomic_dataset.telemetry import measure_stage, measured_call, write_report
+from .test_scheduler import fake_download, get_tasks
+
+
+def write_regions(path: str) -> Dict:
+    with open(path, "w") as f:
+        f.write("0"*1000)
+    return {"regions": 10}
+
+
+def fake_extraction(task):
+    os.remove(task["epigenome_path"])
+    return {"regions": task["file_size"]}
+
+
+def test_stage_report(tmp_path):
+    """Test that the stages add up the measurements of their tasks."""
+    report = []
+    with measure_stage(report, "writing", targets=str(tmp_path)) as stage:
+        for i in range(3):
+            stage["tasks"].append(measured_call((write_regions, str(tmp_path / "{}.txt".format(i)))))
+    os.makedirs(str(tmp_path / "bigwigs"))
+    with measure_stage(report, "pipeline") as stage:
+        run_pipeline(
+            get_tasks(str(tmp_path / "bigwigs"), [100, 200]),
+            fake_download, fake_extraction, 2, 2,
+            telemetry=stage["tasks"]
+        )
+    writing, pipeline = report
+    assert writing["regions"] == 30
+    assert writing["written_bytes"] >= 3000
+    assert writing["peak_rss"] > 0
+    assert writing["regions_per_second"] > 0
+    assert pipeline["regions"] == 300
+    assert sorted(task["task"] for task in pipeline["tasks"]) == ["0.bigWig", "1.bigWig"]
+    path = write_report(report, str(tmp_path), "telemetry")
+    with open(path, "r") as f:
+        assert json.load(f) == json.loads(json.dumps(report))
+    csv = pd.read_csv(str(tmp_path / "telemetry.csv"))
+    assert list(csv.stage) == ["writing"]*4 + ["pipeline"]*3
+    assert csv.regions.tolist()[:4] == [30, 10, 10, 10]
+
+
+def test_stage_report_without_resource(tmp_path, monkeypatch):
+    """Test that the stages are measured on the systems without the resource module."""
+    monkeypatch.setattr(telemetry, "resource", None)
+    report = []
+    with measure_stage(report, "writing") as stage:
+        stage["tasks"].append(measured_call((write_regions, str(tmp_path / "0.txt"))))
+    assert report[0]["cpu_time"] >= 0
+    assert report[0]["regions"] == 10
+    # Without psutil on Windows, the peak memory is unknown.
+    assert report[0]["peak_rss"] is None or report[0]["peak_rss"] > 0
@@ -0,0 +1,63 @@
+"""Utilities to create small synthetic datasets for the offline tests."""
+import os
+from typing import List
+import numpy as np
+import pandas as pd
+
+TARGETS = ["CTCF", "H3K4me3", "H3K27ac", "DNase-seq"]
+METRICS = ["max", "mean", "median"]
+
+
+def create_regions(regions_number: int, window_size: int, seed: int = 42) -> pd.DataFrame:
+    random_state = np.random.RandomState(seed)
+    regions = pd.DataFrame({
+        "chrom": random_state.choice(["chr1", "chr2", "chrX"], regions_number),
+        "chromStart": random_state.randint(0, 10**6, regions_number)*10,
+        "strand": random_state.choice(["+", "-"], regions_number),
+    })
+    regions["chromEnd"] = regions.chromStart + window_size
+    regions = regions.drop_duplicates(["chrom", "chromStart", "strand"])
+    return regions[["chrom", "chromStart", "chromEnd", "strand"]]
+
+
+def create_cell_line_matrix(regions: pd.DataFrame, seed: int) -> pd.DataFrame:
+    random_state = np.random.RandomState(seed)
+    values = random_state.exponential(2, (len(regions), len(TARGETS)*len(METRICS)))
+    values[random_state.uniform(size=values.shape) < 0.05] = np.nan
+    return pd.DataFrame(
+        values,
+        index=pd.MultiIndex.from_frame(regions),
+        columns=pd.MultiIndex.from_product([TARGETS, METRICS])
+    ).round(2)
+
+
+def create_dataset(
+    root: str,
+    cell_lines: List[str] = ("K562", "HepG2"),
+    dataset: str = "fantom",
+    assembly: str = "hg38",
+    window_size: int = 256,
+    regions_number: int = 300
+):
+    """Write data and labels in the layout used by load_epigenomes."""
+    for seed, region in enumerate(("promoters", "enhancers")):
+        regions = create_regions(regions_number, window_size, seed)
+        directory = os.path.join(root, dataset, assembly, str(window_size))
+        os.makedirs(os.path.join(directory, region), exist_ok=True)
+        random_state = np.random.RandomState(seed)
+        labels = regions.copy()
+        for cell_line in cell_lines:
+            tpm = random_state.exponential(2, len(regions))
+            tpm[random_state.uniform(size=len(regions)) < 0.3] = 0
+            labels[cell_line.replace("-", "").upper()] = tpm
+        # The labels are shuffled to test the alignment with the data.
+        labels.sample(frac=1, random_state=seed).to_csv(
+            os.path.join(directory, "{}.bed.xz".format(region)),
+            sep="\t",
+            index=False
+        )
+        for i, cell_line in enumerate(cell_lines):
+            create_cell_line_matrix(regions, seed*100 + i).reset_index().to_csv(
+                os.path.join(directory, region, "{}.csv.xz".format(cell_line)),
+                index=False
+            )